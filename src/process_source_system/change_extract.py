@@ -0,0 +1,273 @@
+'''
+    Extraction of changed rows using SQL Server Change Tracking or Change Data
+    Capture (CDC), instead of a range scan on a last modified column.
+
+    Every extracted row is prefixed with two columns:
+        __operation: I (insert), U (update) or D (delete)
+        __version  : Change Tracking version, or CDC start LSN (hex), of the change
+    Deleted rows only carry their primary key (Change Tracking) or their last image (CDC).
+
+    The watermark of a table is the Change Tracking version / CDC LSN up to which
+    the changes have been extracted. The upper bound is read once per run for the
+    whole database, so that all tables are extracted up to the same point.
+
+    The first extract of a table (no watermark) is a snapshot of the whole table
+    with every row marked as insert (Change Tracking), or all the changes still
+    retained by CDC.
+
+    Change Tracking and CDC functions are database scoped, thus every statement is
+    run through db_name.sys.sp_executesql in the context of the source database.
+    Rows are streamed with the in-process extraction engine.
+'''
+
+from src.process_source_system import native_extract
+
+
+CHANGE_TRACKING = 'change_tracking'
+CDC = 'cdc'
+CHANGE_SOURCES = (CHANGE_TRACKING, CDC)
+
+# used as lte_column of the watermark store
+WATERMARK_COLUMNS = {CHANGE_TRACKING: '__change_tracking_version', CDC: '__cdc_lsn'}
+
+OPERATION_COLUMN = '__operation'
+VERSION_COLUMN = '__version'
+
+
+class ChangeRetentionError(Exception):
+    '''
+        Raised when the changes since the watermark have already been cleaned up
+        by the retention of Change Tracking / CDC. A full extract of the table is
+        required and the watermark has to be reset.
+    '''
+
+
+def in_db_statement(db_name, param_declaration=''):
+    '''
+        Returns the EXEC statement running a statement in the context of :db_name.
+        Its parameters are the statement, :param_declaration and then one value
+        for every declared parameter.
+
+        Ex: in_db_statement('jade', '@a int, @b int')
+            -> 'EXEC jade.sys.sp_executesql @stmt = ?, @params = ?, @a = ?, @b = ?;'
+    '''
+    names = [p.split()[0] for p in param_declaration.split(',') if p.strip()]
+
+    return f'EXEC {db_name}.sys.sp_executesql @stmt = ?, @params = ?' + ''.join(f', {name} = ?' for name in names) + ';'
+
+
+def _execute_in_db(connection, db_name, statement, param_declaration='', params=()):
+    '''
+        Executes :statement in the context of :db_name and returns the cursor.
+    '''
+    return connection.cursor().execute(in_db_statement(db_name, param_declaration)
+                                       , statement, param_declaration, *params)
+
+
+def get_current_version(connection, db_name, change_source=CHANGE_TRACKING):
+    '''
+        Returns the upper bound for this run; the current Change Tracking version
+        (int) or the maximum CDC LSN (hex string) of the database.
+    '''
+    if change_source == CHANGE_TRACKING:
+        return _execute_in_db(connection, db_name, 'SELECT CHANGE_TRACKING_CURRENT_VERSION();').fetchone()[0]
+    if change_source == CDC:
+        return _execute_in_db(connection, db_name
+                    , 'SELECT CONVERT(varchar(22), sys.fn_cdc_get_max_lsn(), 1);').fetchone()[0]
+
+    raise ValueError(f'Change source not supported: {change_source}')
+
+
+def get_table_columns(connection, db_name, tbl_name, schema_name='dbo'):
+    '''
+        Returns the columns of the table in ordinal order as a list of
+        (column_name, is_primary_key).
+    '''
+    columns_query =\
+        f'''
+        SELECT c.COLUMN_NAME
+            , CASE WHEN k.COLUMN_NAME IS NULL THEN 0 ELSE 1 END
+        FROM {db_name}.INFORMATION_SCHEMA.COLUMNS AS c
+            LEFT JOIN {db_name}.INFORMATION_SCHEMA.TABLE_CONSTRAINTS AS tc
+                ON tc.TABLE_SCHEMA = c.TABLE_SCHEMA AND tc.TABLE_NAME = c.TABLE_NAME
+                AND tc.CONSTRAINT_TYPE = 'PRIMARY KEY'
+            LEFT JOIN {db_name}.INFORMATION_SCHEMA.KEY_COLUMN_USAGE AS k
+                ON k.CONSTRAINT_NAME = tc.CONSTRAINT_NAME AND k.TABLE_SCHEMA = c.TABLE_SCHEMA
+                AND k.TABLE_NAME = c.TABLE_NAME AND k.COLUMN_NAME = c.COLUMN_NAME
+        WHERE c.TABLE_SCHEMA = ? AND c.TABLE_NAME = ?
+        ORDER BY c.ORDINAL_POSITION
+        ;
+    '''
+    return [(x[0], bool(x[1])) for x in
+            connection.cursor()
+            .execute(columns_query, schema_name, tbl_name)
+            .fetchall()
+            ]
+
+
+def get_captured_columns(connection, db_name, capture_instance):
+    '''
+        Returns the names of the columns captured by the CDC capture instance, in
+        column order; the only columns fn_cdc_get_all_changes_<capture_instance>
+        returns. Columns added to the table after CDC was enabled, or left out of
+        @captured_column_list, are not captured.
+    '''
+    captured_columns_query =\
+        f'''
+        SELECT cc.column_name
+        FROM {db_name}.cdc.captured_columns AS cc
+            JOIN {db_name}.cdc.change_tables AS ct ON ct.object_id = cc.object_id
+        WHERE ct.capture_instance = ?
+        ORDER BY cc.column_ordinal
+        ;
+    '''
+    return [x[0] for x in
+            connection.cursor()
+            .execute(captured_columns_query, capture_instance)
+            .fetchall()
+            ]
+
+
+def build_change_tracking_query(tbl_name, columns, schema_name='dbo'):
+    '''
+        Returns the statement selecting the changes in (@last_version, @current_version].
+        Primary key columns are taken from CHANGETABLE, so that deleted rows keep their key.
+    '''
+    primary_key = [name for name, is_pk in columns if is_pk]
+    if not primary_key:
+        raise ValueError(f'Change Tracking requires a primary key on {schema_name}.{tbl_name}')
+
+    select_list = ', '.join(f'ct.[{name}]' if is_pk else f't.[{name}]' for name, is_pk in columns)
+    join_condition = ' AND '.join(f't.[{name}] = ct.[{name}]' for name in primary_key)
+
+    return (f'SELECT ct.SYS_CHANGE_OPERATION AS [{OPERATION_COLUMN}], ct.SYS_CHANGE_VERSION AS [{VERSION_COLUMN}]'
+            f', {select_list}'
+            f' FROM CHANGETABLE(CHANGES [{schema_name}].[{tbl_name}], @last_version) AS ct'
+            f' LEFT JOIN [{schema_name}].[{tbl_name}] AS t ON {join_condition}'
+            f' WHERE ct.SYS_CHANGE_VERSION <= @current_version;')
+
+
+def build_snapshot_query(tbl_name, columns, schema_name='dbo'):
+    '''
+        Returns the statement selecting the whole table as inserts at @current_version.
+    '''
+    select_list = ', '.join(f'[{name}]' for name, _ in columns)
+
+    return (f"SELECT 'I' AS [{OPERATION_COLUMN}], @current_version AS [{VERSION_COLUMN}], {select_list}"
+            f' FROM [{schema_name}].[{tbl_name}];')
+
+
+def build_cdc_query(capture_instance, columns, no_changes=False):
+    '''
+        Returns the statement selecting the changes in [@from_lsn, @to_lsn]. Updates
+        are returned as their after image only.
+
+        no_changes: select no rows, but the same columns, from the change table.
+                    The cdc functions raise an error on an empty LSN range.
+    '''
+    select_list = ', '.join(f'[{name}]' for name, _ in columns)
+
+    if no_changes:
+        source = f'(SELECT TOP 0 * FROM cdc.[{capture_instance}_CT]) AS ct'
+    else:
+        source = f"cdc.fn_cdc_get_all_changes_{capture_instance}(@from_lsn, @to_lsn, N'all')"
+
+    return (f"SELECT CASE [__$operation] WHEN 1 THEN 'D' WHEN 2 THEN 'I' ELSE 'U' END AS [{OPERATION_COLUMN}]"
+            f', CONVERT(varchar(22), [__$start_lsn], 1) AS [{VERSION_COLUMN}], {select_list}'
+            f' FROM {source};')
+
+
+def extract_change_tracking(connection, db_name, tbl_name, last_version, current_version
+                            , outputfile_path, schema_name='dbo', fetch_size=None
+                            , compression=None, compression_level=None, output_format='csv'
+                            , output_stream_factory=None):
+    '''
+        Dumps the Change Tracking changes of the table in (last_version, current_version]
+        into outputfile_path/tbl_name.csv (.gz / .zst when compressed) or tbl_name.parquet.
+        Without :last_version the whole table is dumped.
+
+        Returns
+        ----------------
+        native_extract.NativeExtractResult
+    '''
+    columns = get_table_columns(connection, db_name, tbl_name, schema_name)
+    full_outputFileName = native_extract.get_output_file_name(outputfile_path, tbl_name, output_format, compression)
+
+    if last_version is None:
+        statement = build_snapshot_query(tbl_name, columns, schema_name)
+        declaration, params = '@current_version bigint', [current_version]
+    else:
+        min_valid_version = _execute_in_db(connection, db_name
+                                , 'SELECT CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID(@table_name));'
+                                , '@table_name nvarchar(512)', [f'{schema_name}.{tbl_name}']).fetchone()[0]
+
+        if min_valid_version is None:
+            raise ValueError(f'Change Tracking is not enabled on {db_name}.{schema_name}.{tbl_name}')
+        if int(last_version) < min_valid_version:
+            raise ChangeRetentionError(f'Changes of {db_name}.{schema_name}.{tbl_name} since version '
+                                       f'{last_version} are no longer retained; full extract required')
+
+        statement = build_change_tracking_query(tbl_name, columns, schema_name)
+        declaration, params = '@last_version bigint, @current_version bigint', [int(last_version), current_version]
+
+    row_count = native_extract.extract_query(connection, in_db_statement(db_name, declaration)
+                    , [statement, declaration, *params], full_outputFileName, fetch_size
+                    , output_format, compression, compression_level
+                    , output_stream_factory=output_stream_factory)
+
+    return native_extract.NativeExtractResult(args=full_outputFileName, returncode=0, row_count=row_count)
+
+
+def extract_cdc(connection, db_name, tbl_name, last_lsn, current_lsn, outputfile_path
+                , schema_name='dbo', capture_instance=None, fetch_size=None
+                , compression=None, compression_level=None, output_format='csv', output_stream_factory=None):
+    '''
+        Dumps the CDC changes of the table after last_lsn up to and including
+        current_lsn into outputfile_path/tbl_name.csv. Without :last_lsn all the
+        retained changes are dumped.
+
+        capture_instance: defaults to schema_name_tbl_name, the CDC default. Only
+                          the columns it captures are dumped (see get_captured_columns).
+
+        Returns
+        ----------------
+        native_extract.NativeExtractResult
+    '''
+    capture_instance = capture_instance or f'{schema_name}_{tbl_name}'
+    full_outputFileName = native_extract.get_output_file_name(outputfile_path, tbl_name, output_format, compression)
+
+    min_lsn = _execute_in_db(connection, db_name
+                    , 'SELECT CONVERT(varchar(22), sys.fn_cdc_get_min_lsn(@capture_instance), 1);'
+                    , '@capture_instance sysname', [capture_instance]).fetchone()[0]
+
+    if min_lsn is None or min_lsn == '0x00000000000000000000':
+        raise ValueError(f'CDC capture instance {capture_instance} does not exist in {db_name}')
+
+    # the change function fails on any column it does not capture
+    captured_columns = get_captured_columns(connection, db_name, capture_instance)
+    columns = [(name, is_pk) for name, is_pk in get_table_columns(connection, db_name, tbl_name, schema_name)
+               if name in captured_columns]
+
+    # LSNs are fixed length hex strings; they order the same way as the binary values
+    if last_lsn is None:
+        from_lsn_expression = 'CONVERT(binary(10), @min_lsn, 1)'
+    elif last_lsn.lower() < min_lsn.lower():
+        raise ChangeRetentionError(f'Changes of {db_name}.{schema_name}.{tbl_name} since LSN '
+                                   f'{last_lsn} are no longer retained; full extract required')
+    else:
+        from_lsn_expression = 'sys.fn_cdc_increment_lsn(CONVERT(binary(10), @last_lsn, 1))'
+
+    # nothing changed since the last extract
+    no_changes = last_lsn is not None and last_lsn.lower() >= current_lsn.lower()
+
+    statement = (f'DECLARE @from_lsn binary(10) = {from_lsn_expression}'
+                 f', @to_lsn binary(10) = CONVERT(binary(10), @current_lsn, 1); '
+                 + build_cdc_query(capture_instance, columns, no_changes))
+
+    declaration = '@min_lsn varchar(22), @last_lsn varchar(22), @current_lsn varchar(22)'
+    row_count = native_extract.extract_query(connection, in_db_statement(db_name, declaration)
+                    , [statement, declaration, min_lsn, last_lsn, current_lsn], full_outputFileName, fetch_size
+                    , output_format, compression, compression_level
+                    , output_stream_factory=output_stream_factory)
+
+    return native_extract.NativeExtractResult(args=full_outputFileName, returncode=0, row_count=row_count)
@@ -0,0 +1,181 @@
+'''
+    A small thread-safe pool of database connections.
+
+    Opening an authenticated connection to SQL Server takes tens to hundreds of
+    milliseconds. Metadata queries and the in-process extraction engine borrow
+    connections from the pool and hand them back when done, so that a
+    connection is opened once and reused by many tables and threads.
+
+    - max_size      : at most this many connections exist at the same time;
+                      acquire() blocks until one is handed back.
+    - idle_timeout  : connections not used for this long are closed.
+    - health check  : a connection idle for longer than health_check_after is
+                      tested with a trivial query before being handed out, and
+                      replaced if broken.
+'''
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_IDLE_TIMEOUT = 300  # seconds
+DEFAULT_HEALTH_CHECK_AFTER = 30  # seconds
+HEALTH_CHECK_QUERY = 'SELECT 1;'
+
+
+class PoolTimeoutError(Exception):
+    '''
+        Raised when no connection became available within the acquire timeout.
+    '''
+
+
+class ConnectionPool:
+    '''
+        Thread-safe pool of connections created by :connect.
+
+        Usage:
+            pool = ConnectionPool(get_connection)
+            with pool.connection() as connection:
+                connection.cursor().execute(...)
+    '''
+
+    def __init__(self, connect, max_size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT
+                 , health_check_after=DEFAULT_HEALTH_CHECK_AFTER):
+        if max_size < 1:
+            raise ValueError(f'max_size should be a positive integer, got: {max_size}')
+
+        self.connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+
+        self._condition = threading.Condition()
+        # (connection, time it was handed back); most recently used at the end
+        self._idle = []
+        # number of connections in use plus idle
+        self._size = 0
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:  # already closed or broken
+            ''
+
+    @staticmethod
+    def is_healthy(connection):
+        try:
+            connection.cursor().execute(HEALTH_CHECK_QUERY).fetchone()
+            return True
+        except Exception:
+            return False
+
+    def _reap_idle(self, now):
+        '''
+            Closes connections idle for longer than idle_timeout. Caller holds the lock.
+        '''
+        expired = [c for c, released_at in self._idle if now - released_at > self.idle_timeout]
+        self._idle = [(c, released_at) for c, released_at in self._idle if now - released_at <= self.idle_timeout]
+        self._size -= len(expired)
+
+        return expired
+
+    def acquire(self, timeout=None):
+        '''
+            Returns a connection from the pool, opening a new one if none is idle
+            and the pool is not full. Blocks while the pool is full.
+
+            timeout: seconds to wait for a connection; None waits forever.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                expired = self._reap_idle(now)
+
+                while not self._idle and self._size >= self.max_size:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise PoolTimeoutError(f'No connection available within {timeout} seconds')
+                    self._condition.wait(remaining)
+
+                if self._idle:
+                    connection, released_at = self._idle.pop()
+                    is_new = False
+                else:
+                    # reserve the slot; the connection is opened outside the lock
+                    self._size += 1
+                    connection, released_at, is_new = None, None, True
+
+            for c in expired:
+                self._close(c)
+
+            if is_new:
+                try:
+                    return self.connect()
+                except Exception as e:
+                    self._discard_slot()
+                    raise e
+
+            if time.monotonic() - released_at <= self.health_check_after or self.is_healthy(connection):
+                return connection
+
+            # broken connection; drop it and try again
+            self._close(connection)
+            self._discard_slot()
+
+    def _discard_slot(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def release(self, connection, discard=False):
+        '''
+            Hands a connection back to the pool. Any open transaction is rolled
+            back. If :discard is set, or the rollback fails, the connection is closed.
+        '''
+        if not discard:
+            try:
+                connection.rollback()
+            except Exception:
+                discard = True
+
+        if discard:
+            self._close(connection)
+            self._discard_slot()
+            return
+
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        '''
+            Context manager borrowing a connection. The connection is discarded
+            instead of reused if the block raises.
+        '''
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        except Exception as e:
+            self.release(connection, discard=True)
+            raise e
+        else:
+            self.release(connection)
+
+    def close_all(self):
+        '''
+            Closes all idle connections. Connections in use are closed when released
+            with discard=True, or reused otherwise.
+        '''
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+
+        for connection, _ in idle:
+            self._close(connection)
@@ -12,7 +12,6 @@
     # TODO: Add checks for db_name, table, etc.
     # TODO: Add logging.
     # TODO: Add exception handling.
-    # TODO: Add parallel processing.
     # TODO: Add support fot -S option in bcp command. Extend to any uri.
     # TODO: Add Pyodbc exception implementation
     #       https://github.com/mkleehammer/pyodbc/wiki/Exceptions
@@ -22,28 +21,87 @@
 import subprocess
 import sys
 import os
+import time
+import threading
 
 import pyodbc
 import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from src.process_source_system import SOURCE_DATA_PATH, SOURCE_SYSTEM_OUT_LOG_PATH, SOURCE_SYSTEM_ERR_LOG_PATH
 from src.utils import date_utility
-
-
-def get_connection():
+from src.utils.compression_utility import compressed_output, get_compressed_file_name
+from src.process_source_system.extract_scheduler import ExtractJob, ExtractStep, DEFAULT_MAX_WORKERS
+from src.process_source_system.extract_scheduler import run_extract_jobs, print_extract_report, order_jobs_by_size
+from src.process_source_system.extract_scheduler import TableExtractResult, STATUS_SKIPPED
+from src.process_source_system.extract_scheduler import STATUS_DONE, STATUS_FAILED
+from src.process_source_system.extract_journal import ExtractJournal
+from src.process_source_system.table_artifacts import ArtifactManifest
+from src.process_source_system import table_partitioning
+from src.process_source_system.table_partitioning import DEFAULT_NUM_PARTITIONS
+from src.process_source_system import native_extract
+from src.process_source_system.connection_pool import ConnectionPool, DEFAULT_POOL_SIZE
+from src.process_source_system.watermark_store import WatermarkStore
+from src.process_source_system import change_extract
+from src.process_source_system import schema_capture
+from src.process_source_system.schema_cache import SchemaCache, get_fingerprint
+
+
+# (db_name, schemas) -> {(schema_name, tbl_name): (row_count, reserved_pages)}
+# table sizes are only needed for ordering, thus queried once per process
+_TABLE_SIZE_CACHE = {}
+
+# time zone of the :lte_column of incremental extracts -> current time of the source server
+SOURCE_TIME_FUNCTIONS = {'local': 'SYSDATETIME()', 'utc': 'SYSUTCDATETIME()'}
+
+# (userName, password) -> ConnectionPool
+_CONNECTION_POOLS = {}
+_CONNECTION_POOLS_LOCK = threading.Lock()
+
+
+def get_connection(userName=None, password=None):
     '''
         Returns a connection to the database.
+
+        If both userName and password are provided SQL Server authentication is 
+        used, otherwise trusted connection.
     '''
     conn_str = '''
                Driver={ODBC Driver 17 for SQL Server};
                Server=localhost;
                Database=zerodha_NFO;
-               Trusted_Connection=yes;
              '''
+    if (userName is None) or (password is None):
+        conn_str += 'Trusted_Connection=yes;'
+    else:
+        conn_str += f'UID={userName};PWD={password};'
+
     connection = pyodbc.connect(conn_str)
     return connection
 
 
+def get_connection_pool(userName=None, password=None, max_size=DEFAULT_POOL_SIZE):
+    '''
+        Returns the connection pool for the provided credentials, creating it on
+        first use. Connections are created by get_connection().
+
+        If the pool already exists with a smaller max_size, it is grown to :max_size.
+
+        Usage:
+            with get_connection_pool().connection() as connection:
+                ...
+    '''
+    with _CONNECTION_POOLS_LOCK:
+        pool = _CONNECTION_POOLS.get((userName, password))
+        if pool is None:
+            pool = ConnectionPool(lambda: get_connection(userName, password), max_size=max_size)
+            _CONNECTION_POOLS[(userName, password)] = pool
+        elif pool.max_size < max_size:
+            pool.max_size = max_size
+
+    return pool
+
+
 def create_directory_if_not_exists(path):
     '''
         Creates the directory if it does not exist.
@@ -53,16 +111,81 @@ def create_directory_if_not_exists(path):
         # exist_ok makes sure no OSError is Raised in case the directory already exist
         os.makedirs(path, exist_ok=True) 
 
+
+def get_log_directories(log_file_path=None, error_file_path=None):
+    '''
+        Returns the (output log, error log) directories of the bcp invocations;
+        SOURCE_SYSTEM_OUT_LOG_PATH/yyyymmdd and SOURCE_SYSTEM_ERR_LOG_PATH/yyyymmdd
+        unless provided.
+    '''
+    return (log_file_path or os.path.join(SOURCE_SYSTEM_OUT_LOG_PATH, date_utility.get_current_date())
+            , error_file_path or os.path.join(SOURCE_SYSTEM_ERR_LOG_PATH, date_utility.get_current_date()))
+
+
+def get_log_file_names(tbl_name, log_file_path=None, error_file_path=None):
+    '''
+        Returns the (output log, error log) file names for a bcp invocation.
+
+        Each table gets its own pair of files, so that concurrently running bcp
+        processes never write to the same log file. The directories are created
+        if they do not exist.
+
+        Parameters
+        ----------------
+        tbl_name       : Name of the table, used as prefix of the log file names.
+        log_file_path  : Directory of the output log. Defaults to 
+                         SOURCE_SYSTEM_OUT_LOG_PATH/yyyymmdd
+        error_file_path: Directory of the error log. Defaults to 
+                         SOURCE_SYSTEM_ERR_LOG_PATH/yyyymmdd
+    '''
+    log_file_path, error_file_path = get_log_directories(log_file_path, error_file_path)
+
+    create_directory_if_not_exists(log_file_path)
+    create_directory_if_not_exists(error_file_path)
+
+    return (os.path.join(log_file_path, f'{tbl_name}_output.log')
+            , os.path.join(error_file_path, f'{tbl_name}_error.log'))
+
+def get_bcp_command(source, direction, data_file_name, log_file_name, error_file_name
+                    , userName=None, password=None, options=()):
+    '''
+        Returns the bcp command as a list of arguments, to be run without a shell:
+        the same on POSIX and Windows, and the query of a queryout needs no quoting.
+
+        Parameters
+        ----------------
+        source        : Fully qualified name of the table, or the query of a queryout.
+        direction     : 'out', 'queryout' or 'format'.
+        data_file_name: File (or named pipe) bcp writes to; 'null' for a format.
+        options       : Additional arguments, ex: ['-x', '-f', format_file_name]
+        userName      : Username of the user. If not provided, -T (trusted connection)
+                        is used.
+        password      : Password of the user.
+    '''
+    command = ['bcp', source, direction, data_file_name, '-c', '-t,', *options
+               , '-o', log_file_name, '-e', error_file_name]
+
+    if (userName is None) or (password is None):
+        return command + ['-T']
+
+    return command + ['-U', userName, '-P', password]
+
+
         
 def get_tables(db_name, connection, schemas=['dbo']):
     '''
-        Fetches names of all tables in the provided database.
+        Fetches the tables of the provided schemas in the provided database.
 
         The provided Database, Schema and Connection should alreday exist.
+        The connection is not closed; it is owned by the caller.
 
         Parameters
         ----------------
         db_name: Fully qualified Name of the intended databse
+
+        Returns
+        ----------------
+        list of (schema_name, tbl_name); a table name may be found in several schemas.
     '''
 
     # This query will return all the tables in the database.schema
@@ -70,15 +193,16 @@ def get_tables(db_name, connection, schemas=['dbo']):
     # as many ? as many parameters (schemas) are required to be queried in the DB.
     table_name_query =\
         f'''
-        SELECT DISTINCT(TABLE_NAME) FROM {db_name}.INFORMATION_SCHEMA.TABLES
+        SELECT TABLE_SCHEMA, TABLE_NAME FROM {db_name}.INFORMATION_SCHEMA.TABLES
         WHERE TABLE_TYPE = 'Base Table'
 	        AND TABLE_SCHEMA IN ({",".join("?" * len(schemas))})
+        ORDER BY TABLE_SCHEMA, TABLE_NAME
         ;
     '''
 
     try:
         # connection.cursor returns list of tuples
-        return [x[0] for x in
+        return [(x[0], x[1]) for x in
                 connection.cursor()
                 .execute(table_name_query, schemas)
                 .fetchall()
@@ -86,8 +210,94 @@ def get_tables(db_name, connection, schemas=['dbo']):
 
     except Exception as e:
         print(e)  # TODO: Logging
-    finally:
-        connection.close()
+
+
+def get_extract_tables(db_name, pool, schemas=['dbo'], table_names=None):
+    '''
+        Returns the (schema_name, tbl_name) of the tables to be extracted: all the
+        tables of :schemas, or only the :table_names. With several schemas only the
+        schemas a table actually exists in are returned.
+    '''
+    if table_names and len(schemas) == 1:
+        return [(schemas[0], tbl_name) for tbl_name in table_names]
+
+    with pool.connection() as connection:
+        tables = get_tables(db_name=db_name, connection=connection, schemas=schemas) or []
+
+    if table_names:
+        tables = [(schema_name, tbl_name) for schema_name, tbl_name in tables if tbl_name in table_names]
+
+    return tables
+
+
+def get_source_time(connection, lte_time_zone='local'):
+    '''
+        Returns the current time of the source server, as 'YYYY-MM-DD HH:MM:SS';
+        the upper bound of incremental extracts, and thus the next watermark.
+        Truncated to the second, so that rows of the current second are extracted
+        by the next run rather than skipped.
+
+        Parameters
+        ----------------
+        connection   : Connection to the database; not closed.
+        lte_time_zone: Time zone of the :lte_column values; 'local' (server local
+                       time, SYSDATETIME) or 'utc' (SYSUTCDATETIME).
+    '''
+    return connection.cursor().execute(
+        f'SELECT CONVERT(varchar(19), {SOURCE_TIME_FUNCTIONS[lte_time_zone]}, 120);').fetchone()[0]
+
+
+def get_table_sizes(db_name, connection, schemas=['dbo'], refresh=False):
+    '''
+        Fetches the estimated row count and reserved pages of every table in the
+        provided schemas from sys.dm_db_partition_stats. The result is cached per
+        database and schemas, the query is executed only once unless :refresh is set.
+
+        Row count is taken from the heap or clustered index only (index_id 0 or 1),
+        reserved pages include all indexes and LOB data of the table.
+
+        Requires VIEW DATABASE STATE permission. On any error an empty dict is
+        returned, in which case tables are extracted in their original order.
+
+        Parameters
+        ----------------
+        db_name   : Name of the database.
+        connection: Connection to the database; not closed.
+        schemas   : Name of the schemas to collect sizes of.
+        refresh   : Ignore the cached sizes and query again.
+
+        Returns
+        ----------------
+        dict of (schema_name, tbl_name) -> (row_count, reserved_pages)
+    '''
+    cache_key = (db_name, tuple(schemas))
+    if not refresh and cache_key in _TABLE_SIZE_CACHE:
+        return _TABLE_SIZE_CACHE[cache_key]
+
+    table_size_query =\
+        f'''
+        SELECT s.name, t.name
+            , SUM(CASE WHEN ps.index_id IN (0, 1) THEN ps.row_count ELSE 0 END)
+            , SUM(ps.reserved_page_count)
+        FROM {db_name}.sys.dm_db_partition_stats AS ps
+            INNER JOIN {db_name}.sys.tables AS t ON t.object_id = ps.object_id
+            INNER JOIN {db_name}.sys.schemas AS s ON s.schema_id = t.schema_id
+        WHERE s.name IN ({",".join("?" * len(schemas))})
+        GROUP BY s.name, t.name
+        ;
+    '''
+
+    try:
+        _TABLE_SIZE_CACHE[cache_key] = {(x[0], x[1]): (int(x[2]), int(x[3])) for x in
+                                        connection.cursor()
+                                        .execute(table_size_query, schemas)
+                                        .fetchall()
+                                        }
+        return _TABLE_SIZE_CACHE[cache_key]
+
+    except Exception as e:
+        print(e)  # TODO: Logging
+        return {}
 
 
 def dump_table_format(db_name, tbl_name, outputfile_path, schema_name='dbo'
@@ -125,33 +335,56 @@ def dump_table_format(db_name, tbl_name, outputfile_path, schema_name='dbo'
         
         outputfile_name = os.path.join(outputfile_path, f'{tbl_name}_format.xml') # data_dir/yyyymmdd/source(db)/table_format.xml
 
-        # if not log_file_path:
-        #     log_file_path = os.path.join(SOURCE_SYSTEM_OUT_LOG_PATH, date_utility.get_current_date())
-        log_file_name = os.path.join(log_file_path or 
-                            os.path.join(SOURCE_SYSTEM_OUT_LOG_PATH, date_utility.get_current_date())
-                            , 'output.log')
-        # if not error_file_path:
-        #     error_file_path = os.path.join(SOURCE_SYSTEM_ERR_LOG_PATH, date_utility.get_current_date())
-        error_file_name = os.path.join(error_file_path or
-                            os.path.join(SOURCE_SYSTEM_ERR_LOG_PATH, date_utility.get_current_date())
-                            , 'error.log')
-
-        fmt_stmt = f'bcp {full_TableName} format null -c -x -f {outputfile_name} -t"," -o {log_file_name} -e {error_file_name}'
-        
-        if (userName is None) or (password is None):
-            format_command = fmt_stmt+ " " + '-T'
-        else:
-            format_command = fmt_stmt+ " " + f'-U {userName} -P {password}'
-        
-        subprocess.run(format_command)
+        log_file_name, error_file_name = get_log_file_names(f'{tbl_name}_format', log_file_path, error_file_path)
+
+        format_command = get_bcp_command(full_TableName, 'format', 'null', log_file_name, error_file_name
+                                         , userName, password, options=['-x', '-f', outputfile_name])
+
+        return subprocess.run(format_command)
 
     except Exception as e:
         print(e)
 
 
+def dump_table_format_cached(db_name, tbl_name, outputfile_path, columns, schema_cache
+                    , schema_name='dbo', **kwargs):
+    '''
+        dump_table_format, unless the schema of the table is unchanged since its
+        format was last dumped; the previous format file is then hard-linked
+        (or copied) into :outputfile_path instead.
+
+        Parameters
+        ----------------
+        columns     : Current column definitions of the table (see schema_capture).
+                      If None the format is always dumped.
+        schema_cache: SchemaCache, updated once the format is dumped successfully.
+
+        Remaining parameters are same as dump_table_format.
+    '''
+    if columns is None:
+        return dump_table_format(db_name, tbl_name, outputfile_path, schema_name, **kwargs)
+
+    fingerprint = get_fingerprint(columns)
+    format_file_name = schema_capture.get_format_file_name(outputfile_path, tbl_name)
+
+    if schema_cache.reuse(db_name, schema_name, tbl_name, fingerprint, format_file_name):
+        return subprocess.CompletedProcess(args=format_file_name, returncode=0)
+
+    if os.path.exists(format_file_name):
+        # may be hard-linked to the format file of a previous run
+        os.remove(format_file_name)
+
+    result = dump_table_format(db_name, tbl_name, outputfile_path, schema_name, **kwargs)
+    if result is not None and result.returncode == 0:
+        schema_cache.set(db_name, schema_name, tbl_name, fingerprint, format_file_name)
+
+    return result
+
+
 def db_dump_full_extract(db_name, tbl_name, outputfile_path, schema_name='dbo'
                     , log_file_path = None, error_file_path = None
-                    , userName=None, password=None):
+                    , userName=None, password=None, compression=None, compression_level=None
+                    , output_stream_factory=None):
     '''
         This method is used to extract one table from database for each invocation.
         The data is dumped into the output file location as csv.
@@ -171,6 +404,15 @@ def db_dump_full_extract(db_name, tbl_name, outputfile_path, schema_name='dbo'
         userName       : Username of the user. This is optional. If not provided,
                          default id to use -T (trusted connection) option.
         password       : Password of the user.
+        compression    : None, 'gzip', 'zstd' or 'lz4'. If set, the data is compressed while 
+                         bcp writes it and dumped as tbl_name.csv.gz (or .zst).
+        compression_level: Codec specific compression level.
+        output_stream_factory: Called with the name of the output file; returns the
+                         context managed binary stream (ex: S3_landing.open_upload_stream)
+                         receiving the data instead of the local file. bcp writes into
+                         a named pipe where available. With :compression or a stream, a
+                         failed bcp raises CalledProcessError, so that the truncated
+                         compressed file or the stream is discarded.
 
         bcp jade.dbo.address_type out .\original-data\jade\address_type.csv -c -t"," -T
     '''
@@ -179,24 +421,20 @@ def db_dump_full_extract(db_name, tbl_name, outputfile_path, schema_name='dbo'
 
         full_outputFileName = os.path.join(outputfile_path, f'{tbl_name}.csv')
 
-        # set the output log file name
-        log_file_name = os.path.join(log_file_path or 
-                            os.path.join(SOURCE_SYSTEM_OUT_LOG_PATH, date_utility.get_current_date())
-                            , 'output.log')
-        
-        # set the error log file name
-        error_file_name = os.path.join(error_file_path or
-                            os.path.join(SOURCE_SYSTEM_ERR_LOG_PATH, date_utility.get_current_date())
-                            , 'error.log')
+        # set the output and error log file names
+        log_file_name, error_file_name = get_log_file_names(tbl_name, log_file_path, error_file_path)
 
-        stmt = f'bcp {db_name}.{schema_name}.{tbl_name} out {full_outputFileName} -c -t"," -o {log_file_name} -e {error_file_name}'
+        with compressed_output(full_outputFileName, compression, compression_level
+                               , output_stream_factory) as bcp_outputFileName:
+            statement = get_bcp_command(f'{db_name}.{schema_name}.{tbl_name}', 'out', bcp_outputFileName
+                                        , log_file_name, error_file_name, userName, password)
 
-        if (userName is None) or (password is None):
-            statement = stmt + ' ' + '-T'
-        else:
-            statement = stmt + ' ' + f'-U {userName} -P {password}'
-            
-        subprocess.run(statement)
+            completed = subprocess.run(statement)
+            if compression or output_stream_factory is not None:
+                # the truncated output is discarded
+                completed.check_returncode()
+
+            return completed
  
     except Exception as e:
         # print(e)
@@ -205,7 +443,8 @@ def db_dump_full_extract(db_name, tbl_name, outputfile_path, schema_name='dbo'
 
 def db_dump_incremental_extract(db_name, tbl_name, last_extract_time, lte_column, current_extract_time
                     , outputfile_path, log_file_path = None, error_file_path = None
-                    , schema_name='dbo', userName=None, password=None):
+                    , schema_name='dbo', userName=None, password=None
+                    , compression=None, compression_level=None, output_stream_factory=None):
     
     '''
         The provided Database, Schema and Table should alreday exist.
@@ -217,12 +456,16 @@ def db_dump_incremental_extract(db_name, tbl_name, last_extract_time, lte_column
         outputfile_path  : Path to the directory where the csv files will be dumped.
                            The directory will be created if not exist.
                            Ex:- data_dir/db_name/YYYYMMDD/ 
-        last_extract_time: Time of the last extract.
+        last_extract_time: Time of the last extract. None extracts every row up to
+                           :current_extract_time, ex: the first incremental run of a table.
         lte_column       : used to determine the last extract time.
         schema_name      : Name of the schema.
         userName         : Username of the user. This is optional. If not provided,
                            default id to use -T (trusted connection) option.
         password         : Password of the user.
+        compression      : None, 'gzip', 'zstd' or 'lz4'. See db_dump_full_extract.
+        compression_level: Codec specific compression level.
+        output_stream_factory: See db_dump_full_extract.
 
         Returns
         ----------------
@@ -235,49 +478,235 @@ def db_dump_incremental_extract(db_name, tbl_name, last_extract_time, lte_column
     '''
     try:
         
-        if not last_extract_time < current_extract_time:
+        if last_extract_time is not None and not last_extract_time < current_extract_time:
             raise ValueError(f'Last extract time {last_extract_time} is greater than current extract time {current_extract_time}')
 
         full_TableName = f'{db_name}.{schema_name}.{tbl_name}'
         
-        query = f'SELECT * FROM {full_TableName} WHERE'+\
-                f'{full_TableName}.{lte_column} > {last_extract_time} and'+\
-                f'{full_TableName}.{lte_column} <= {current_extract_time}'
+        query = f"SELECT * FROM {full_TableName} WHERE [{lte_column}] <= '{current_extract_time}'"
+        if last_extract_time is not None:
+            query += f" AND [{lte_column}] > '{last_extract_time}'"
         
         create_directory_if_not_exists(outputfile_path)
         
         full_outputFileName = os.path.join(outputfile_path, f'{tbl_name}.csv')
        
-        # set the output log file name
-        log_file_name = os.path.join(log_file_path or 
-                            os.path.join(SOURCE_SYSTEM_OUT_LOG_PATH, date_utility.get_current_date())
-                            , 'output.log')
-        
-        # set the error log file name
-        error_file_name = os.path.join(error_file_path or
-                            os.path.join(SOURCE_SYSTEM_ERR_LOG_PATH, date_utility.get_current_date())
-                            , 'error.log')
+        # set the output and error log file names
+        log_file_name, error_file_name = get_log_file_names(tbl_name, log_file_path, error_file_path)
 
         
-        stmt = f'bcp {query} queryout {full_outputFileName} -c -t"," -o {log_file_name} -e {error_file_name}'
+        with compressed_output(full_outputFileName, compression, compression_level
+                               , output_stream_factory) as bcp_outputFileName:
+            statement = get_bcp_command(query, 'queryout', bcp_outputFileName
+                                        , log_file_name, error_file_name, userName, password)
 
-        if (userName is None) or (password is None):
-            statement = stmt + ' ' + '-T'
-        else:
-            statement = stmt + ' ' + f'-U {userName} -P {password}'
-        
-        subprocess.run(statement)    
+            completed = subprocess.run(statement)
+            if compression or output_stream_factory is not None:
+                # the truncated output is discarded
+                completed.check_returncode()
+
+            return completed
     
     except Exception as e:
         print(e)
         # TODO: Per Exception implement
 
 
+def db_dump_partitioned_extract(db_name, tbl_name, outputfile_path, schema_name='dbo'
+                    , log_file_path = None, error_file_path = None
+                    , userName=None, password=None, num_partitions=DEFAULT_NUM_PARTITIONS
+                    , compression=None, compression_level=None, output_stream_factory=None):
+    '''
+        This method is used to extract one very large table as several slices
+        which are dumped concurrently, each by its own bcp queryout process.
+
+        The table is split on the leading column of its clustered index (or primary
+        key) into :num_partitions key ranges, taken from the index statistics. Each
+        slice is dumped as tbl_name.part-0000.csv, tbl_name.part-0001.csv, ...
+        and a tbl_name.manifest.json listing all the slices is written next to them.
+        Tables without a usable key are dumped as a single slice.
+
+        The provided Database, Schema and Table should alreday exist.
+
+        Parameters
+        ----------------
+        db_name        : Name of the intended databse
+        tbl_name       : Name of the table whose data is to be extracted.
+        outputfile_path: Path to the directory where the csv files will be dumped.
+                         The directory will be created if not exist.
+        schema_name    : Name of the schema. Default is 'dbo'.
+        userName       : Username of the user. This is optional. If not provided,
+                         default id to use -T (trusted connection) option.
+        password       : Password of the user.
+        num_partitions : Number of slices, as well as the number of concurrent
+                         bcp processes for this table.
+        compression    : None, 'gzip', 'zstd' or 'lz4'. Every slice is compressed while
+                         being written, ex: tbl_name.part-0000.csv.gz
+        output_stream_factory: See db_dump_full_extract; one stream per slice. The
+                         manifest is always written locally.
+
+        Returns
+        ----------------
+        subprocess.CompletedProcess with the manifest file name as args. The
+        returncode is 0 only if every slice was dumped successfully.
+
+        bcp "SELECT * FROM jade.dbo.sales_line WHERE [id] > 100 AND [id] <= 200" queryout .\sales_line.part-0001.csv -c -t"," -T
+    '''
+    create_directory_if_not_exists(outputfile_path)
+
+    with get_connection_pool(userName, password).connection() as connection:
+        key_column, data_type, ranges = table_partitioning.get_partition_ranges(db_name, tbl_name
+                                            , connection, num_partitions, schema_name)
+
+    full_TableName = f'{db_name}.{schema_name}.{tbl_name}'
+
+    def dump_slice(part_number, lower, upper):
+        predicate = table_partitioning.build_range_predicate(key_column, lower, upper, data_type)
+        query = f'SELECT * FROM {full_TableName}' + (f' WHERE {predicate}' if predicate else '')
+
+        part_file_name = table_partitioning.get_part_file_name(tbl_name, part_number)
+        full_outputFileName = os.path.join(outputfile_path, part_file_name)
+
+        # set the output and error log file names; one pair per slice
+        log_file_name, error_file_name = get_log_file_names(part_file_name, log_file_path, error_file_path)
+
+        try:
+            with compressed_output(full_outputFileName, compression, compression_level
+                                   , output_stream_factory) as bcp_outputFileName:
+                statement = get_bcp_command(query, 'queryout', bcp_outputFileName
+                                            , log_file_name, error_file_name, userName, password)
+
+                completed = subprocess.run(statement)
+                if compression or output_stream_factory is not None:
+                    completed.check_returncode()
+        except subprocess.CalledProcessError as e:
+            # the compressed file / stream of the slice has been discarded
+            completed = e
+
+        part_file_name = get_compressed_file_name(part_file_name, compression)
+        full_outputFileName = os.path.join(outputfile_path, part_file_name)
+
+        return {'file': part_file_name, 'lower': lower, 'upper': upper
+                , 'returncode': completed.returncode
+                , 'size_bytes': os.path.getsize(full_outputFileName) if os.path.exists(full_outputFileName) else None}
+
+    with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix=f'{tbl_name}-part') as executor:
+        futures = [executor.submit(dump_slice, part_number, lower, upper)
+                    for part_number, (lower, upper) in enumerate(ranges)]
+        parts = [future.result() for future in futures]
+
+    manifest_file_name = table_partitioning.write_manifest(outputfile_path, db_name, schema_name
+                            , tbl_name, key_column, parts)
+
+    return subprocess.CompletedProcess(args=manifest_file_name
+                , returncode=next((p['returncode'] for p in parts if p['returncode'] != 0), 0))
+
+
+def db_native_full_extract(db_name, tbl_name, outputfile_path, schema_name='dbo'
+                    , log_file_path = None, error_file_path = None
+                    , userName=None, password=None, fetch_size=None
+                    , compression=None, compression_level=None, output_format='csv'
+                    , row_group_size=native_extract.DEFAULT_ROW_GROUP_SIZE, output_stream_factory=None):
+    '''
+        In-process alternative of db_dump_full_extract; does not need the bcp utility.
+        Rows are streamed through a pyodbc cursor (see native_extract module).
+
+        Parameters are same as db_dump_full_extract. log_file_path and error_file_path
+        are accepted for compatibility only.
+
+        fetch_size    : Rows per fetchmany batch. Derived from the row width if not provided.
+        output_format : Either 'csv' or 'parquet'.
+        row_group_size: Rows per parquet row group.
+        output_stream_factory: See db_dump_full_extract.
+    '''
+    create_directory_if_not_exists(outputfile_path)
+
+    with get_connection_pool(userName, password).connection() as connection:
+        return native_extract.native_full_extract(connection, db_name, tbl_name, outputfile_path
+                    , schema_name, fetch_size, output_format, compression, compression_level, row_group_size
+                    , output_stream_factory)
+
+
+def db_native_incremental_extract(db_name, tbl_name, last_extract_time, lte_column, current_extract_time
+                    , outputfile_path, log_file_path = None, error_file_path = None
+                    , schema_name='dbo', userName=None, password=None, fetch_size=None
+                    , compression=None, compression_level=None, output_format='csv'
+                    , row_group_size=native_extract.DEFAULT_ROW_GROUP_SIZE, output_stream_factory=None):
+    '''
+        In-process alternative of db_dump_incremental_extract; does not need the bcp
+        utility. The extract time bounds are passed as query parameters.
+
+        Parameters are same as db_dump_incremental_extract. log_file_path and 
+        error_file_path are accepted for compatibility only. :output_format,
+        :row_group_size and :output_stream_factory are same as db_native_full_extract.
+    '''
+    create_directory_if_not_exists(outputfile_path)
+
+    with get_connection_pool(userName, password).connection() as connection:
+        return native_extract.native_incremental_extract(connection, db_name, tbl_name
+                    , last_extract_time, lte_column, current_extract_time, outputfile_path
+                    , schema_name, fetch_size, output_format, compression, compression_level, row_group_size
+                    , output_stream_factory)
+
+
+def db_changes_extract(db_name, tbl_name, outputfile_path, last_version, current_version
+                    , schema_name='dbo', log_file_path = None, error_file_path = None
+                    , userName=None, password=None, change_source=change_extract.CHANGE_TRACKING
+                    , fetch_size=None, compression=None, compression_level=None, output_format='csv'
+                    , output_stream_factory=None):
+    '''
+        Dumps the rows changed in (last_version, current_version] as recorded by
+        SQL Server Change Tracking or CDC, with an operation column (I/U/D).
+        See change_extract module. Always uses the in-process extraction engine.
+
+        Parameters
+        ----------------
+        last_version   : Change Tracking version or CDC LSN (hex) of the last extract.
+                         None for the first extract of the table.
+        current_version: Change Tracking version or CDC LSN (hex) up to which the
+                         changes are extracted.
+        change_source  : Either 'change_tracking' or 'cdc'.
+
+        Remaining parameters are same as db_native_full_extract.
+    '''
+    create_directory_if_not_exists(outputfile_path)
+
+    with get_connection_pool(userName, password).connection() as connection:
+        if change_source == change_extract.CDC:
+            return change_extract.extract_cdc(connection, db_name, tbl_name, last_version
+                        , current_version, outputfile_path, schema_name, fetch_size=fetch_size
+                        , compression=compression, compression_level=compression_level
+                        , output_format=output_format, output_stream_factory=output_stream_factory)
+
+        return change_extract.extract_change_tracking(connection, db_name, tbl_name, last_version
+                    , current_version, outputfile_path, schema_name, fetch_size
+                    , compression=compression, compression_level=compression_level
+                    , output_format=output_format, output_stream_factory=output_stream_factory)
+
+
+def advance_watermark(watermark_store, db_name, schema_name, tbl_name, lte_column, watermark):
+    '''
+        Extract step recording :watermark as the lower bound of the next incremental
+        extract of the table. Scheduled after the data step, thus only runs once
+        the table was extracted successfully.
+    '''
+    watermark_store.set(db_name, schema_name, tbl_name, lte_column, watermark)
+
+    return subprocess.CompletedProcess(args=watermark_store.file_name, returncode=0)
+
+
 def extract(db_name, last_extract_time=None, lte_column=None, current_extract_time=None
             , table_names=None, schemas=['dbo'], extract_mode='full'
             , extract_format=False, top_level_directory=SOURCE_DATA_PATH, date=None
             , log_file_path = None, error_file_path = None
-            , username=None, password=None):
+            , username=None, password=None, max_workers=DEFAULT_MAX_WORKERS
+            , order_by_size=True, partitioned_tables=None, num_partitions=DEFAULT_NUM_PARTITIONS
+            , extract_engine='bcp', fetch_size=None, use_watermarks=False, watermark_store=None
+            , change_source=change_extract.CHANGE_TRACKING, compression=None, compression_level=None
+            , output_format='csv', row_group_size=native_extract.DEFAULT_ROW_GROUP_SIZE
+            , bulk_format=True, use_schema_cache=True, schema_cache=None, resume=False
+            , job_runner=None, output_stream_factory=None, artifact_compression=None
+            , artifact_compression_level=None, lte_time_zone='local'):
     '''
     This is the Master extraction function and intended to serve as Entry 
     point ot the Extract system.
@@ -301,9 +730,18 @@ def extract(db_name, last_extract_time=None, lte_column=None, current_extract_ti
                          not provided defaults to None; in which case all tables in
                          the Database is extracted.
     schemas            : Name of the schemas to which the tables belongs to in DB.
-                         It is optional and defaults to 'dbo'. 
+                         It is optional and defaults to 'dbo'. With several schemas
+                         only the schemas a table exists in are extracted, and the
+                         files and logs of every schema go into their own
+                         subdirectory, ex: top_level_directory/yyyymmdd/db_name/schema_name.
     extract_mode       : Data extract mode.
-                         Either 'full' or 'incremental' only supported at this moment.
+                         Either 'full', 'incremental' or 'changes'.
+                         'changes' extracts the inserted, updated and deleted rows 
+                         recorded by Change Tracking or CDC (see :change_source) since
+                         the watermark of each table. Watermarks are always used, the
+                         upper bound defaults to the current version / LSN of the
+                         database. :last_extract_time, if provided, overrides the
+                         lower bound of all the tables.
     extract_format     : Whether to extract the formats of the tables
     top_level_directory: Top level Directory of the data store path
     date               : A date string in 'YYYYMMDD' format. It appended to 
@@ -313,13 +751,95 @@ def extract(db_name, last_extract_time=None, lte_column=None, current_extract_ti
     username           : Username of the user. This is optional. If not provided, 
                          trusted connection is assumed.
     password           : Password of the user.
-
+    max_workers        : Maximum number of tables extracted concurrently.
+                         Format and data of the same table are always dumped in order.
+    order_by_size      : Whether to extract the biggest tables first, based on the 
+                         estimates from sys.dm_db_partition_stats. Shortens the run
+                         when tables are extracted concurrently.
+    partitioned_tables : Names of the very large tables to be extracted in key range
+                         slices (see db_dump_partitioned_extract). Only used in 'full'
+                         extract mode. Every such table runs up to :num_partitions 
+                         additional bcp processes.
+    num_partitions     : Number of slices for each of the :partitioned_tables.
+    extract_engine     : Either 'bcp' or 'native'. 'native' streams the rows through
+                         pyodbc in-process instead of running a bcp process per table.
+                         Partitioned tables and table formats are always dumped by bcp.
+    fetch_size         : Rows per fetchmany batch of the 'native' engine. Derived
+                         from the row width of each table if not provided.
+    use_watermarks     : Only used in 'incremental' extract mode. If set, the lower
+                         bound of every table is read from the watermark store, unless
+                         :last_extract_time is provided, and the store is advanced to 
+                         :current_extract_time once the table is extracted successfully.
+                         :current_extract_time defaults to the current time of the
+                         source server (see :lte_time_zone), never to the clock of
+                         this host. A table without watermark is extracted up to
+                         :current_extract_time.
+    watermark_store    : WatermarkStore to be used; defaults to source_system_data/watermarks.db
+    lte_time_zone      : Time zone of the :lte_column values, which the default
+                         :current_extract_time is read in: 'local' for the local time
+                         of the source server (ex: GETDATE() / SYSDATETIME() defaults)
+                         or 'utc' (ex: GETUTCDATE() / SYSUTCDATETIME() defaults).
+                         Rows stamped in another time zone may be skipped.
+    change_source      : Either 'change_tracking' or 'cdc'. Used in 'changes' extract mode.
+    compression        : None, 'gzip', 'zstd' or 'lz4'. Table data is compressed while it is
+                         written, ex: tbl_name.csv.gz; the uncompressed file is never
+                         staged on disk (bcp writes into a named pipe where available).
+    compression_level  : Codec specific compression level.
+    output_format      : Either 'csv' or 'parquet'. Parquet files are typed (column
+                         types from INFORMATION_SCHEMA), dictionary encoded and
+                         compressed by :compression internally (snappy if None).
+                         Requires pyarrow; always uses the 'native' engine, 
+                         partitioned tables are extracted as a single file.
+    row_group_size     : Rows per parquet row group.
+    bulk_format        : If set, the formats of all the tables are captured with a
+                         single catalog query and rendered locally, together with
+                         schema_catalog.json (see schema_capture module), instead of
+                         running bcp once per table.
+    use_schema_cache   : If set, format files are only regenerated for the tables
+                         whose schema fingerprint changed since the last run; the
+                         previous file is hard-linked otherwise (see schema_cache).
+    schema_cache       : SchemaCache to be used; defaults to source_system_data/schema_cache.db
+    resume             : The state of every table is journaled next to the output
+                         directory, ex: top_level_directory/yyyymmdd/db_name.journal.json
+                         (see extract_journal). If set, the tables done by a previous
+                         run into the same directory are skipped and only the failed
+                         or unfinished ones are extracted again.
+    job_runner         : Runs the per table jobs instead of run_extract_jobs, ex: to
+                         pass every table on to further stages (see extract_to_landing).
+                         Called as job_runner(jobs, output_directory, max_workers,
+                         on_start, on_finish); returns a list of TableExtractResult.
+    output_stream_factory: Called with the name of every data file; returns the context
+                         managed binary stream receiving the data instead of the local
+                         file, ex: an S3 multipart upload stream (see extract_to_landing).
+                         Format files and manifests are always written locally. bcp
+                         writes into a named pipe where available (POSIX); otherwise
+                         the whole table is written locally before it is streamed.
+    artifact_compression: None, 'gzip', 'zstd' or 'lz4'. Every data file is compressed on
+                         its own, next to it, as soon as its table is extracted, and
+                         the files of all the tables are listed with their sizes, row
+                         counts and checksums in the artifact_manifest.json of the output
+                         directory (see table_artifacts); instead of one zip of everything
+                         with dump_zipped_file. A table is journaled done once compressed.
+                         The table is compressed by its extraction worker, thus counts
+                         against :max_workers until compressed; its blocks are compressed
+                         by a pool of min(:max_workers, CPUs) processes shared by all the
+                         tables. Not used with :job_runner nor :output_stream_factory.
+    artifact_compression_level: Codec specific compression level of the artifacts.
+
+    Returns
+    -----------
+    List of TableExtractResult, one per extracted table.
     '''
 
     try:
-        if not table_names:
-            connection = get_connection()
-            table_names = get_tables(db_name=db_name, connection=connection, schemas=schemas)
+        # connections are shared by metadata queries and the native engine workers
+        pool = get_connection_pool(username, password, max_size=max(DEFAULT_POOL_SIZE, max_workers + 1))
+
+        # (schema_name, tbl_name) of the existing tables only
+        tables = get_extract_tables(db_name, pool, schemas, table_names)
+        table_names = list(dict.fromkeys(tbl_name for _, tbl_name in tables))
+        # tables of different schemas may share a name; their files and logs never do
+        schema_directories = len(schemas) > 1
               
         # this will be unique to every date for every db
         # this will be passed to the extract method downstream 
@@ -329,136 +849,183 @@ def extract(db_name, last_extract_time=None, lte_column=None, current_extract_ti
         else: # if date is not provided; use current date
             output_directory = os.path.join(top_level_directory, date_utility.get_current_date(), db_name)
                 
-        if extract_mode == "full" and extract_format and username:
-            # This segment is to extract the full table, format of the table 
-            # using the Username and Password combination provied by the user.
-            for schema in schemas:
-                for tbl_name in table_names:
-                    params = {'db_name':db_name, 'tbl_name':tbl_name
-                        , 'outputfile_path':output_directory, 'schema_name':schema
-                        , 'log_file_path':log_file_path, 'error_file_path':error_file_path
-                        , 'userName':username, 'password':password}
-                    
-                    # dump table format
-                    dump_table_format(**params)
-
-                    # dump table data
-                    db_dump_full_extract(**params)
-
-        elif extract_mode == "full" and extract_format:
-            # This segment is to extract the full table, format of the table 
-            # using trusted connection (-T).
-
-            for schema in schemas:
-                for tbl_name in table_names:
-                    params = {'db_name':db_name, 'tbl_name':tbl_name
-                        , 'outputfile_path':output_directory, 'schema_name':schema
-                        , 'log_file_path':log_file_path, 'error_file_path':error_file_path
-                        }
-                    
-                    # dump table format
-                    dump_table_format(**params)
-                    
-                    # dump table data
-                    db_dump_full_extract(**params)
-        
-        elif extract_mode == "full" and username:
-            # This segment is to extract the full table without table format.
-            # using the Username and Password combination provied by the user.
-            for schema in schemas:
-                for tbl_name in table_names:
-                    params = {'db_name':db_name, 'tbl_name':tbl_name
-                        , 'outputfile_path':output_directory, 'schema_name':schema
-                        , 'log_file_path':log_file_path, 'error_file_path':error_file_path
-                        , 'userName':username, 'password':password}
-                    
-                    # dump table data
-                    db_dump_full_extract(**params)
-
-        elif extract_mode == "full":
-            # This segment is to extract the full table without table format.
-            # using trusted connection (-T).
-            for schema in schemas:
-                for tbl_name in table_names:
-                    params = {'db_name':db_name, 'tbl_name':tbl_name
-                        , 'outputfile_path':output_directory, 'schema_name':schema
-                        , 'log_file_path':log_file_path, 'error_file_path':error_file_path
-                        }
-                    
-                    # dump table data
-                    db_dump_full_extract(**params)
-                    
-        elif extract_mode == "incremental" and extract_format and username:
-            # extract incremental data and format of the table using the 
-            # Username and Password combination provied by the user.
-            for schema in schemas:
-                for tbl_name in table_names:
-                    params = {'db_name':db_name, 'tbl_name':tbl_name
-                        , 'outputfile_path':output_directory, 'schema_name':schema
-                        , 'log_file_path':log_file_path, 'error_file_path':error_file_path
-                        , 'userName':username, 'password':password}
-                    
-                    # dump table format
-                    dump_table_format(**params)
-
-                    # dump table data
-                    # add remaing params required for incremental extract
-                    db_dump_incremental_extract(**params.update({'last_extract_time':last_extract_time
-                                                    , 'lte_column':lte_column
-                                                    , 'current_extract_time':current_extract_time})
-                            )
-
-        elif extract_mode == "incremental" and extract_format:
-            # incrementally extract data and format of the table
-            #  using trusted connection (-T).
-            for schema in schemas:
-                for tbl_name in table_names:
-                    params = {'db_name':db_name, 'tbl_name':tbl_name
-                        , 'outputfile_path':output_directory, 'schema_name':schema
-                        , 'log_file_path':log_file_path, 'error_file_path':error_file_path
-                        }
-                    
-                    # dump table format
-                    dump_table_format(**params)
-
-                    # dump table data
-                    # add remaing params required for incremental extract
-                    db_dump_incremental_extract(**params.update({'last_extract_time':last_extract_time
-                                                    , 'lte_column':lte_column
-                                                    , 'current_extract_time':current_extract_time})
-                            )
-
-        elif extract_mode == "incremental" and username:
-            # incrementally extract the data using the username and password
-            # but without extracting table format.
-            for schema in schemas:
-                for tbl_name in table_names:
-                    params = {'db_name':db_name, 'tbl_name':tbl_name
-                        , 'outputfile_path':output_directory, 'schema_name':schema
-                        , 'log_file_path':log_file_path, 'error_file_path':error_file_path
-                        , 'userName':username, 'password':password
-                        , 'last_extract_time':last_extract_time, 'lte_column':lte_column
-                        , 'current_extract_time':current_extract_time}
-                    
-                    # dump table data
-                    db_dump_incremental_extract(**params)
-
-        elif extract_mode == "incremental":
-            # incrementally extract the data, but without table format
-            # and using trusted connection (-T).
-            for schema in schemas:
-                for tbl_name in table_names:
-                    params = {'db_name':db_name, 'tbl_name':tbl_name
-                        , 'outputfile_path':output_directory, 'schema_name':schema
-                        , 'log_file_path':log_file_path, 'error_file_path':error_file_path
-                        , 'last_extract_time':last_extract_time, 'lte_column':lte_column
-                        , 'current_extract_time':current_extract_time}
-                    
-                    # dump table data
-                    db_dump_incremental_extract(**params)
-        else:
+        if extract_mode not in ("full", "incremental", "changes") or extract_engine not in ("bcp", "native")\
+                or change_source not in change_extract.CHANGE_SOURCES\
+                or output_format not in native_extract.OUTPUT_FORMATS\
+                or lte_time_zone not in SOURCE_TIME_FUNCTIONS:
             raise ValueError("Provided Parameters Not Valid")
 
+        if output_format == "parquet":
+            # bcp only writes delimited text
+            extract_engine = "native"
+            partitioned_tables = None
+
+        if extract_mode == "changes":
+            use_watermarks = True
+            # the watermarks of change extracts are versions / LSNs, not times
+            lte_column = change_extract.WATERMARK_COLUMNS[change_source]
+            if current_extract_time is None:
+                # same upper bound for all the tables of the database
+                with pool.connection() as connection:
+                    current_extract_time = change_extract.get_current_version(connection, db_name, change_source)
+            if current_extract_time is None:
+                raise ValueError(f"{change_source} is not enabled on database {db_name}")
+
+        if extract_mode in ("incremental", "changes") and use_watermarks:
+            watermark_store = watermark_store or WatermarkStore()
+            if current_extract_time is None:
+                # clock of the source, the one the rows are stamped with
+                with pool.connection() as connection:
+                    current_extract_time = get_source_time(connection, lte_time_zone)
+
+        if extract_engine == "native":
+            full_extract = db_native_full_extract
+            incremental_extract = db_native_incremental_extract
+            engine_params = {'fetch_size':fetch_size, 'output_format':output_format
+                                , 'row_group_size':row_group_size}
+        else:
+            full_extract = db_dump_full_extract
+            incremental_extract = db_dump_incremental_extract
+            engine_params = {}
+
+        table_schemas = {}
+        if extract_format and use_schema_cache:
+            schema_cache = schema_cache or SchemaCache()
+            if not bulk_format:
+                # current column definitions, to skip the bcp dump of unchanged formats
+                with pool.connection() as connection:
+                    table_schemas = schema_capture.get_table_schemas(connection, db_name, schemas, table_names)
+        else:
+            schema_cache = None
+
+        # one job per table; tables are then extracted concurrently
+        jobs = []
+        for schema, tbl_name in tables:
+            params = {'db_name':db_name, 'tbl_name':tbl_name
+                , 'outputfile_path':output_directory, 'schema_name':schema
+                , 'log_file_path':log_file_path, 'error_file_path':error_file_path
+                }
+            if schema_directories:
+                # top_level_directory/yyyymmdd/db_name/schema_name/tbl_name.csv
+                schema_log_file_path, schema_error_file_path = get_log_directories(log_file_path, error_file_path)
+                params.update({'outputfile_path':os.path.join(output_directory, schema)
+                    , 'log_file_path':os.path.join(schema_log_file_path, schema)
+                    , 'error_file_path':os.path.join(schema_error_file_path, schema)})
+            
+            if username:
+                # use the Username and Password combination provied by the user,
+                # otherwise trusted connection (-T) is used.
+                params.update({'userName':username, 'password':password})
+
+            steps = []
+            if extract_format and not bulk_format and schema_cache:
+                # dump table format, if changed
+                steps.append(ExtractStep('format', dump_table_format_cached
+                                , {**params, 'columns':table_schemas.get((schema, tbl_name))
+                                    , 'schema_cache':schema_cache}))
+            elif extract_format and not bulk_format:
+                # dump table format
+                steps.append(ExtractStep('format', dump_table_format, params))
+
+            # format files are never compressed, nor streamed
+            params = {**params, 'compression':compression, 'compression_level':compression_level
+                , 'output_stream_factory':output_stream_factory}
+
+            if extract_mode == "full" and partitioned_tables and tbl_name in partitioned_tables:
+                # dump table data in key range slices
+                steps.append(ExtractStep('data', db_dump_partitioned_extract
+                                , {**params, 'num_partitions':num_partitions}))
+
+            elif extract_mode == "full":
+                # dump table data
+                steps.append(ExtractStep('data', full_extract, {**params, **engine_params}))
+
+            elif extract_mode == "changes":
+                # dump changed rows since the watermark of the table
+                steps.append(ExtractStep('data', db_changes_extract
+                                , {**params, 'change_source':change_source, 'fetch_size':fetch_size
+                                    , 'output_format':output_format
+                                    , 'last_version':last_extract_time if last_extract_time is not None
+                                        else watermark_store.get(db_name, schema, tbl_name, lte_column)
+                                    , 'current_version':current_extract_time}))
+            else:
+                table_last_extract_time = last_extract_time
+                if use_watermarks and last_extract_time is None:
+                    table_last_extract_time = watermark_store.get(db_name, schema, tbl_name, lte_column)
+
+                # dump table data
+                # add remaing params required for incremental extract
+                steps.append(ExtractStep('data', incremental_extract
+                                , {**params, **engine_params, 'last_extract_time':table_last_extract_time
+                                    , 'lte_column':lte_column
+                                    , 'current_extract_time':current_extract_time}))
+
+            if extract_mode != "full" and use_watermarks:
+                steps.append(ExtractStep('watermark', advance_watermark
+                                , {'watermark_store':watermark_store, 'db_name':db_name
+                                    , 'schema_name':schema, 'tbl_name':tbl_name
+                                    , 'lte_column':lte_column, 'watermark':current_extract_time}))
+
+            jobs.append(ExtractJob(schema_name=schema, tbl_name=tbl_name, steps=steps
+                                   , output_subdirectory=schema if schema_directories else None))
+
+        if extract_format and bulk_format:
+            # one round trip for the formats of all the tables
+            capture_table_formats(pool, db_name, output_directory, schemas, table_names, schema_cache)
+
+        if order_by_size:
+            # longest processing time first
+            with pool.connection() as connection:
+                jobs = order_jobs_by_size(jobs, get_table_sizes(db_name=db_name
+                                            , connection=connection, schemas=schemas))
+
+        journal = ExtractJournal(output_directory, db_name, resume=resume)
+        skipped = []
+        if resume:
+            skipped = [TableExtractResult(schema_name=job.schema_name, tbl_name=job.tbl_name
+                            , status=STATUS_SKIPPED, row_count=job.row_count, reserved_pages=job.reserved_pages)
+                       for job in jobs if journal.is_done(job.schema_name, job.tbl_name)]
+            jobs = [job for job in jobs if not journal.is_done(job.schema_name, job.tbl_name)]
+        journal.add_pending(jobs)
+
+        start = time.perf_counter()
+        if job_runner is None and artifact_compression and not output_stream_factory:
+            artifacts = ArtifactManifest(output_directory, db_name, artifact_compression, resume=resume)
+            # blocks of the files of all the tables; one process per extraction worker at most
+            compress_workers = min(max_workers, os.cpu_count() or 1)
+            compress_executor = ProcessPoolExecutor(max_workers=compress_workers)
+
+            def on_finish(job, result):
+                # compressed by the worker thread as soon as the table is extracted
+                files = {}
+                if result.status == STATUS_DONE:
+                    try:
+                        files = artifacts.compress_table(job.schema_name, job.tbl_name, artifact_compression
+                                                         , artifact_compression_level, compress_workers
+                                                         , compress_executor, row_count=result.rows_extracted
+                                                         , output_subdirectory=job.output_subdirectory)
+                    except Exception as e:
+                        result.status = STATUS_FAILED
+                        result.error = f'compress: {e}'
+                if result.status != STATUS_DONE:
+                    artifacts.add_table(job.schema_name, job.tbl_name, result.status)
+                journal.on_finish(job, result, checksums={f: entry['md5'] for f, entry in files.items()})
+
+            try:
+                results = skipped + run_extract_jobs(jobs, max_workers=max_workers
+                                                     , on_start=journal.on_start, on_finish=on_finish)
+            finally:
+                compress_executor.shutdown()
+        elif job_runner is None:
+            results = skipped + run_extract_jobs(jobs, max_workers=max_workers
+                                                 , on_start=journal.on_start, on_finish=journal.on_finish)
+        else:
+            results = skipped + job_runner(jobs, output_directory, max_workers
+                                           , journal.on_start, journal.on_finish)
+        print_extract_report(results, wall_clock_seconds=time.perf_counter() - start)
+
+        return results
+
     except pyodbc.Error as e:
         print(e)
         
@@ -468,17 +1035,36 @@ def extract(db_name, last_extract_time=None, lte_column=None, current_extract_ti
     
     except Exception as e:
         print(e)
-    finally:
-        # close the connection if exist
-        try:
-            connection
-        except (NameError, Exception): # overall exception is to deal with already closed connection exception
-            ''
-        else:
-            connection.close()
 
 
-def extract_format_only(db_name, table_names=None, schemas=['dbo'], username=None, password=None, top_level_directory=SOURCE_DATA_PATH):
+def capture_table_formats(pool, db_name, outputfile_path, schemas=['dbo'], table_names=None, schema_cache=None):
+    '''
+        Writes the format files of all the tables, plus schema_catalog.json, from
+        a single catalog query. Equivalent of dump_table_format for every table.
+        With a :schema_cache, the format files of unchanged tables are reused.
+        With several :schemas the format files are written per schema, into
+        outputfile_path/schema_name, same as the data files of extract().
+
+        Returns
+        ----------------
+        dict of (schema_name, tbl_name) -> list of schema_capture.ColumnDefinition
+    '''
+    with pool.connection() as connection:
+        table_schemas = schema_capture.capture_schemas(connection, db_name, outputfile_path, schemas
+                                                       , table_names, schema_cache
+                                                       , schema_directories=len(schemas) > 1)
+
+    if table_names:
+        captured = {tbl_name for _, tbl_name in table_schemas}
+        missing = [tbl_name for tbl_name in table_names if tbl_name not in captured]
+        if missing:
+            print(f'Format not captured, tables not found: {missing}')  # TODO: Logging
+
+    return table_schemas
+
+
+def extract_format_only(db_name, table_names=None, schemas=['dbo'], username=None, password=None
+                        , top_level_directory=SOURCE_DATA_PATH, bulk_format=True, use_schema_cache=True):
     '''
         This method is to extract only schema of the table, without extracting 
         the data.
@@ -490,45 +1076,49 @@ def extract_format_only(db_name, table_names=None, schemas=['dbo'], username=Non
             username           : Username of the database.
             password           : Password of the database.
             top_level_directory: Top level directory where the data will be dumped.
-                                 
+            bulk_format        : Capture all the formats with one catalog query
+                                 instead of one bcp process per table.
+            use_schema_cache   : Only regenerate the formats of the tables whose
+                                 schema changed since the last run.
 
     '''
     try:
         # this will be passed to the extract method downstream 
         # where the full path will be constructed; table name will be appended
         output_directory = os.path.join(top_level_directory, date_utility.get_current_date(), db_name)
-        
-        if not table_names:
 
-            connection = get_connection()
-            table_names = get_tables(db_name=db_name, connection=connection, schemas=schemas)
+        pool = get_connection_pool(username, password)
+        schema_cache = SchemaCache() if use_schema_cache else None
 
-            # try:
-            #     connection = get_connection()
-            #     table_names = get_tables(db_name=db_name, connection=connection, schemas=schemas)
-            
-            # except Exception as e:
-            #     raise e
-            # finally:
-            #     # close the connection if exist
-            #     try:
-            #         connection
-            #     except (NameError, Exception):
-            #         ''
-            #     else:
-            #         connection.close()
-
-        for schema in schemas:
-            for tbl_name in table_names:
-                if username:
-                    # dump table format using Username and Password proivied by the user.
-                    dump_table_format(db_name=db_name, tbl_name=tbl_name
-                        , outputfile_path=output_directory, schema_name=schema
-                        , userName=username, password=password)
-                else:
-                    # dump table format using Trusted Connection.
-                    dump_table_format(db_name=db_name, tbl_name=tbl_name
-                        , outputfile_path=output_directory, schema_name=schema)
+        if bulk_format:
+            capture_table_formats(pool, db_name, output_directory, schemas, table_names, schema_cache)
+            return
+        
+        # (schema_name, tbl_name) of the existing tables only
+        tables = get_extract_tables(db_name, pool, schemas, table_names)
+        table_names = list(dict.fromkeys(tbl_name for _, tbl_name in tables))
+
+        table_schemas = {}
+        if schema_cache:
+            with pool.connection() as connection:
+                table_schemas = schema_capture.get_table_schemas(connection, db_name, schemas, table_names)
+
+        for schema, tbl_name in tables:
+            params = {'db_name':db_name, 'tbl_name':tbl_name
+                , 'outputfile_path':output_directory, 'schema_name':schema}
+            if len(schemas) > 1:
+                # same as capture_table_formats
+                params['outputfile_path'] = os.path.join(output_directory, schema)
+            if username:
+                # dump table format using Username and Password proivied by the user.
+                params.update({'userName':username, 'password':password})
+            # otherwise dump table format using Trusted Connection.
+
+            if schema_cache:
+                dump_table_format_cached(columns=table_schemas.get((schema, tbl_name))
+                                         , schema_cache=schema_cache, **params)
+            else:
+                dump_table_format(**params)
 
     except pyodbc.Error as e:
         print(e)
@@ -540,15 +1130,6 @@ def extract_format_only(db_name, table_names=None, schemas=['dbo'], username=Non
     except Exception as e:
         print(e)
 
-    finally:
-                # close the connection if exist
-                try:
-                    connection
-                except (NameError, Exception):
-                    ''
-                else:
-                    connection.close()
-
 
 if __name__ == '__main__':
     
@@ -565,18 +1146,52 @@ if __name__ == '__main__':
                         , default=['dbo'], required=False, nargs='*')
     argparser.add_argument('-lte', '--lte_column', help='Name of the column to use as the last extract time'
                         , default=None, required=False) # nargs by deffault is 1 -> 'item_itself'
+    argparser.add_argument('-ltz', '--lte_time_zone', help='Time zone of the lte column; the default upper bound is read from the source server in it'
+                        , default='local', choices=['local', 'utc'], required=False)
     argparser.add_argument('-cet', '--current_extract_time', help='Current extract Time to be used as upper bound for incremental extract'
                         , default=None, required=False) # nargs by deffault is 1 -> 'item_itself'
     argparser.add_argument('-le', '--last_extract_time', help='Last extract Time to be used as lower bound for incremental extract'
                         , default=None, required=False) # nargs by deffault is 1 -> 'item_itself'
     argparser.add_argument('-em', '--extract_mode', help='Extract mode to be used'
-                        , default='full', choices=['full', 'incremental'], required=False) # nargs by deffault is 1 -> 'item_itself'
+                        , default='full', choices=['full', 'incremental', 'changes'], required=False) # nargs by deffault is 1 -> 'item_itself'
+    argparser.add_argument('-cs', '--change_source', help='Source of the changed rows in changes extract mode'
+                        , default='change_tracking', choices=['change_tracking', 'cdc'], required=False)
     argparser.add_argument('-ef', '--extract_format', help='Whether to Extract format (schema) of the table. Default is set to True.'
                         , type= bool, default=True, choices=[True, False],required=False)
     argparser.add_argument('-u', '--username', help='Username to be used for connection'
                         , default=None, required=False)
     argparser.add_argument('-p', '--password', help='Password to be used for connection'
                         , default=None, required=False)
+    argparser.add_argument('-ptbl', '--partitioned_tables', help='Name of the large table(s) to extract in key range slices'
+                        , default=None, required=False, nargs='*')
+    argparser.add_argument('-np', '--num_partitions', help='Number of key range slices for each partitioned table'
+                        , type=int, default=DEFAULT_NUM_PARTITIONS, required=False)
+    argparser.add_argument('-wm', '--use_watermarks', help='Read the lower bound of incremental extracts from, and advance it in, the watermark store'
+                        , action='store_true', required=False)
+    argparser.add_argument('-cmp', '--compression', help='Compress table data while it is extracted'
+                        , default=None, choices=['gzip', 'zstd', 'lz4'], required=False)
+    argparser.add_argument('-cl', '--compression_level', help='Compression level of the codec'
+                        , type=int, default=None, required=False)
+    argparser.add_argument('-eng', '--extract_engine', help='Extraction engine; bcp utility or in-process pyodbc streaming'
+                        , default='bcp', choices=['bcp', 'native'], required=False)
+    argparser.add_argument('-fs', '--fetch_size', help='Rows per fetch for the native extraction engine'
+                        , type=int, default=None, required=False)
+    argparser.add_argument('-of', '--output_format', '--output-format', help='File format of the extracted table data'
+                        , default='csv', choices=['csv', 'parquet'], required=False)
+    argparser.add_argument('-rgs', '--row_group_size', help='Rows per row group of parquet output'
+                        , type=int, default=native_extract.DEFAULT_ROW_GROUP_SIZE, required=False)
+    argparser.add_argument('-bf', '--bcp_format', help='Dump the format of every table with its own bcp process instead of one catalog query'
+                        , dest='bulk_format', action='store_false', required=False)
+    argparser.add_argument('-nsc', '--no_schema_cache', help='Regenerate the format of every table, even if its schema did not change'
+                        , dest='use_schema_cache', action='store_false', required=False)
+    argparser.add_argument('-rs', '--resume', help='Skip the tables already extracted by a previous run of the same date'
+                        , action='store_true', required=False)
+    argparser.add_argument('-ac', '--artifact_compression', help='Compress every table file on its own once the table is extracted, and write artifact_manifest.json'
+                        , default=None, choices=['gzip', 'zstd', 'lz4'], required=False)
+    argparser.add_argument('-acl', '--artifact_compression_level', help='Compression level of the per table artifacts'
+                        , type=int, default=None, required=False)
+    argparser.add_argument('-mw', '--max_workers', '--max-workers', help='Maximum number of tables to be extracted concurrently'
+                        , type=int, default=DEFAULT_MAX_WORKERS, required=False)
 
     args = argparser.parse_args()
     
@@ -0,0 +1,170 @@
+'''
+    Checkpoint journal of an extraction run, so that a failed run can be resumed.
+
+    The journal of the run extracting into top_level_directory/yyyymmdd/db_name
+    is written next to it, as top_level_directory/yyyymmdd/db_name.journal.json.
+    For every table it records the state (pending, running, done or failed),
+    and for done tables the size of every file written, plus its MD5 checksum
+    when the caller already calculated it (ex: the checksum stage of
+    extract_to_landing); the files are never read again only to be journaled.
+
+    The journal is rewritten (atomically) on every state change, thus it is
+    current even if the run is killed. A resumed run skips the tables which are
+    done and whose files are still present with the same size; failed tables,
+    and tables which were running when the run died, are extracted again.
+'''
+
+import glob
+import json
+import os
+import threading
+
+from src.utils import date_utility
+from src.process_source_system.extract_scheduler import STATUS_PENDING, STATUS_RUNNING, STATUS_DONE
+
+
+def get_journal_file_name(output_directory):
+    '''
+        top_level_directory/yyyymmdd/db_name -> top_level_directory/yyyymmdd/db_name.journal.json
+    '''
+    return os.path.normpath(output_directory) + '.journal.json'
+
+
+def get_table_files(output_directory, tbl_name):
+    '''
+        Returns the files written for the table: data (also compressed, parquet
+        and partitioned slices), manifest and format file.
+    '''
+    prefix = os.path.join(glob.escape(output_directory), glob.escape(tbl_name))
+
+    return sorted(f for f in glob.glob(prefix + '.*') + glob.glob(prefix + '_format.xml')
+                  if not f.endswith('.tmp'))
+
+
+def get_job_files(output_directory, job):
+    '''
+        get_table_files of an ExtractJob, in its output subdirectory if any.
+    '''
+    if job.output_subdirectory:
+        output_directory = os.path.join(output_directory, job.output_subdirectory)
+
+    return get_table_files(output_directory, job.tbl_name)
+
+
+def describe_files(file_names, checksums=None, output_directory=None):
+    '''
+        Returns dict of file name -> {'bytes':...}, plus 'md5' for the files in
+        :checksums (dict of file name -> hex MD5). File names are relative to
+        :output_directory if provided, base names otherwise.
+    '''
+    checksums = checksums or {}
+
+    def get_name(f):
+        return os.path.relpath(f, output_directory) if output_directory else os.path.basename(f)
+
+    return {get_name(f): {'bytes': os.path.getsize(f), **({'md5': checksums[f]} if f in checksums else {})}
+            for f in file_names}
+
+
+class ExtractJournal:
+    '''
+        Journal of the extraction of one database into :output_directory.
+
+        resume: Keep the states of the previous run. Otherwise the journal
+                starts empty and overwrites any previous one.
+    '''
+
+    def __init__(self, output_directory, db_name, resume=False):
+        self.output_directory = output_directory
+        self.file_name = get_journal_file_name(output_directory)
+        self._lock = threading.Lock()
+
+        self.journal = None
+        if resume and os.path.isfile(self.file_name):
+            with open(self.file_name) as f:
+                self.journal = json.load(f)
+
+        if self.journal is None:
+            self.journal = {'db_name': db_name, 'output_directory': output_directory
+                            , 'created_at': date_utility.get_current_date_time(), 'tables': {}}
+
+    @staticmethod
+    def _key(schema_name, tbl_name):
+        return f'{schema_name}.{tbl_name}'
+
+    def _write(self):
+        '''
+            Writes the journal atomically. Caller holds the lock.
+        '''
+        directory = os.path.dirname(self.file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.file_name + '.tmp', 'w') as f:
+            json.dump(self.journal, f, indent=2)
+        os.replace(self.file_name + '.tmp', self.file_name)
+
+    def get(self, schema_name, tbl_name):
+        '''
+            Returns the journal entry of the table, None if not journaled.
+        '''
+        return self.journal['tables'].get(self._key(schema_name, tbl_name))
+
+    def set_state(self, schema_name, tbl_name, status, **fields):
+        '''
+            Records the state of the table, plus any additional :fields.
+        '''
+        with self._lock:
+            entry = {'status': status, 'updated_at': date_utility.get_current_date_time(), **fields}
+            self.journal['tables'][self._key(schema_name, tbl_name)] = entry
+            self._write()
+
+    def is_done(self, schema_name, tbl_name):
+        '''
+            Whether the table was extracted successfully and all its files are
+            still present with the journaled size.
+        '''
+        entry = self.get(schema_name, tbl_name)
+        if not entry or entry['status'] != STATUS_DONE:
+            return False
+
+        for relative_name, file_info in entry.get('files', {}).items():
+            file_name = os.path.join(self.output_directory, relative_name)
+            if not os.path.isfile(file_name) or os.path.getsize(file_name) != file_info['bytes']:
+                return False
+
+        return True
+
+    def add_pending(self, jobs):
+        '''
+            Records the tables not journaled yet as pending.
+        '''
+        with self._lock:
+            for job in jobs:
+                key = self._key(job.schema_name, job.tbl_name)
+                if key not in self.journal['tables']:
+                    self.journal['tables'][key] = {'status': STATUS_PENDING
+                                                   , 'updated_at': date_utility.get_current_date_time()}
+            self._write()
+
+    def on_start(self, job):
+        '''
+            run_extract_jobs callback.
+        '''
+        self.set_state(job.schema_name, job.tbl_name, STATUS_RUNNING)
+
+    def on_finish(self, job, result, checksums=None):
+        '''
+            run_extract_jobs callback; records the files of a done table.
+
+            checksums: dict of file name -> hex MD5 of the files already hashed.
+        '''
+        if result.status != STATUS_DONE:
+            self.set_state(job.schema_name, job.tbl_name, result.status, error=result.error
+                           , elapsed_seconds=result.elapsed_seconds)
+            return
+
+        files = describe_files(get_job_files(self.output_directory, job), checksums, self.output_directory)
+        self.set_state(job.schema_name, job.tbl_name, result.status
+                       , elapsed_seconds=result.elapsed_seconds
+                       , bytes=sum(f['bytes'] for f in files.values()), files=files)
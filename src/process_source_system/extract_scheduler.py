@@ -0,0 +1,227 @@
+'''
+    Concurrent scheduling of per table extraction jobs.
+
+    Every table to be extracted is represented by an ExtractJob, which is an
+    ordered list of steps (ex: dump format, dump data). Steps of a single table
+    always run one after the other, whereas different tables are run
+    concurrently on a bounded pool of worker threads. Threads are sufficient as
+    the actual work is done either by the bcp process or inside the database
+    driver, both of which release the GIL.
+
+    Jobs can be ordered biggest table first (longest processing time first), so
+    that a single huge table does not start last and alone set the wall clock
+    time of the run.
+
+    Callers can observe every job starting and finishing (ex: to journal the
+    progress of the run). Once all the jobs are finished an aggregated report of
+    the run is produced.
+'''
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from src.config.definitions import KB, MB
+
+
+DEFAULT_MAX_WORKERS = 4
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+# already extracted by a previous run
+STATUS_SKIPPED = 'skipped'
+
+# SQL Server data pages are 8 KB
+PAGE_SIZE = 8 * KB
+
+
+@dataclass
+class ExtractStep:
+    '''
+        A single unit of work for a table.
+
+        func  : Callable to be invoked as func(**kwargs). It is expected to return
+                an object with a `returncode` attribute (ex: subprocess.CompletedProcess).
+                A non zero returncode or None is considered a failed step.
+        kwargs: Keyword arguments passed to :func.
+    '''
+    name: str
+    func: object
+    kwargs: dict = field(default_factory=dict)
+
+
+@dataclass
+class ExtractJob:
+    '''
+        All the steps required to extract one table.
+    '''
+    schema_name: str
+    tbl_name: str
+    steps: list = field(default_factory=list)
+    # directory of the files of the table, relative to the output directory;
+    # ex: the schema name when tables of several schemas are extracted
+    output_subdirectory: str = None
+    # size estimates; None when not known
+    row_count: int = None
+    reserved_pages: int = None
+
+
+@dataclass
+class TableExtractResult:
+    '''
+        Outcome of an ExtractJob, one per table.
+    '''
+    schema_name: str
+    tbl_name: str
+    status: str = STATUS_PENDING
+    elapsed_seconds: float = 0.0
+    return_codes: dict = field(default_factory=dict)
+    error: str = None
+    row_count: int = None
+    reserved_pages: int = None
+    # rows written, when the steps report it (native engine); None for bcp
+    rows_extracted: int = None
+
+
+def run_extract_job(job):
+    '''
+        Runs all the steps of a job in order. Stops at the first failed step.
+        Never raises; any exception is recorded on the returned result.
+    '''
+    result = TableExtractResult(schema_name=job.schema_name, tbl_name=job.tbl_name
+                                , status=STATUS_RUNNING
+                                , row_count=job.row_count, reserved_pages=job.reserved_pages)
+    start = time.perf_counter()
+
+    try:
+        for step in job.steps:
+            completed = step.func(**step.kwargs)
+
+            if completed is None:
+                # the step swallowed an exception and returned nothing
+                result.status = STATUS_FAILED
+                result.error = f'{step.name}: step did not return a result'
+                break
+
+            result.return_codes[step.name] = completed.returncode
+            if getattr(completed, 'row_count', None) is not None:
+                result.rows_extracted = (result.rows_extracted or 0) + completed.row_count
+
+            if completed.returncode != 0:
+                result.status = STATUS_FAILED
+                result.error = f'{step.name}: exited with return code {completed.returncode}'
+                break
+        else:
+            result.status = STATUS_DONE
+
+    except Exception as e:
+        result.status = STATUS_FAILED
+        result.error = f'{type(e).__name__}: {e}'
+
+    result.elapsed_seconds = time.perf_counter() - start
+
+    return result
+
+
+def order_jobs_by_size(jobs, table_sizes):
+    '''
+        Sets the size estimates on the jobs and returns them biggest first.
+
+        Jobs are ordered by reserved pages and then by row count. Tables without
+        an estimate are kept at the end in their original order.
+
+        Parameters
+        ----------------
+        jobs       : Iterable of ExtractJob.
+        table_sizes: dict of (schema_name, tbl_name) -> (row_count, reserved_pages)
+    '''
+    jobs = list(jobs)
+
+    for job in jobs:
+        job.row_count, job.reserved_pages = table_sizes.get((job.schema_name, job.tbl_name), (None, None))
+
+    known = [job for job in jobs if job.reserved_pages is not None]
+    unknown = [job for job in jobs if job.reserved_pages is None]
+
+    # sorted is stable, tables of equal size keep their relative order
+    return sorted(known, key=lambda job: (job.reserved_pages, job.row_count or 0), reverse=True) + unknown
+
+
+def _notify(callback, *args):
+    '''
+        Invokes a job callback; a failing callback never fails the job.
+    '''
+    if callback is None:
+        return
+
+    try:
+        callback(*args)
+    except Exception as e:
+        print(f'Extract job callback failed: {type(e).__name__}: {e}')  # TODO: Logging
+
+
+def _run_observed_job(job, on_start=None, on_finish=None):
+    _notify(on_start, job)
+    result = run_extract_job(job)
+    _notify(on_finish, job, result)
+
+    return result
+
+
+def run_extract_jobs(jobs, max_workers=DEFAULT_MAX_WORKERS, on_start=None, on_finish=None):
+    '''
+        Runs the extraction jobs on a bounded pool of worker threads.
+
+        Parameters
+        ----------------
+        jobs       : Iterable of ExtractJob. Jobs are submitted in the given order.
+        max_workers: Maximum number of tables extracted at the same time.
+                     1 means tables are extracted serially.
+        on_start   : Called as on_start(job) in the worker thread before the job runs.
+        on_finish  : Called as on_finish(job, result) in the worker thread once the
+                     job has finished, successfully or not.
+
+        Returns
+        ----------------
+        List of TableExtractResult in the same order as :jobs.
+    '''
+    if max_workers is None or max_workers < 1:
+        raise ValueError(f'max_workers should be a positive integer, got: {max_workers}')
+
+    jobs = list(jobs)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='extract') as executor:
+        # one future per table
+        futures = [executor.submit(_run_observed_job, job, on_start, on_finish) for job in jobs]
+
+        return [future.result() for future in futures]
+
+
+def get_extract_report(results, wall_clock_seconds=None):
+    '''
+        Returns a human readable, multi line summary of the extraction run.
+    '''
+    failed = [r for r in results if r.status not in (STATUS_DONE, STATUS_SKIPPED)]
+    skipped = [r for r in results if r.status == STATUS_SKIPPED]
+
+    lines = [f'{"schema.table":<50} {"status":<8} {"est. rows":>12} {"est. MB":>10} {"seconds":>10}  error']
+    for r in results:
+        est_rows = '' if r.row_count is None else r.row_count
+        est_mb = '' if r.reserved_pages is None else f'{r.reserved_pages * PAGE_SIZE / MB:.1f}'
+        lines.append(f'{r.schema_name + "." + r.tbl_name:<50} {r.status:<8} {est_rows:>12} {est_mb:>10} '
+                     f'{r.elapsed_seconds:>10.2f}  {r.error or ""}')
+
+    summary = f'Tables: {len(results)}, done: {len(results) - len(failed) - len(skipped)}, failed: {len(failed)}'
+    if skipped:
+        summary += f', skipped: {len(skipped)}'
+    if wall_clock_seconds is not None:
+        summary += f', wall clock seconds: {wall_clock_seconds:.2f}'
+    lines.append(summary)
+
+    return '\n'.join(lines)
+
+
+def print_extract_report(results, wall_clock_seconds=None):
+    print(get_extract_report(results, wall_clock_seconds))
@@ -0,0 +1,270 @@
+'''
+    Extracts the tables of a database and lands them in S3, as a pipeline:
+
+        extract -> compress -> checksum -> upload
+
+    Every table moves on to the next stage as soon as it is done with the
+    previous one, so tables are uploaded while the following tables are still
+    being extracted. Each stage has its own number of workers and a bounded
+    queue in front of it (see pipeline_utility), which limits the number of
+    tables waiting on disk between two stages.
+
+    - extract : the per table job built by extract() (format, data, watermark).
+    - compress: data files not yet compressed by the extraction are gzip/zstd/lz4
+                compressed, in blocks on a shared pool of processes (see
+                compression_utility.compress_files_parallel); format files and
+                manifests are kept as they are.
+    - checksum: MD5, SHA-256 and S3 ETag (for the multipart chunk size) of every file.
+    - upload  : multipart upload of every file, verified against its ETag.
+                With auto-tuned uploads the part size is picked from the file size
+                (the same for the checksum) and the concurrency from the throughput.
+                Key: key_prefix/yyyymmdd/db_name/file_name
+
+    The run journal records a table as done only once all its files are landed.
+    Every landed table is listed with its files, sizes, row counts and checksums
+    in artifact_manifest.json (see table_artifacts), uploaded last, so consumers
+    download only the tables they need.
+
+    In streaming mode the data (compressed by the extraction itself) is written
+    straight into multipart upload streams as it is extracted, with per part
+    MD5s and the ETag calculated on the fly; it is never staged on local disk.
+    Only the small format files and manifests go through the upload stage.
+    Streaming always uses the native extraction engine: bcp can only write into
+    a named pipe on POSIX, elsewhere it writes the whole table locally first.
+    For the same reason partitioned tables are streamed as a single file.
+'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from src.process_source_system import SOURCE_DATA_PATH
+from src.process_source_system.extract__source_systems import extract
+from src.process_source_system.extract_scheduler import run_extract_job, TableExtractResult
+from src.process_source_system.extract_scheduler import STATUS_DONE, STATUS_FAILED
+from src.process_source_system.extract_journal import get_job_files
+from src.process_source_system.schema_capture import SCHEMA_CATALOG_FILE
+from src.process_source_system.table_artifacts import ArtifactManifest, compress_table_files, describe_artifact
+from src.process_source_system.table_artifacts import set_row_count
+from src.utils.common_utils.checksum_utility import get_file_checksums
+from src.utils.aws_utils.copy_to_landing import S3_landing, get_object_key
+from src.utils.aws_utils.upload_tuning import get_upload_part_size, AdaptiveConcurrency
+from src.utils.aws_utils.upload_tuning import DEFAULT_INITIAL_CONCURRENCY, DEFAULT_MAX_TUNED_CONCURRENCY
+from src.utils.pipeline_utility import PipelineStage, run_pipeline, DEFAULT_QUEUE_SIZE
+from src.config.definitions import MB
+
+
+DEFAULT_COMPRESS_WORKERS = os.cpu_count() or 1
+DEFAULT_CHECKSUM_WORKERS = 2
+DEFAULT_UPLOAD_WORKERS = 4
+DEFAULT_MULTIPART_CHUNKSIZE = 25  # MB, same as S3_landing
+DEFAULT_MULTIPART_THRESHOLD = 25  # MB, same as S3_landing
+
+
+@dataclass
+class LandingItem:
+    '''
+        A table moving through the pipeline.
+    '''
+    job: object
+    output_directory: str
+    files: list = field(default_factory=list)
+    # file name -> {'md5':..., 'etag':..., 'part_size':...}
+    checksums: dict = field(default_factory=dict)
+    # file name -> S3 key
+    keys: dict = field(default_factory=dict)
+    # file name -> artifact manifest entry
+    artifacts: dict = field(default_factory=dict)
+    extract_result: object = None
+
+
+def get_landing_stages(landing, bucket_name, top_level_directory, on_start, key_prefix=None
+                       , compression='gzip', compression_level=None, extract_workers=1
+                       , compress_workers=DEFAULT_COMPRESS_WORKERS, checksum_workers=DEFAULT_CHECKSUM_WORKERS
+                       , upload_workers=DEFAULT_UPLOAD_WORKERS, multipart_chunksize=DEFAULT_MULTIPART_CHUNKSIZE
+                       , queue_size=DEFAULT_QUEUE_SIZE, auto_tune_uploads=False, resumable_uploads=False
+                       , compress_executor=None):
+    '''
+        Returns the PipelineStages landing a LandingItem. Without :compression the
+        compress stage is left out.
+
+        compress_executor: Process pool compressing the blocks of the files of all
+                           the tables; without it every file is compressed by the
+                           thread of the stage.
+    '''
+
+    def extract_table(item):
+        on_start(item.job)
+        item.extract_result = run_extract_job(item.job)
+        if item.extract_result.status != STATUS_DONE:
+            raise RuntimeError(item.extract_result.error)
+
+        item.files = get_job_files(item.output_directory, item.job)
+
+    def compress_table(item):
+        item.files, input_stats = compress_table_files(item.files, compression, compression_level
+                                                       , compress_workers, compress_executor)
+        item.artifacts = input_stats
+
+    def checksum_table(item):
+        for file_name in item.files:
+            # same part size as the upload; None for a single PUT
+            part_size = get_upload_part_size(os.path.getsize(file_name), multipart_chunksize * MB
+                                             , DEFAULT_MULTIPART_THRESHOLD * MB, auto_tune_uploads)
+            # one read of the file for all
+            checksums = get_file_checksums(file_name, etag_chunk_sizes=(part_size,) if part_size else ()
+                                           , sha256=True)
+            item.checksums[file_name] = {'md5': checksums.md5_hex, 'part_size': part_size
+                                         , 'etag': checksums.get_etag(part_size) if part_size else checksums.md5_hex}
+            item.artifacts[file_name] = describe_artifact(file_name, checksums, item.artifacts.get(file_name))
+
+    def upload_table(item):
+        for file_name in item.files:
+            key = get_object_key(file_name, top_level_directory, key_prefix)
+            success_code = landing.upload_file_to_bucket_multipart(bucket_name=bucket_name, file_name=file_name
+                                , key=key, multipart_threshold=DEFAULT_MULTIPART_THRESHOLD
+                                , multipart_chunksize=multipart_chunksize
+                                , expected_etag=item.checksums.get(file_name, {}).get('etag')
+                                , auto_tune=auto_tune_uploads, resumable=resumable_uploads)
+            if success_code == -1:
+                raise RuntimeError(f'Upload failed: {file_name} -> s3://{bucket_name}/{key}')
+
+            item.keys[file_name] = key
+
+    stages = [PipelineStage('extract', extract_table, extract_workers, queue_size)]
+    if compression:
+        stages.append(PipelineStage('compress', compress_table, compress_workers, queue_size))
+    stages += [PipelineStage('checksum', checksum_table, checksum_workers, queue_size)
+               , PipelineStage('upload', upload_table, upload_workers, queue_size)]
+
+    return stages
+
+
+def get_table_result(pipeline_result):
+    '''
+        TableExtractResult of a table, failed if any of the stages failed.
+    '''
+    item = pipeline_result.item
+    table_result = item.extract_result or TableExtractResult(schema_name=item.job.schema_name
+                                                             , tbl_name=item.job.tbl_name, status=STATUS_FAILED
+                                                             , row_count=item.job.row_count
+                                                             , reserved_pages=item.job.reserved_pages)
+    table_result.elapsed_seconds = sum(pipeline_result.stage_seconds.values())
+
+    if pipeline_result.failed_stage is not None:
+        table_result.status = STATUS_FAILED
+        if pipeline_result.failed_stage != 'extract' or table_result.error is None:
+            table_result.error = f'{pipeline_result.failed_stage}: {pipeline_result.error}'
+
+    return table_result
+
+
+def extract_and_land(db_name, bucket_name, key_prefix=None, top_level_directory=SOURCE_DATA_PATH
+                     , landing_compression='gzip', landing_compression_level=None
+                     , compress_workers=DEFAULT_COMPRESS_WORKERS, checksum_workers=DEFAULT_CHECKSUM_WORKERS
+                     , upload_workers=DEFAULT_UPLOAD_WORKERS, multipart_chunksize=DEFAULT_MULTIPART_CHUNKSIZE
+                     , queue_size=DEFAULT_QUEUE_SIZE, landing=None, streaming=False, auto_tune_uploads=False
+                     , resumable_uploads=False, **extract_kwargs):
+    '''
+        Extracts the tables of :db_name, as extract(), and lands every table in
+        S3 as soon as it is extracted.
+
+        Parameters
+        ----------------
+        bucket_name              : Landing bucket.
+        key_prefix               : Prefix of all the keys, ex: 'landing/jade'.
+        landing_compression      : 'gzip', 'zstd', 'lz4' or None. Codec of the compress stage,
+                                   for the files not already compressed by extract().
+        compress_workers         : Tables compressed at the same time, and processes
+                                   compressing their blocks.
+        checksum_workers         : Tables checksummed at the same time.
+        upload_workers           : Tables uploaded at the same time. Each upload uses
+                                   several threads itself (see S3_landing).
+        multipart_chunksize      : Part size in MB of the multipart uploads.
+        queue_size               : Tables waiting in front of a stage at most.
+        landing                  : S3_landing to be used; a default one is created otherwise.
+        streaming                : Upload the table data while it is extracted, without
+                                   staging it locally. The data is compressed by the
+                                   extraction with :landing_compression, unless the
+                                   `compression` of extract() is given. Forces the
+                                   'native' `extract_engine`, and no `partitioned_tables`.
+        auto_tune_uploads        : Pick the part size of every file from its size, and
+                                   adapt the parts in flight to the throughput; in
+                                   streaming mode (size unknown) only the latter.
+        resumable_uploads        : Journal the multipart uploads, so that a rerun (ex: with
+                                   resume=True) resumes them instead of uploading the files
+                                   again from the first part. Not with :streaming.
+        extract_kwargs           : Passed on to extract(); ex: max_workers is the number
+                                   of tables extracted at the same time.
+
+        Returns
+        ----------------
+        List of TableExtractResult, one per table; failed if any stage failed.
+    '''
+    landing = landing or S3_landing()
+
+    if streaming:
+        def open_upload_stream(file_name):
+            concurrency = AdaptiveConcurrency(DEFAULT_INITIAL_CONCURRENCY, DEFAULT_MAX_TUNED_CONCURRENCY) \
+                if auto_tune_uploads else None
+            return landing.open_upload_stream(bucket_name, get_object_key(file_name, top_level_directory, key_prefix)
+                                              , multipart_chunksize, concurrency=concurrency)
+
+        extract_kwargs['output_stream_factory'] = open_upload_stream
+        # bcp stages the whole table locally where there is no named pipe
+        extract_kwargs['extract_engine'] = 'native'
+        extract_kwargs['partitioned_tables'] = None
+        extract_kwargs.setdefault('compression', landing_compression)
+        extract_kwargs.setdefault('compression_level', landing_compression_level)
+        # nothing left to compress locally
+        landing_compression = None
+
+    def land_jobs(jobs, output_directory, max_workers, on_start, on_finish):
+        items = [LandingItem(job=job, output_directory=output_directory) for job in jobs]
+        compress_executor = ProcessPoolExecutor(max_workers=compress_workers) if landing_compression else None
+        stages = get_landing_stages(landing, bucket_name, top_level_directory, on_start, key_prefix
+                                    , landing_compression, landing_compression_level, max_workers
+                                    , compress_workers, checksum_workers, upload_workers
+                                    , multipart_chunksize, queue_size, auto_tune_uploads, resumable_uploads
+                                    , compress_executor)
+
+        table_results = {}
+        # streamed data files are never read locally
+        artifacts = None if streaming else ArtifactManifest(output_directory, db_name, landing_compression
+                                                            , resume=extract_kwargs.get('resume', False))
+
+        def on_result(pipeline_result):
+            table_result = get_table_result(pipeline_result)
+            table_results[id(pipeline_result)] = table_result
+            if artifacts is not None:
+                job = pipeline_result.item.job
+                set_row_count(pipeline_result.item.artifacts, table_result.rows_extracted)
+                artifacts.add_table(job.schema_name, job.tbl_name, table_result.status
+                                    , pipeline_result.item.artifacts if table_result.status == STATUS_DONE else None)
+            # MD5s of the checksum stage; the journal does not read the files again
+            on_finish(pipeline_result.item.job, table_result
+                      , checksums={f: c['md5'] for f, c in pipeline_result.item.checksums.items()})
+
+        try:
+            results = [table_results.get(id(r)) or get_table_result(r)
+                       for r in run_pipeline(items, stages, on_result)]
+        finally:
+            if compress_executor is not None:
+                compress_executor.shutdown()
+
+        # written once for all the tables: by the bulk format capture, and as the tables are landed
+        metadata_file_names = [os.path.join(output_directory, SCHEMA_CATALOG_FILE)]
+        if artifacts is not None:
+            metadata_file_names.append(artifacts.file_name)
+
+        for file_name in metadata_file_names:
+            if not os.path.isfile(file_name):
+                continue
+            key = get_object_key(file_name, top_level_directory, key_prefix)
+            if landing.upload_file_to_bucket_multipart(bucket_name=bucket_name, file_name=file_name
+                                                       , key=key, multipart_chunksize=multipart_chunksize) == -1:
+                print(f'Upload failed: {file_name} -> s3://{bucket_name}/{key}')  # TODO: Logging
+
+        return results
+
+    return extract(db_name, top_level_directory=top_level_directory, job_runner=land_jobs, **extract_kwargs)
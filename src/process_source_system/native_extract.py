@@ -0,0 +1,523 @@
+'''
+    In-process extraction engine; alternative to the bcp utility.
+
+    Rows are streamed through a pyodbc cursor in `fetchmany` batches and handed
+    to a row writer running on a separate thread. Thus fetching the next batch
+    from the database overlaps with formatting and writing the previous one,
+    and no process is spawned per table. It also works on hosts where the bcp
+    utility is not installed.
+
+    The size of each batch (cursor.arraysize) is derived from the width of the
+    result set, so that narrow tables are fetched in large batches and wide
+    tables do not blow up memory.
+
+    Output can be compressed (gzip/zstd) while it is written, so the uncompressed
+    file never exists on disk.
+
+    Besides csv, rows can be written as typed Parquet (requires pyarrow). Column
+    types are taken from INFORMATION_SCHEMA.COLUMNS, or from the cursor description
+    when not available. Rows are buffered into row groups of a configurable number
+    of rows and string columns are dictionary encoded.
+
+    pyodbc can not fetch datetimeoffset nor sql_variant values on its own:
+    datetimeoffset values are converted to text by an output converter of the
+    connection, sql_variant columns are cast to nvarchar in the select list.
+'''
+
+import csv
+import io
+import os
+import queue
+import struct
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime, time
+from decimal import Decimal
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # parquet output is optional
+    pyarrow = None
+
+from src.config.definitions import MB
+from src.utils.compression_utility import open_compressed, get_compressed_file_name
+
+
+DEFAULT_BATCH_BYTES = 8 * MB
+MIN_FETCH_SIZE = 1000
+MAX_FETCH_SIZE = 100000
+# used for (n)varchar(max), varbinary(max), xml etc. which report no size
+DEFAULT_COLUMN_WIDTH = 256
+
+# number of fetched batches waiting to be written
+DEFAULT_QUEUE_SIZE = 4
+
+OUTPUT_FORMATS = ('csv', 'parquet')
+DEFAULT_ROW_GROUP_SIZE = 128 * 1024  # rows
+# parquet codec used when no compression is requested
+DEFAULT_PARQUET_COMPRESSION = 'snappy'
+
+# ODBC type of datetimeoffset columns, not supported by pyodbc
+SQL_DATETIMEOFFSET = -155
+
+
+@dataclass
+class NativeExtractResult:
+    '''
+        Outcome of an in-process extraction. Mirrors the `args` and `returncode`
+        attributes of subprocess.CompletedProcess returned by the bcp functions.
+    '''
+    args: str
+    returncode: int
+    row_count: int = 0
+
+
+def estimate_fetch_size(description, target_batch_bytes=DEFAULT_BATCH_BYTES
+                        , min_fetch_size=MIN_FETCH_SIZE, max_fetch_size=MAX_FETCH_SIZE):
+    '''
+        Returns the number of rows to be fetched per batch, such that a batch is
+        roughly :target_batch_bytes big.
+
+        Parameters
+        ----------------
+        description: cursor.description of the executed query. The 4th item of
+                     every column is its internal size.
+    '''
+    row_width = sum(column[3] if column[3] and column[3] > 0 else DEFAULT_COLUMN_WIDTH
+                    for column in description)
+
+    return max(min_fetch_size, min(max_fetch_size, target_batch_bytes // max(row_width, 1)))
+
+
+def format_value(value):
+    '''
+        Renders a single value the way bcp character mode (-c) does as far as
+        possible. NULL is written as empty field.
+    '''
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ', timespec='milliseconds')
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex().upper()
+
+    return value
+
+
+def convert_datetimeoffset(value):
+    '''
+        Output converter of datetimeoffset values (SQL_SS_TIMESTAMPOFFSET_STRUCT);
+        rendered as SQL Server does, ex: '2022-01-30 23:21:18.1234567 +05:30'.
+    '''
+    if value is None:
+        return None
+
+    year, month, day, hour, minute, second, fraction, tz_hour, tz_minute = struct.unpack('<6hI2h', value)
+    sign = '-' if tz_hour < 0 or tz_minute < 0 else '+'
+
+    # fraction is in nanoseconds, datetimeoffset keeps 100ns
+    return (f'{year:04d}-{month:02d}-{day:02d} {hour:02d}:{minute:02d}:{second:02d}.{fraction // 100:07d}'
+            f' {sign}{abs(tz_hour):02d}:{abs(tz_minute):02d}')
+
+
+def add_output_converters(connection):
+    '''
+        Registers the converters of the types pyodbc can not fetch on its own;
+        without them fetching such a column raises.
+    '''
+    connection.add_output_converter(SQL_DATETIMEOFFSET, convert_datetimeoffset)
+
+
+class CsvRowWriter:
+    '''
+        Writes rows as comma delimited text. Fields containing the delimiter,
+        quotes or new lines are quoted, unlike bcp.
+
+        file_name  : File name, or a binary stream (ex: an S3 upload stream).
+        compression: None, 'gzip', 'zstd' or 'lz4'; the file is compressed as it is written.
+    '''
+
+    def __init__(self, file_name, columns=None, delimiter=',', compression=None, compression_level=None):
+        self.file_name = file_name
+        if compression:
+            self.file = open_compressed(file_name, 'wt', compression, compression_level)
+        elif hasattr(file_name, 'write'):
+            self.file = io.TextIOWrapper(file_name, encoding='utf-8', newline='')
+        else:
+            self.file = open(file_name, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file, delimiter=delimiter)
+
+    def write_rows(self, rows):
+        self.writer.writerows([format_value(value) for value in row] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_column_types(connection, db_name, tbl_name, schema_name='dbo'):
+    '''
+        Returns the SQL types of the columns of the table in ordinal order as a
+        list of (column_name, data_type, precision, scale).
+    '''
+    column_type_query =\
+        f'''
+        SELECT COLUMN_NAME, DATA_TYPE
+            , COALESCE(NUMERIC_PRECISION, DATETIME_PRECISION), NUMERIC_SCALE
+        FROM {db_name}.INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?
+        ORDER BY ORDINAL_POSITION
+        ;
+    '''
+    return [tuple(x) for x in
+            connection.cursor()
+            .execute(column_type_query, schema_name, tbl_name)
+            .fetchall()
+            ]
+
+
+def get_select_list(column_types):
+    '''
+        Returns the select list of the columns (see get_column_types); sql_variant
+        columns, which pyodbc can not fetch, are cast to nvarchar(max).
+    '''
+    if not any(data_type.lower() == 'sql_variant' for _, data_type, *_ in column_types):
+        return '*'
+
+    return ', '.join(f'CAST([{name}] AS nvarchar(max)) AS [{name}]' if data_type.lower() == 'sql_variant'
+                     else f'[{name}]' for name, data_type, *_ in column_types)
+
+
+def arrow_type(data_type, precision=None, scale=None):
+    '''
+        Maps a SQL Server data type to a pyarrow type. Types without an exact
+        counterpart (xml, sql_variant, datetimeoffset, ...) are written as string.
+    '''
+    data_type = data_type.lower()
+
+    if data_type == 'bit':
+        return pyarrow.bool_()
+    if data_type == 'tinyint':
+        return pyarrow.uint8()
+    if data_type == 'smallint':
+        return pyarrow.int16()
+    if data_type == 'int':
+        return pyarrow.int32()
+    if data_type == 'bigint':
+        return pyarrow.int64()
+    if data_type in ('decimal', 'numeric'):
+        return pyarrow.decimal128(precision or 18, scale or 0)
+    if data_type == 'money':
+        return pyarrow.decimal128(19, 4)
+    if data_type == 'smallmoney':
+        return pyarrow.decimal128(10, 4)
+    if data_type == 'real':
+        return pyarrow.float32()
+    if data_type == 'float':
+        return pyarrow.float64()
+    if data_type == 'date':
+        return pyarrow.date32()
+    if data_type in ('datetime', 'datetime2', 'smalldatetime'):
+        return pyarrow.timestamp('us')
+    if data_type == 'time':
+        return pyarrow.time64('us')
+    if data_type in ('binary', 'varbinary', 'image', 'timestamp', 'rowversion'):
+        return pyarrow.binary()
+
+    return pyarrow.string()
+
+
+def arrow_type_from_description(column):
+    '''
+        Maps a column of cursor.description (python type, precision, scale) to a
+        pyarrow type. Used when the SQL types are not known.
+    '''
+    type_code, precision, scale = column[1], column[4], column[5]
+
+    if type_code is bool:
+        return pyarrow.bool_()
+    if type_code is int:
+        return pyarrow.int64()
+    if type_code is float:
+        return pyarrow.float64()
+    if type_code is Decimal:
+        return pyarrow.decimal128(precision or 38, scale or 0)
+    if type_code is datetime:
+        return pyarrow.timestamp('us')
+    if type_code is date:
+        return pyarrow.date32()
+    if type_code is time:
+        return pyarrow.time64('us')
+    if type_code in (bytes, bytearray):
+        return pyarrow.binary()
+
+    return pyarrow.string()
+
+
+class ParquetRowWriter:
+    '''
+        Writes rows as Parquet, one row group per :row_group_size rows. String
+        columns are dictionary encoded.
+
+        columns     : cursor.description of the result set.
+        column_types: (column_name, data_type, precision, scale) of every column, in
+                      the order of the result set. Derived from :columns if None.
+        compression : Parquet codec; None -> snappy.
+    '''
+
+    def __init__(self, file_name, columns, column_types=None, row_group_size=DEFAULT_ROW_GROUP_SIZE
+                 , compression=None, compression_level=None):
+        if pyarrow is None:
+            raise ImportError('Parquet output requires the pyarrow package')
+
+        self.file_name = file_name
+        self.row_group_size = row_group_size
+
+        if column_types:
+            fields = [pyarrow.field(c[0], arrow_type(*c[1:])) for c in column_types]
+        else:
+            fields = [pyarrow.field(c[0], arrow_type_from_description(c)) for c in columns]
+
+        self.schema = pyarrow.schema(fields)
+        # values of string columns may come as other python types, ex: uuid, bytes
+        self.as_string = [pyarrow.types.is_string(f.type) for f in fields]
+        self.rows = []
+
+        self.writer = pyarrow.parquet.ParquetWriter(file_name, self.schema
+                        , compression=compression or DEFAULT_PARQUET_COMPRESSION
+                        , compression_level=compression_level, use_dictionary=True)
+
+    def _write_row_group(self, rows):
+        arrays = []
+        for i, (field, as_string) in enumerate(zip(self.schema, self.as_string)):
+            values = [row[i] for row in rows]
+            if as_string:
+                values = [v if v is None or isinstance(v, str) else str(format_value(v)) for v in values]
+            arrays.append(pyarrow.array(values, type=field.type))
+
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def write_rows(self, rows):
+        self.rows.extend(rows)
+        while len(self.rows) >= self.row_group_size:
+            self._write_row_group(self.rows[:self.row_group_size])
+            self.rows = self.rows[self.row_group_size:]
+
+    def close(self):
+        try:
+            if self.rows:
+                self._write_row_group(self.rows)
+                self.rows = []
+        finally:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_output_file_name(outputfile_path, tbl_name, output_format='csv', compression=None):
+    '''
+        outputfile_path/tbl_name.csv[.gz|.zst] or outputfile_path/tbl_name.parquet
+        Parquet is compressed internally, thus never gets a codec extension.
+    '''
+    file_name = os.path.join(outputfile_path, f'{tbl_name}.{output_format}')
+    if output_format == 'parquet':
+        return file_name
+
+    return get_compressed_file_name(file_name, compression)
+
+
+def open_row_writer(file_name, columns=None, output_format='csv', compression=None, compression_level=None
+                    , column_types=None, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    '''
+        Returns a row writer for the requested output format.
+
+        columns     : cursor.description of the result set to be written.
+        column_types: SQL types of the columns, see get_column_types(). Parquet only.
+    '''
+    if output_format == 'csv':
+        return CsvRowWriter(file_name, columns, compression=compression, compression_level=compression_level)
+    if output_format == 'parquet':
+        return ParquetRowWriter(file_name, columns, column_types, row_group_size
+                    , compression=compression, compression_level=compression_level)
+
+    raise ValueError(f'Output format not supported: {output_format}')
+
+
+def stream_rows(cursor, writer, fetch_size, queue_size=DEFAULT_QUEUE_SIZE):
+    '''
+        Fetches all rows of an executed cursor in batches of :fetch_size and
+        writes them using :writer on a separate thread.
+
+        Returns
+        ----------------
+        Number of rows written.
+    '''
+    batches = queue.Queue(maxsize=queue_size)
+    errors = []
+
+    def write():
+        while True:
+            rows = batches.get()
+            if rows is None:
+                break
+            # after an error keep consuming, so that the fetching side never blocks
+            if not errors:
+                try:
+                    writer.write_rows(rows)
+                except Exception as e:
+                    errors.append(e)
+
+    writer_thread = threading.Thread(target=write, name='row-writer', daemon=True)
+    writer_thread.start()
+
+    row_count = 0
+    try:
+        while not errors:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            row_count += len(rows)
+            batches.put(rows)
+    finally:
+        batches.put(None)
+        writer_thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return row_count
+
+
+def extract_query(connection, query, params, output_file_name, fetch_size=None, output_format='csv'
+                  , compression=None, compression_level=None, column_types=None
+                  , row_group_size=DEFAULT_ROW_GROUP_SIZE, output_stream_factory=None):
+    '''
+        Executes the query and streams the result into :output_file_name.
+        The file is first written as output_file_name.tmp and renamed once
+        complete, so a failed extract never leaves a partial file behind.
+
+        With :output_stream_factory, the result is written into the stream
+        returned by output_stream_factory(output_file_name) (ex: an S3 upload
+        stream) instead, and nothing is written to local disk. The stream's
+        context exits with the exception of a failed extract, if any.
+
+        Parameters
+        ----------------
+        connection      : pyodbc connection; not closed.
+        query           : SELECT statement, may contain ? placeholders.
+        params          : Sequence of values for the placeholders.
+        output_file_name: Fully qualified name of the output file.
+        fetch_size      : Rows per fetchmany batch. Derived from the width of the
+                          result set if not provided.
+        output_format   : 'csv' or 'parquet'.
+        compression     : None, 'gzip', 'zstd' or 'lz4'. :output_file_name should carry the
+                          matching extension, see get_output_file_name().
+        column_types    : SQL types of the result set columns; parquet only.
+        row_group_size  : Rows per parquet row group.
+
+        Returns
+        ----------------
+        Number of rows extracted.
+    '''
+    add_output_converters(connection)
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, *params)
+
+        # array fetch size; used by fetchmany
+        cursor.arraysize = fetch_size or estimate_fetch_size(cursor.description)
+
+        if output_stream_factory is not None:
+            with output_stream_factory(output_file_name) as output_stream:
+                with open_row_writer(output_stream, cursor.description, output_format
+                                     , compression, compression_level, column_types, row_group_size) as writer:
+                    return stream_rows(cursor, writer, cursor.arraysize)
+
+        temp_file_name = output_file_name + '.tmp'
+        try:
+            with open_row_writer(temp_file_name, cursor.description, output_format
+                                 , compression, compression_level, column_types, row_group_size) as writer:
+                row_count = stream_rows(cursor, writer, cursor.arraysize)
+        except Exception as e:
+            if os.path.exists(temp_file_name):
+                os.remove(temp_file_name)
+            raise e
+
+        os.replace(temp_file_name, output_file_name)
+
+        return row_count
+
+    finally:
+        cursor.close()
+
+
+def native_full_extract(connection, db_name, tbl_name, outputfile_path, schema_name='dbo'
+                        , fetch_size=None, output_format='csv', compression=None, compression_level=None
+                        , row_group_size=DEFAULT_ROW_GROUP_SIZE, output_stream_factory=None):
+    '''
+        In-process equivalent of db_dump_full_extract. Dumps the whole table into
+        outputfile_path/tbl_name.csv (.gz / .zst when compressed) or tbl_name.parquet
+
+        Returns
+        ----------------
+        NativeExtractResult
+    '''
+    full_outputFileName = get_output_file_name(outputfile_path, tbl_name, output_format, compression)
+
+    column_types = get_column_types(connection, db_name, tbl_name, schema_name)
+
+    query = f'SELECT {get_select_list(column_types)} FROM {db_name}.{schema_name}.{tbl_name}'
+
+    row_count = extract_query(connection, query, [], full_outputFileName, fetch_size, output_format, compression, compression_level
+                    , column_types if output_format == 'parquet' else None, row_group_size, output_stream_factory)
+
+    return NativeExtractResult(args=full_outputFileName, returncode=0, row_count=row_count)
+
+
+def native_incremental_extract(connection, db_name, tbl_name, last_extract_time, lte_column
+                               , current_extract_time, outputfile_path, schema_name='dbo'
+                               , fetch_size=None, output_format='csv', compression=None, compression_level=None
+                               , row_group_size=DEFAULT_ROW_GROUP_SIZE, output_stream_factory=None):
+    '''
+        In-process equivalent of db_dump_incremental_extract. Dumps the rows with
+        last_extract_time < lte_column <= current_extract_time into
+        outputfile_path/tbl_name.csv. The bounds are passed as query parameters.
+        If last_extract_time is None, every row up to current_extract_time is dumped.
+
+        Returns
+        ----------------
+        NativeExtractResult
+    '''
+    if last_extract_time is not None and not last_extract_time < current_extract_time:
+        raise ValueError(f'Last extract time {last_extract_time} is greater than current extract time {current_extract_time}')
+
+    full_outputFileName = get_output_file_name(outputfile_path, tbl_name, output_format, compression)
+
+    column_types = get_column_types(connection, db_name, tbl_name, schema_name)
+
+    query = f'SELECT {get_select_list(column_types)} FROM {db_name}.{schema_name}.{tbl_name} WHERE [{lte_column}] <= ?'
+    params = [current_extract_time]
+    if last_extract_time is not None:
+        query += f' AND [{lte_column}] > ?'
+        params.append(last_extract_time)
+
+    row_count = extract_query(connection, query, params, full_outputFileName, fetch_size, output_format
+                    , compression, compression_level, column_types if output_format == 'parquet' else None
+                    , row_group_size, output_stream_factory)
+
+    return NativeExtractResult(args=full_outputFileName, returncode=0, row_count=row_count)
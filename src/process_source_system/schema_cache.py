@@ -0,0 +1,149 @@
+'''
+    Cache of table schema fingerprints, so that format files are only
+    regenerated when the schema of a table has changed.
+
+    The fingerprint of a table is a hash of its column definitions (name, type,
+    length, precision, scale, nullability and collation). For every
+    db/schema/table the cache keeps the fingerprint and the format file last
+    written for it. When the fingerprint is unchanged, the previous format file
+    is hard-linked (or copied, where links are not possible) into the new
+    output directory instead of being dumped again.
+
+    Like the watermark store, the cache is a SQLite database
+    (source_system_data/schema_cache.db by default) and can be shared by the
+    extraction worker threads.
+'''
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+
+from src.process_source_system import SOURCE_DATA_PATH
+from src.utils import date_utility
+
+
+DEFAULT_SCHEMA_CACHE_FILE = os.path.join(SOURCE_DATA_PATH, 'schema_cache.db')
+
+# seconds to wait for a concurrent writer to finish
+LOCK_TIMEOUT = 30
+
+
+def get_fingerprint(columns):
+    '''
+        Returns the sha256 (hex) of the column definitions of a table.
+
+        columns: list of schema_capture.ColumnDefinition in column order.
+    '''
+    definition = [(c.name, c.data_type, c.max_length, c.precision, c.scale, c.is_nullable, c.collation_name)
+                  for c in columns]
+
+    return hashlib.sha256(json.dumps(definition).encode('utf-8')).hexdigest()
+
+
+def reuse_file(previous_file_name, file_name):
+    '''
+        Makes :file_name the same file as :previous_file_name, by a hard link or a
+        copy. Returns False if the previous file no longer exists.
+    '''
+    if not os.path.isfile(previous_file_name):
+        return False
+    if os.path.exists(file_name) and os.path.samefile(previous_file_name, file_name):
+        return True
+
+    directory = os.path.dirname(file_name)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if os.path.exists(file_name):
+        os.remove(file_name)
+
+    try:
+        os.link(previous_file_name, file_name)
+    except OSError:  # other file system, or links not supported
+        shutil.copy2(previous_file_name, file_name)
+
+    return True
+
+
+class SchemaCache:
+    '''
+        Usage:
+            cache = SchemaCache()
+            if not cache.reuse('jade', 'dbo', 'sales', fingerprint, format_file_name):
+                ...  # dump the format file
+                cache.set('jade', 'dbo', 'sales', fingerprint, format_file_name)
+    '''
+
+    def __init__(self, file_name=DEFAULT_SCHEMA_CACHE_FILE):
+        self.file_name = file_name
+
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_fingerprints (
+                        db_name TEXT NOT NULL
+                        , schema_name TEXT NOT NULL
+                        , tbl_name TEXT NOT NULL
+                        , fingerprint TEXT NOT NULL
+                        , format_file TEXT NOT NULL
+                        , updated_at TEXT NOT NULL
+                        , PRIMARY KEY (db_name, schema_name, tbl_name)
+                    )
+                ''')
+        finally:
+            connection.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.file_name, timeout=LOCK_TIMEOUT)
+
+    def get(self, db_name, schema_name, tbl_name):
+        '''
+            Returns (fingerprint, format_file) last recorded for the table, None
+            if the table is not cached.
+        '''
+        connection = self._connect()
+        try:
+            row = connection.execute('''
+                SELECT fingerprint, format_file FROM schema_fingerprints
+                WHERE db_name = ? AND schema_name = ? AND tbl_name = ?
+            ''', (db_name, schema_name, tbl_name)).fetchone()
+        finally:
+            connection.close()
+
+        return tuple(row) if row else None
+
+    def set(self, db_name, schema_name, tbl_name, fingerprint, format_file):
+        '''
+            Records :format_file as the format of the table with :fingerprint.
+            Should only be called once the format file has been written.
+        '''
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('''
+                    INSERT INTO schema_fingerprints (db_name, schema_name, tbl_name, fingerprint, format_file, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (db_name, schema_name, tbl_name)
+                    DO UPDATE SET fingerprint = excluded.fingerprint, format_file = excluded.format_file
+                        , updated_at = excluded.updated_at
+                ''', (db_name, schema_name, tbl_name, fingerprint, os.path.abspath(format_file)
+                      , date_utility.get_current_date_time()))
+        finally:
+            connection.close()
+
+    def reuse(self, db_name, schema_name, tbl_name, fingerprint, format_file_name):
+        '''
+            Links the cached format file of the table to :format_file_name if the
+            schema is unchanged. Returns False if the format has to be dumped.
+        '''
+        cached = self.get(db_name, schema_name, tbl_name)
+        if cached is None or cached[0] != fingerprint:
+            return False
+
+        return reuse_file(cached[1], format_file_name)
@@ -0,0 +1,238 @@
+'''
+    Captures the column definitions of many tables with a single catalog query,
+    instead of running one `bcp ... format null -x` process (and login) per table.
+
+    From the captured definitions the same XML format files bcp would write for
+    character mode (-c -t",") are rendered locally, one tbl_name_format.xml per
+    table, plus a single JSON catalog of all the captured tables. With a schema
+    cache, the format files of tables whose schema did not change are linked
+    from the previous run instead of being rendered again.
+'''
+
+import json
+import os
+from dataclasses import dataclass, asdict
+from xml.sax.saxutils import quoteattr
+
+from src.utils import date_utility
+from src.process_source_system.schema_cache import get_fingerprint
+
+
+FORMAT_NAMESPACE = 'http://schemas.microsoft.com/sqlserver/2004/bulkload/format'
+XSI_NAMESPACE = 'http://www.w3.org/2001/XMLSchema-instance'
+
+DEFAULT_FIELD_TERMINATOR = ','
+DEFAULT_ROW_TERMINATOR = r'\r\n'  # as written by bcp in the format file
+
+SCHEMA_CATALOG_FILE = 'schema_catalog.json'
+
+# SQL type -> xsi:type of the ROW/COLUMN element
+BCP_COLUMN_TYPES = {
+    'bit': 'SQLBIT', 'tinyint': 'SQLTINYINT', 'smallint': 'SQLSMALLINT', 'int': 'SQLINT'
+    , 'bigint': 'SQLBIGINT', 'decimal': 'SQLDECIMAL', 'numeric': 'SQLNUMERIC'
+    , 'money': 'SQLMONEY', 'smallmoney': 'SQLMONEY4', 'float': 'SQLFLT8', 'real': 'SQLFLT4'
+    , 'datetime': 'SQLDATETIME', 'smalldatetime': 'SQLDATETIM4', 'date': 'SQLDATE'
+    , 'time': 'SQLTIME', 'datetime2': 'SQLDATETIME2', 'datetimeoffset': 'SQLDATETIMEOFFSET'
+    , 'char': 'SQLCHAR', 'varchar': 'SQLVARYCHAR', 'text': 'SQLTEXT'
+    , 'nchar': 'SQLNCHAR', 'nvarchar': 'SQLNVARCHAR', 'ntext': 'SQLNTEXT'
+    , 'binary': 'SQLBINARY', 'varbinary': 'SQLVARYBIN', 'image': 'SQLIMAGE'
+    , 'timestamp': 'SQLBINARY', 'uniqueidentifier': 'SQLUNIQUEID', 'sql_variant': 'SQLVARIANT'
+    , 'xml': 'SQLNTEXT'
+}
+
+# SQL type -> MAX_LENGTH of the character field; other types use the column length
+CHARACTER_LENGTHS = {
+    'bit': 1, 'tinyint': 5, 'smallint': 7, 'int': 12, 'bigint': 19
+    , 'decimal': 41, 'numeric': 41, 'money': 30, 'smallmoney': 30, 'float': 30, 'real': 30
+    , 'datetime': 24, 'smalldatetime': 24, 'date': 11, 'time': 16, 'datetime2': 27
+    , 'datetimeoffset': 34, 'uniqueidentifier': 37, 'timestamp': 16, 'sql_variant': 8000
+}
+
+BINARY_TYPES = ('binary', 'varbinary', 'image', 'timestamp')
+
+
+@dataclass
+class ColumnDefinition:
+    '''
+        Definition of a column as read from sys.columns.
+
+        max_length: length in bytes, -1 for (max) types.
+    '''
+    column_id: int
+    name: str
+    data_type: str
+    max_length: int
+    precision: int
+    scale: int
+    is_nullable: bool
+    collation_name: str = None
+
+
+def get_table_schemas(connection, db_name, schemas=['dbo'], table_names=None):
+    '''
+        Reads the columns of all the tables of :schemas, or only of :table_names,
+        in one query.
+
+        Returns
+        ----------------
+        dict of (schema_name, tbl_name) -> list of ColumnDefinition in column order.
+    '''
+    schema_placeholders = ', '.join('?' for _ in schemas)
+    columns_query =\
+        f'''
+        SELECT s.name, t.name, c.column_id, c.name
+            , TYPE_NAME(c.system_type_id), c.max_length, c.precision, c.scale
+            , c.is_nullable, c.collation_name
+        FROM {db_name}.sys.columns AS c
+            JOIN {db_name}.sys.tables AS t ON t.object_id = c.object_id
+            JOIN {db_name}.sys.schemas AS s ON s.schema_id = t.schema_id
+        WHERE s.name IN ({schema_placeholders})
+    '''
+    params = list(schemas)
+
+    if table_names:
+        columns_query += f" AND t.name IN ({', '.join('?' for _ in table_names)})"
+        params += list(table_names)
+
+    columns_query += ' ORDER BY s.name, t.name, c.column_id;'
+
+    table_schemas = {}
+    for row in connection.cursor().execute(columns_query, *params).fetchall():
+        table_schemas.setdefault((row[0], row[1]), []).append(
+            ColumnDefinition(column_id=row[2], name=row[3], data_type=row[4], max_length=row[5]
+                             , precision=row[6], scale=row[7], is_nullable=bool(row[8])
+                             , collation_name=row[9]))
+
+    return table_schemas
+
+
+def get_character_length(column):
+    '''
+        Returns the MAX_LENGTH of the character mode field of :column; None for
+        (max) and LOB types, which have no maximum.
+    '''
+    if column.data_type in CHARACTER_LENGTHS:
+        return CHARACTER_LENGTHS[column.data_type]
+    if column.max_length == -1 or column.data_type in ('text', 'ntext', 'image', 'xml'):
+        return None
+    if column.data_type in BINARY_TYPES:
+        # two hex digits per byte
+        return column.max_length * 2
+
+    return column.max_length
+
+
+def render_format_xml(columns, field_terminator=DEFAULT_FIELD_TERMINATOR, row_terminator=DEFAULT_ROW_TERMINATOR):
+    '''
+        Renders the XML format file of a table in character mode, the same as
+        `bcp tbl format null -c -x -t","`.
+    '''
+    fields, row_columns = [], []
+
+    for i, column in enumerate(columns, start=1):
+        terminator = row_terminator if i == len(columns) else field_terminator
+        field = f'  <FIELD ID="{i}" xsi:type="CharTerm" TERMINATOR={quoteattr(terminator)}'
+
+        max_length = get_character_length(column)
+        if max_length is not None:
+            field += f' MAX_LENGTH="{max_length}"'
+        if column.collation_name:
+            field += f' COLLATION="{column.collation_name}"'
+        fields.append(field + '/>')
+
+        row_column = (f'  <COLUMN SOURCE="{i}" NAME={quoteattr(column.name)}'
+                      f' xsi:type="{BCP_COLUMN_TYPES.get(column.data_type, "SQLCHAR")}"')
+        if column.data_type in ('decimal', 'numeric'):
+            row_column += f' PRECISION="{column.precision}" SCALE="{column.scale}"'
+        elif column.data_type in ('datetime2', 'time', 'datetimeoffset'):
+            row_column += f' SCALE="{column.scale}"'
+        if column.is_nullable:
+            row_column += ' NULLABLE="YES"'
+        row_columns.append(row_column + '/>')
+
+    return '\n'.join([
+        '<?xml version="1.0"?>'
+        , f'<BCPFORMAT xmlns="{FORMAT_NAMESPACE}" xmlns:xsi="{XSI_NAMESPACE}">'
+        , ' <RECORD>', *fields, ' </RECORD>'
+        , ' <ROW>', *row_columns, ' </ROW>'
+        , '</BCPFORMAT>'
+        , ''
+    ])
+
+
+def get_format_file_name(outputfile_path, tbl_name):
+    '''
+        outputfile_path/tbl_name_format.xml, same as dump_table_format
+    '''
+    return os.path.join(outputfile_path, f'{tbl_name}_format.xml')
+
+
+def write_format_file(outputfile_path, tbl_name, columns):
+    '''
+        Renders and writes the format file of the table, returns its name.
+    '''
+    format_file_name = get_format_file_name(outputfile_path, tbl_name)
+    # replace rather than overwrite; the file may be hard-linked to a previous run
+    with open(format_file_name + '.tmp', 'w') as f:
+        f.write(render_format_xml(columns))
+    os.replace(format_file_name + '.tmp', format_file_name)
+
+    return format_file_name
+
+
+def write_schema_catalog(outputfile_path, db_name, table_schemas):
+    '''
+        Writes schema_catalog.json with the columns of all the captured tables and
+        returns its file name.
+    '''
+    catalog = {
+        'db_name': db_name
+        , 'created_at': date_utility.get_current_date_time()
+        , 'tables': [
+            {'schema_name': schema_name, 'tbl_name': tbl_name
+             , 'columns': [asdict(column) for column in columns]}
+            for (schema_name, tbl_name), columns in table_schemas.items()
+        ]
+    }
+
+    catalog_file_name = os.path.join(outputfile_path, SCHEMA_CATALOG_FILE)
+    with open(catalog_file_name, 'w') as f:
+        json.dump(catalog, f, indent=2)
+
+    return catalog_file_name
+
+
+def capture_schemas(connection, db_name, outputfile_path, schemas=['dbo'], table_names=None, schema_cache=None
+                    , schema_directories=False):
+    '''
+        Captures the schemas of the tables with one query and writes a format file
+        per table plus the schema catalog into :outputfile_path.
+
+        schema_cache      : SchemaCache; format files of unchanged tables are reused.
+        schema_directories: Write the format files of every schema into its own
+                            subdirectory, outputfile_path/schema_name; tables of
+                            different schemas may have the same name.
+
+        Returns
+        ----------------
+        dict of (schema_name, tbl_name) -> list of ColumnDefinition
+    '''
+    table_schemas = get_table_schemas(connection, db_name, schemas, table_names)
+
+    os.makedirs(outputfile_path, exist_ok=True)
+    for (schema_name, tbl_name), columns in table_schemas.items():
+        format_file_path = os.path.join(outputfile_path, schema_name) if schema_directories else outputfile_path
+        os.makedirs(format_file_path, exist_ok=True)
+
+        if schema_cache is None:
+            write_format_file(format_file_path, tbl_name, columns)
+            continue
+
+        fingerprint = get_fingerprint(columns)
+        if not schema_cache.reuse(db_name, schema_name, tbl_name, fingerprint
+                                  , get_format_file_name(format_file_path, tbl_name)):
+            format_file_name = write_format_file(format_file_path, tbl_name, columns)
+            schema_cache.set(db_name, schema_name, tbl_name, fingerprint, format_file_name)
+    write_schema_catalog(outputfile_path, db_name, table_schemas)
+
+    return table_schemas
@@ -0,0 +1,236 @@
+'''
+    Per table compressed artifacts, described by a manifest.
+
+    Instead of one zip of all the extracted files (see dump_zipped_file), every
+    data file of a table is compressed on its own, next to it, as soon as the
+    table is extracted: top_level_directory/yyyymmdd/db_name/tbl_name.csv.gz.
+    The files of the tables can then be uploaded in parallel, and a consumer
+    downloads only the tables it needs.
+
+    artifact_manifest.json, in the same directory, lists the files of every
+    table with their sizes, row counts and checksums:
+
+        {"db_name": "jade", "compression": "gzip", "created_at": "...",
+         "tables": {"dbo.sales": {"status": "done", "updated_at": "...", "files": {
+            "sales.csv.gz": {"kind": "data", "bytes": 1024, "md5": "...", "sha256": "..."
+                             , "uncompressed_bytes": 4096, "uncompressed_md5": "...", "lines": 100
+                             , "rows": 100},
+            "sales_format.xml": {"kind": "format", "bytes": 512, "md5": "...", "sha256": "..."}}}}}
+
+    - rows : rows written by the extraction, when the engine reports it (native
+             engine, see TableExtractResult.rows_extracted); the table then has a
+             single data file. Left out otherwise, ex: bcp.
+    - lines: line terminators of the files compressed here. Not a row count: a
+             quoted csv field may hold new lines (see native_extract.CsvRowWriter).
+
+    Files compressed by the extraction itself, parquet files, format files and
+    manifests are described by their sizes and checksums only.
+'''
+
+import hashlib
+import json
+import os
+import threading
+
+from src.utils import date_utility
+from src.utils.compression_utility import compress_files_parallel, get_compressed_file_name, open_compressed
+from src.utils.compression_utility import COMPRESSION_EXTENSIONS, STREAM_BUFFER_SIZE
+from src.utils.common_utils.checksum_utility import get_file_checksums
+from src.process_source_system.extract_scheduler import STATUS_DONE
+from src.process_source_system.extract_journal import get_table_files
+from src.process_source_system.table_partitioning import update_manifest_files
+
+
+ARTIFACT_MANIFEST_FILE = 'artifact_manifest.json'
+
+# files which are never compressed again
+COMPRESSED_EXTENSIONS = tuple(COMPRESSION_EXTENSIONS.values()) + ('.parquet', '.zip')
+METADATA_SUFFIXES = ('_format.xml', '.manifest.json')
+
+
+def should_compress(file_name):
+    return not file_name.endswith(COMPRESSED_EXTENSIONS + METADATA_SUFFIXES)
+
+
+def get_file_kind(file_name):
+    '''
+        'format', 'manifest' or 'data'
+    '''
+    if file_name.endswith('_format.xml'):
+        return 'format'
+    if file_name.endswith('.manifest.json'):
+        return 'manifest'
+
+    return 'data'
+
+
+class _InputStats:
+    '''
+        Size, MD5 and line terminators of an uncompressed file, fed with consecutive blocks.
+    '''
+
+    def __init__(self):
+        self.size_bytes = 0
+        self.md5 = hashlib.md5()
+        self.lines = 0
+
+    def update(self, block):
+        if not block:
+            return
+        self.size_bytes += len(block)
+        self.md5.update(block)
+        self.lines += block.count(b'\n')
+
+    def describe(self):
+        return {'uncompressed_bytes': self.size_bytes, 'uncompressed_md5': self.md5.hexdigest(), 'lines': self.lines}
+
+
+def compress_table_files(file_names, compression='gzip', compression_level=None, max_workers=None
+                         , executor=None, remove_input=True):
+    '''
+        Compresses every data file of a table on its own, next to it; format files,
+        manifests and files already compressed are kept as they are. The slices
+        listed in the manifest of a partitioned extract are updated to the
+        compressed files.
+
+        Parameters
+        ----------------
+        file_names       : Files of the table, ex: from extract_journal.get_table_files.
+        compression      : 'gzip', 'zstd' or 'lz4'.
+        max_workers      : Processes compressing the blocks, with :executor.
+        executor         : Process pool compressing the blocks of the files (see
+                           compress_files_parallel), ex: one shared by all the tables;
+                           without it the files are compressed by the calling thread.
+        remove_input     : Remove every uncompressed file once compressed.
+
+        Returns
+        ----------------
+        (list of the file names after compression
+         , dict of compressed file name -> {'uncompressed_bytes':..., 'uncompressed_md5':..., 'lines':...})
+    '''
+    input_file_names = [f for f in file_names if should_compress(f)]
+    stats = {file_name: _InputStats() for file_name in input_file_names}
+
+    if executor is not None:
+        compressed_file_names = compress_files_parallel(input_file_names, compression, compression_level
+                                    , max_workers=max_workers, executor=executor, remove_input=remove_input
+                                    , block_callback=lambda file_name, block: stats[file_name].update(block))
+    else:
+        compressed_file_names = {}
+        for file_name in input_file_names:
+            compressed_file_name = get_compressed_file_name(file_name, compression)
+            with open(file_name, 'rb') as f, open_compressed(compressed_file_name, 'wb', compression
+                                                             , compression_level) as out:
+                for block in iter(lambda: f.read(STREAM_BUFFER_SIZE), b''):
+                    stats[file_name].update(block)
+                    out.write(block)
+            if remove_input:
+                os.remove(file_name)
+            compressed_file_names[file_name] = compressed_file_name
+
+    for file_name in file_names:
+        if compressed_file_names and get_file_kind(file_name) == 'manifest':
+            update_manifest_files(file_name, compressed_file_names)
+
+    files = [compressed_file_names.get(file_name, file_name) for file_name in file_names]
+    input_stats = {compressed_file_names[file_name]: stats[file_name].describe() for file_name in input_file_names}
+
+    return files, input_stats
+
+
+def describe_artifact(file_name, checksums=None, input_stats=None):
+    '''
+        Manifest entry of a file.
+
+        checksums  : FileChecksums of the file, with sha256, if already calculated;
+                     the file is read otherwise.
+        input_stats: Stats of the uncompressed file, as returned by compress_table_files.
+    '''
+    if checksums is None or checksums.sha256 is None:
+        checksums = get_file_checksums(file_name, etag_chunk_sizes=(), sha256=True)
+
+    return {'kind': get_file_kind(file_name), 'bytes': checksums.size_bytes
+            , 'md5': checksums.md5_hex, 'sha256': checksums.sha256, **(input_stats or {})}
+
+
+def set_row_count(files, row_count):
+    '''
+        Records :row_count, as reported by the extraction, on the data file of a
+        table; left out if unknown or if the table has several data files.
+
+        files: dict of file name -> manifest entry, updated in place.
+    '''
+    data_entries = [entry for entry in files.values() if entry['kind'] == 'data']
+    if row_count is not None and len(data_entries) == 1:
+        data_entries[0]['rows'] = row_count
+
+
+class ArtifactManifest:
+    '''
+        artifact_manifest.json of one database extracted into :output_directory.
+        Tables are added from the worker threads as soon as they are done; the
+        manifest is rewritten atomically every time.
+
+        resume: Keep the tables of the previous run, ex: skipped by a resumed extract.
+    '''
+
+    def __init__(self, output_directory, db_name, compression=None, resume=False):
+        self.output_directory = output_directory
+        self.file_name = os.path.join(output_directory, ARTIFACT_MANIFEST_FILE)
+        self._lock = threading.Lock()
+
+        self.manifest = None
+        if resume and os.path.isfile(self.file_name):
+            with open(self.file_name) as f:
+                self.manifest = json.load(f)
+
+        if self.manifest is None:
+            self.manifest = {'db_name': db_name, 'compression': compression
+                             , 'created_at': date_utility.get_current_date_time(), 'tables': {}}
+
+    def _write(self):
+        '''
+            Writes the manifest atomically. Caller holds the lock.
+        '''
+        os.makedirs(self.output_directory, exist_ok=True)
+
+        with open(self.file_name + '.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(self.file_name + '.tmp', self.file_name)
+
+    def add_table(self, schema_name, tbl_name, status, files=None):
+        '''
+            Records a table.
+
+            files: dict of file name -> manifest entry (see describe_artifact);
+                   listed relative to the output directory.
+        '''
+        with self._lock:
+            self.manifest['tables'][f'{schema_name}.{tbl_name}'] = {
+                'status': status
+                , 'updated_at': date_utility.get_current_date_time()
+                , 'files': {os.path.relpath(file_name, self.output_directory): entry
+                            for file_name, entry in (files or {}).items()}
+            }
+            self._write()
+
+    def compress_table(self, schema_name, tbl_name, compression='gzip', compression_level=None
+                       , max_workers=None, executor=None, row_count=None, output_subdirectory=None):
+        '''
+            Compresses the files of a table just extracted (see compress_table_files)
+            and records them. Returns dict of file name -> manifest entry.
+
+            row_count          : Rows written by the extraction, if reported.
+            output_subdirectory: Directory of the files of the table, relative to the
+                                 output directory (see ExtractJob).
+        '''
+        file_names = get_table_files(os.path.join(self.output_directory, output_subdirectory or '')
+                                     , tbl_name)
+        file_names, input_stats = compress_table_files(file_names, compression, compression_level
+                                                       , max_workers, executor)
+
+        files = {f: describe_artifact(f, input_stats=input_stats.get(f)) for f in file_names}
+        set_row_count(files, row_count)
+        self.add_table(schema_name, tbl_name, STATUS_DONE, files)
+
+        return files
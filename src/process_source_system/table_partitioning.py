@@ -0,0 +1,280 @@
+'''
+    Splits a single table into key ranges, so that a very large table can be
+    extracted by several bcp `queryout` processes at the same time.
+
+    The key is the leading column of the clustered index, or of the primary key
+    when the table is a heap. Range boundaries are taken from the statistics
+    histogram of that index (sys.dm_db_stats_histogram), so every slice holds
+    roughly the same number of rows. When the histogram is not available, integer
+    keys are split evenly between MIN() and MAX().
+
+    Boundaries only need to be consistent, not exact: slice i holds the keys
+    in (boundary[i-1], boundary[i]], the first slice also holds NULL keys and
+    the last slice is unbounded. Thus every row lands in exactly one slice.
+'''
+
+import json
+import os
+
+from src.utils import date_utility
+
+
+INTEGER_TYPES = ('tinyint', 'smallint', 'int', 'bigint')
+NUMERIC_TYPES = ('decimal', 'numeric', 'money', 'smallmoney', 'float', 'real')
+DATE_TYPES = ('date', 'datetime', 'datetime2', 'smalldatetime', 'datetimeoffset', 'time')
+STRING_TYPES = ('char', 'varchar', 'nchar', 'nvarchar', 'uniqueidentifier')
+
+DEFAULT_NUM_PARTITIONS = 8
+
+
+def get_partition_key(db_name, tbl_name, connection, schema_name='dbo'):
+    '''
+        Returns (column_name, data_type, index_id) of the leading column of the
+        clustered index, or of the primary key if the table has no clustered index.
+        Returns None if the table has neither.
+    '''
+    partition_key_query =\
+        f'''
+        SELECT TOP 1 c.name, ty.name, i.index_id
+        FROM {db_name}.sys.indexes AS i
+            INNER JOIN {db_name}.sys.index_columns AS ic
+                ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+            INNER JOIN {db_name}.sys.columns AS c
+                ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+            INNER JOIN {db_name}.sys.types AS ty ON ty.user_type_id = c.system_type_id
+        WHERE i.object_id = OBJECT_ID(?)
+            AND ic.key_ordinal = 1
+            AND (i.type = 1 OR i.is_primary_key = 1)
+        ORDER BY i.type
+        ;
+    '''
+    row = connection.cursor().execute(partition_key_query, f'{db_name}.{schema_name}.{tbl_name}').fetchone()
+
+    return tuple(row) if row else None
+
+
+def _boundary_expression(data_type, expression):
+    '''
+        Converts a key value (or histogram sql_variant) in SQL to a type that can be
+        fetched by pyodbc and rendered back as a literal.
+    '''
+    if data_type in INTEGER_TYPES:
+        return f'CAST({expression} AS bigint)'
+    if data_type in NUMERIC_TYPES:
+        return f'CONVERT(varchar(64), {expression})'
+    if data_type in DATE_TYPES:
+        # ISO8601, independent of the language and dateformat settings
+        return f'CONVERT(varchar(64), {expression}, 126)'
+    if data_type in STRING_TYPES:
+        return f'CONVERT(nvarchar(4000), {expression})'
+
+    raise ValueError(f'Key of data type {data_type} can not be range partitioned')
+
+
+def sql_literal(value, data_type):
+    '''
+        Renders a boundary value as a T-SQL literal for the provided key data type.
+    '''
+    if data_type in INTEGER_TYPES or data_type in NUMERIC_TYPES:
+        return str(value)
+    if data_type in DATE_TYPES:
+        return "'" + str(value) + "'"
+
+    # string like; escape single quotes
+    return "N'" + str(value).replace("'", "''") + "'"
+
+
+def get_histogram(db_name, tbl_name, connection, data_type, index_id, schema_name='dbo'):
+    '''
+        Returns the statistics histogram of the index as a list of
+        (range_high_key, rows up to and including the key) ordered by key.
+        Returns an empty list if statistics are not available.
+    '''
+    histogram_query =\
+        f'''
+        SELECT {_boundary_expression(data_type, 'h.range_high_key')}, h.range_rows + h.equal_rows
+        FROM {db_name}.sys.dm_db_stats_histogram(OBJECT_ID(?), ?) AS h
+        ORDER BY h.step_number
+        ;
+    '''
+    try:
+        return [(x[0], x[1]) for x in
+                connection.cursor()
+                .execute(histogram_query, f'{db_name}.{schema_name}.{tbl_name}', index_id)
+                .fetchall()
+                ]
+    except Exception as e:
+        # dm_db_stats_histogram is not available before SQL Server 2016 SP1 CU2
+        print(e)  # TODO: Logging
+        return []
+
+
+def get_min_max(db_name, tbl_name, connection, key_column, schema_name='dbo'):
+    '''
+        Returns (MIN(key), MAX(key)) of an integer key column.
+    '''
+    min_max_query = f'SELECT MIN([{key_column}]), MAX([{key_column}]) FROM {db_name}.{schema_name}.{tbl_name};'
+
+    return tuple(connection.cursor().execute(min_max_query).fetchone())
+
+
+def split_histogram(histogram, num_partitions):
+    '''
+        Picks at most num_partitions - 1 boundaries from the histogram steps, such
+        that every range holds roughly the same number of rows.
+
+        Parameters
+        ----------------
+        histogram     : List of (range_high_key, rows) ordered by key.
+        num_partitions: Requested number of slices.
+
+        Returns
+        ----------------
+        Ascending list of unique boundary keys.
+    '''
+    total_rows = sum(rows for _, rows in histogram)
+    if num_partitions < 2 or total_rows <= 0:
+        return []
+
+    target = total_rows / num_partitions
+    boundaries = []
+    cumulative_rows = 0
+
+    # the last step is the maximum key; it can never be a useful boundary
+    for high_key, rows in histogram[:-1]:
+        cumulative_rows += rows
+        if cumulative_rows >= target * (len(boundaries) + 1):
+            if not boundaries or boundaries[-1] != high_key:
+                boundaries.append(high_key)
+        if len(boundaries) == num_partitions - 1:
+            break
+
+    return boundaries
+
+
+def split_min_max(min_key, max_key, num_partitions):
+    '''
+        Splits the integer interval [min_key, max_key] evenly. Returns an ascending
+        list of at most num_partitions - 1 unique boundaries.
+    '''
+    if min_key is None or max_key is None or num_partitions < 2 or min_key >= max_key:
+        return []
+
+    span = max_key - min_key
+    boundaries = [min_key + span * k // num_partitions for k in range(1, num_partitions)]
+
+    return sorted(set(b for b in boundaries if min_key <= b < max_key))
+
+
+def get_key_ranges(boundaries):
+    '''
+        Converts boundaries to a list of (lower exclusive, upper inclusive) ranges.
+        None means unbounded.
+
+        Ex: [10, 20] -> [(None, 10), (10, 20), (20, None)]
+    '''
+    edges = [None] + list(boundaries) + [None]
+
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def build_range_predicate(key_column, lower, upper, data_type):
+    '''
+        Returns the WHERE condition selecting the keys in (lower, upper]. The first
+        range also selects NULL keys. Returns an empty string if both are None.
+    '''
+    key = f'[{key_column}]'
+
+    if lower is None and upper is None:
+        return ''
+    if lower is None:
+        return f'({key} <= {sql_literal(upper, data_type)} OR {key} IS NULL)'
+    if upper is None:
+        return f'{key} > {sql_literal(lower, data_type)}'
+
+    return f'{key} > {sql_literal(lower, data_type)} AND {key} <= {sql_literal(upper, data_type)}'
+
+
+def get_partition_ranges(db_name, tbl_name, connection, num_partitions=DEFAULT_NUM_PARTITIONS, schema_name='dbo'):
+    '''
+        Computes the key ranges of a table.
+
+        Returns
+        ----------------
+        (key_column, data_type, ranges). key_column is None and ranges is a single
+        unbounded range when the table can not be partitioned.
+    '''
+    key = get_partition_key(db_name, tbl_name, connection, schema_name)
+    if not key:
+        return None, None, [(None, None)]
+
+    key_column, data_type, index_id = key
+
+    try:
+        boundaries = split_histogram(get_histogram(db_name, tbl_name, connection, data_type
+                                        , index_id, schema_name), num_partitions)
+    except ValueError as e:
+        # data type of the key is not supported
+        print(e)
+        return None, None, [(None, None)]
+
+    if not boundaries and data_type in INTEGER_TYPES:
+        boundaries = split_min_max(*get_min_max(db_name, tbl_name, connection, key_column, schema_name)
+                                    , num_partitions)
+
+    return key_column, data_type, get_key_ranges(boundaries)
+
+
+def get_part_file_name(tbl_name, part_number, extension='csv'):
+    '''
+        tbl_name.part-0000.csv
+    '''
+    return f'{tbl_name}.part-{part_number:04d}.{extension}'
+
+
+def write_manifest(outputfile_path, db_name, schema_name, tbl_name, key_column, parts):
+    '''
+        Writes tbl_name.manifest.json describing all the slices of a partitioned
+        extract and returns the manifest file name.
+
+        parts: List of dict with at least `file`, `lower`, `upper` and `returncode`.
+    '''
+    manifest = {
+        'db_name': db_name
+        , 'schema_name': schema_name
+        , 'tbl_name': tbl_name
+        , 'key_column': key_column
+        , 'created_at': date_utility.get_current_date_time()
+        , 'parts': parts
+    }
+
+    manifest_file_name = os.path.join(outputfile_path, f'{tbl_name}.manifest.json')
+    with open(manifest_file_name, 'w') as f:
+        # boundaries may be dates/decimals; default=str keeps them readable
+        json.dump(manifest, f, indent=2, default=str)
+
+    return manifest_file_name
+
+
+def update_manifest_files(manifest_file_name, renamed_files):
+    '''
+        Rewrites the `file` and `size_bytes` of the slices listed in a manifest
+        whose files were replaced, ex: compressed once extracted.
+
+        renamed_files: dict of previous file name -> new file name of the slices.
+    '''
+    with open(manifest_file_name) as f:
+        manifest = json.load(f)
+
+    outputfile_path = os.path.dirname(manifest_file_name)
+    renamed_files = {os.path.basename(f): os.path.basename(new_f) for f, new_f in renamed_files.items()}
+
+    for part in manifest['parts']:
+        if part['file'] in renamed_files:
+            part['file'] = renamed_files[part['file']]
+            full_outputFileName = os.path.join(outputfile_path, part['file'])
+            part['size_bytes'] = os.path.getsize(full_outputFileName) if os.path.exists(full_outputFileName) else None
+
+    with open(manifest_file_name + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(manifest_file_name + '.tmp', manifest_file_name)
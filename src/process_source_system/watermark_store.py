@@ -0,0 +1,115 @@
+'''
+    Durable store of incremental extract watermarks.
+
+    For every db/schema/table/lte_column the store keeps the upper bound
+    (current_extract_time) of the last successful incremental extract. The next
+    incremental run reads it as its lower bound (last_extract_time), so that the
+    caller does not have to pass the extract times for every run, and a table
+    that failed is simply picked up from its own last watermark by the next run.
+
+    Watermarks are kept in a SQLite database (source_system_data/watermarks.db
+    by default). Every update is a single transaction, thus a watermark is
+    either advanced completely or not at all. Each call opens its own sqlite
+    connection, so a store can be shared by the extraction worker threads.
+'''
+
+import os
+import sqlite3
+
+from src.process_source_system import SOURCE_DATA_PATH
+from src.utils import date_utility
+
+
+DEFAULT_WATERMARK_FILE = os.path.join(SOURCE_DATA_PATH, 'watermarks.db')
+
+# seconds to wait for a concurrent writer to finish
+LOCK_TIMEOUT = 30
+
+
+class WatermarkStore:
+    '''
+        Usage:
+            store = WatermarkStore()
+            last_extract_time = store.get('jade', 'dbo', 'sales', 'modified_at')
+            ...  # extract
+            store.set('jade', 'dbo', 'sales', 'modified_at', current_extract_time)
+    '''
+
+    def __init__(self, file_name=DEFAULT_WATERMARK_FILE):
+        self.file_name = file_name
+
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('''
+                    CREATE TABLE IF NOT EXISTS watermarks (
+                        db_name TEXT NOT NULL
+                        , schema_name TEXT NOT NULL
+                        , tbl_name TEXT NOT NULL
+                        , lte_column TEXT NOT NULL
+                        , watermark TEXT NOT NULL
+                        , updated_at TEXT NOT NULL
+                        , PRIMARY KEY (db_name, schema_name, tbl_name, lte_column)
+                    )
+                ''')
+        finally:
+            connection.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.file_name, timeout=LOCK_TIMEOUT)
+
+    def get(self, db_name, schema_name, tbl_name, lte_column):
+        '''
+            Returns the watermark of the last successful extract, None if the
+            table was never extracted incrementally.
+        '''
+        connection = self._connect()
+        try:
+            row = connection.execute('''
+                SELECT watermark FROM watermarks
+                WHERE db_name = ? AND schema_name = ? AND tbl_name = ? AND lte_column = ?
+            ''', (db_name, schema_name, tbl_name, lte_column)).fetchone()
+        finally:
+            connection.close()
+
+        return row[0] if row else None
+
+    def set(self, db_name, schema_name, tbl_name, lte_column, watermark):
+        '''
+            Records :watermark as the upper bound of the last successful extract.
+            Should only be called once the extract of the table has succeeded.
+        '''
+        connection = self._connect()
+        try:
+            # commits on success, rolls back on exception
+            with connection:
+                connection.execute('''
+                    INSERT INTO watermarks (db_name, schema_name, tbl_name, lte_column, watermark, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (db_name, schema_name, tbl_name, lte_column)
+                    DO UPDATE SET watermark = excluded.watermark, updated_at = excluded.updated_at
+                ''', (db_name, schema_name, tbl_name, lte_column, str(watermark)
+                      , date_utility.get_current_date_time()))
+        finally:
+            connection.close()
+
+    def get_all(self, db_name=None):
+        '''
+            Returns all the watermarks, optionally of one database only, as a dict of
+            (db_name, schema_name, tbl_name, lte_column) -> watermark
+        '''
+        query = 'SELECT db_name, schema_name, tbl_name, lte_column, watermark FROM watermarks'
+        params = ()
+        if db_name:
+            query += ' WHERE db_name = ?'
+            params = (db_name,)
+
+        connection = self._connect()
+        try:
+            return {tuple(row[:4]): row[4] for row in connection.execute(query, params).fetchall()}
+        finally:
+            connection.close()
@@ -0,0 +1,390 @@
+'''
+    Asyncio S3 landing client, with the same API as S3_landing.
+
+    Every request is a coroutine on one event loop instead of a blocked thread,
+    thus hundreds of small objects (format files, manifests, ...) can be in
+    flight at once for the cost of one connection each. Files are read, and
+    hashed, in worker threads (asyncio.to_thread), off the event loop.
+
+    Requires the aiobotocore package. Usage, from an asyncio pipeline:
+
+        async with AsyncS3Landing(max_pool_connections=200) as s3_lan:
+            results = await s3_lan.upload_directory('source_system_data/20210701/jade'
+                                                    , BUCKET_NAME, 'landing', verify=True)
+
+    endpoint_url points the client to a local S3 stand-in, ex: a moto server.
+'''
+
+import asyncio
+import base64
+import hashlib
+from pathlib import Path
+
+try:
+    from aiobotocore.session import get_session
+    from aiobotocore.config import AioConfig
+except ImportError:  # the async client is optional; S3_landing is always available
+    get_session = None
+
+from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError # base exception class for all Boto3 error types
+
+from src.config.definitions import MB
+from src.utils.file_utility import get_file_size
+from src.utils.common_utils import checksum_utility
+from src.utils.aws_utils.copy_to_landing import ErrorTypeClass, UploadResult, get_directory_files
+from src.utils.aws_utils.copy_to_landing import UPLOAD_STATUS_UPLOADED, UPLOAD_STATUS_FAILED
+from src.utils.aws_utils.streaming_upload import get_multipart_etag
+from src.utils.aws_utils.upload_tuning import MAX_PARTS
+from src.utils.aws_utils.upload_verification import get_key_prefixes, normalize_etag, is_etag_verified
+from src.utils.aws_utils.upload_verification import VERIFIED, ETAG_MISMATCH, MISSING
+from src.utils.aws_utils.upload_verification import DEFAULT_POLL_DELAY, DEFAULT_MAX_POLLS
+
+
+DEFAULT_MAX_POOL_CONNECTIONS = 200
+DEFAULT_ASYNC_CONCURRENCY = 200
+# single part files are held in memory while uploaded; in MB
+DEFAULT_ASYNC_THRESHOLD = 8
+DEFAULT_MAX_MULTIPART_FILES = 4
+
+
+def _read_part(file_name, offset, size):
+    '''
+        Reads :size bytes of the file from :offset, and their MD5; run in a thread.
+    '''
+    with open(file_name, 'rb') as f:
+        f.seek(offset)
+        data = f.read(size)
+
+    return data, hashlib.md5(data).digest()
+
+
+async def _gather_or_cancel(coroutines):
+    '''
+        asyncio.gather of :coroutines which, on the first failure, cancels the
+        others and waits for them before raising; no task is left running, ex:
+        against a multipart upload about to be aborted.
+    '''
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class AsyncS3Landing:
+    '''
+        Async counterpart of S3_landing; use as `async with AsyncS3Landing() as s3_lan`.
+
+        Parameters
+        ----------------
+        max_pool_connections: Connections to S3 at most, shared by all the requests.
+        endpoint_url        : ex: 'http://127.0.0.1:5000' for a local moto server.
+    '''
+
+    def __init__(self, region_name='us-east-1', max_attempts=3, mode='standard', profile='default'
+                 , max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS, endpoint_url=None):
+        if get_session is None:
+            raise ImportError('The async landing client requires the aiobotocore package')
+
+        self.S3_config = AioConfig(retries={'max_attempts': max_attempts, 'mode': mode}
+                                   , max_pool_connections=max_pool_connections)
+        self.session = get_session()
+        if profile is not None:
+            self.session.set_config_variable('profile', profile)
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+
+        self.s3_client = None
+        self._client_context = None
+
+    async def __aenter__(self):
+        self._client_context = self.session.create_client('s3', region_name=self.region_name
+                                                          , endpoint_url=self.endpoint_url, config=self.S3_config)
+        self.s3_client = await self._client_context.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self._client_context.__aexit__(exc_type, exc_value, traceback)
+        self.s3_client = None
+
+    async def upload_file_to_bucket(self, file_name=None, bucket_name=None, key=None
+                                    , check_transfered_data=False, multipart_threshold=DEFAULT_ASYNC_THRESHOLD
+                                    , threshold_unit=MB):
+        '''
+            Uploads a file in a single request, with its Content-MD5 if the transfer
+            is to be checked. See S3_landing.upload_file_to_bucket.
+
+            The file is held in memory while uploaded; files of :multipart_threshold
+            (in :threshold_unit) or more are uploaded with upload_file_to_bucket_multipart
+            instead.
+
+            Returns
+            ----------------
+            (success[= 0 | 1 | -1], {} or ErrorTypeClass)
+        '''
+        if not key:
+            key = Path(file_name).name
+
+        SUCCESS_CODE = -1
+        res = {}
+
+        try:
+            file_size = get_file_size(file_name)
+        except OSError as e:
+            return (SUCCESS_CODE, ErrorTypeClass(type(e).__name__, e))
+
+        if file_size >= multipart_threshold * threshold_unit:
+            return (await self.upload_file_to_bucket_multipart(bucket_name=bucket_name, file_name=file_name, key=key
+                        , multipart_threshold=multipart_threshold, threshold_unit=threshold_unit), res)
+
+        try:
+            # small files; read, and hashed, off the event loop
+            data, digest = await asyncio.to_thread(_read_part, file_name, 0, file_size)
+
+            if check_transfered_data:
+                res = await self.s3_client.put_object(Body=data, Bucket=bucket_name, Key=key
+                                                      , ContentMD5=base64.b64encode(digest).decode('utf-8'))
+                SUCCESS_CODE = 1
+                if is_etag_verified(res['ETag'], digest.hex()):
+                    SUCCESS_CODE = 0
+            else:
+                res = await self.s3_client.put_object(Body=data, Bucket=bucket_name, Key=key)
+                SUCCESS_CODE = 1
+
+        except (ClientError, BotoCoreError, OSError) as e:
+            print(f"Upload failed: {file_name} -> S3://{bucket_name}/{key}")  # TODO: Logging
+            res = ErrorTypeClass(type(e).__name__, e)
+
+        return (SUCCESS_CODE, res)
+
+    async def upload_file_to_bucket_multipart(self, bucket_name=None, file_name=None, key=None
+                                              , multipart_threshold=25, max_concurrency=10, threshold_unit=MB
+                                              , multipart_chunksize=25, chunk_size_unit=MB, expected_etag=None):
+        '''
+            Uploads a file in parts, :max_concurrency parts at the same time, each
+            with its Content-MD5; the ETag returned when the upload is completed is
+            verified against the one of the parts read. Files smaller than
+            :multipart_threshold are uploaded with a single request. See
+            S3_landing.upload_file_to_bucket_multipart.
+
+            Returns
+            ----------------
+            -1: Upload failed, 1: uploaded, not verified, 0: uploaded and verified
+        '''
+        if not key:
+            key = Path(file_name).name
+
+        try:
+            file_size = get_file_size(file_name)
+        except OSError:
+            return -1
+
+        if file_size < multipart_threshold * threshold_unit:
+            SUCCESS_CODE, res = await self.upload_file_to_bucket(file_name, bucket_name, key
+                                                                 , check_transfered_data=True
+                                                                 , multipart_threshold=multipart_threshold
+                                                                 , threshold_unit=threshold_unit)
+            if SUCCESS_CODE == 0 and expected_etag and not is_etag_verified(res['ETag'], expected_etag):
+                SUCCESS_CODE = 1
+            return SUCCESS_CODE
+
+        part_size = multipart_chunksize * chunk_size_unit
+        if -(-file_size // part_size) > MAX_PARTS:
+            # checked before the upload is created; one task per part is scheduled below
+            print(f"More than {MAX_PARTS} parts; increase multipart_chunksize: {file_name}")  # TODO: Logging
+            return -1
+
+        slots = asyncio.Semaphore(max_concurrency)
+        upload_id = None
+
+        async def upload_part(part_number, offset):
+            # a part is read only once a slot is free, which bounds the memory used
+            async with slots:
+                data, digest = await asyncio.to_thread(_read_part, file_name, offset, part_size)
+                res = await self.s3_client.upload_part(Bucket=bucket_name, Key=key, UploadId=upload_id
+                                                       , PartNumber=part_number, Body=data
+                                                       , ContentMD5=base64.b64encode(digest).decode('utf-8'))
+                return {'ETag': res['ETag'], 'PartNumber': part_number}, digest
+
+        try:
+            upload_id = (await self.s3_client.create_multipart_upload(Bucket=bucket_name, Key=key))['UploadId']
+            parts = await _gather_or_cancel([upload_part(n, offset) for n, offset
+                                             in enumerate(range(0, file_size, part_size), start=1)])
+            res = await self.s3_client.complete_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id
+                                                                 , MultipartUpload={'Parts': [p for p, _ in parts]})
+
+        except (ClientError, BotoCoreError, OSError) as e:
+            print(f"Multipart Upload failed: {file_name} -> S3://{bucket_name}/{key}", e, sep="\n")  # TODO: Logging
+            if upload_id is not None:
+                try:
+                    await self.s3_client.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+                except (ClientError, BotoCoreError) as abort_error:
+                    print(f"Could not abort multipart upload of S3://{bucket_name}/{key}: {abort_error}")
+            return -1
+
+        etag = normalize_etag(res['ETag'])
+        if etag != get_multipart_etag([digest for _, digest in parts]):
+            print(f"ETag mismatch after Multipart Upload of: S3://{bucket_name}/{key}")  # TODO: Logging
+            return 1
+        if expected_etag and not is_etag_verified(etag, expected_etag):
+            print(f"File changed since its ETag was calculated: {file_name}")  # TODO: Logging
+            return 1
+
+        return 0
+
+    async def get_object_index(self, bucket_name, prefixes=('',)):
+        '''
+            Indexes the objects under :prefixes with one paginated listing per prefix.
+
+            Returns
+            ----------------
+            dict of key -> {'etag': ETag without quotes, 'size': bytes}
+        '''
+        object_index = {}
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+
+        for prefix in prefixes:
+            async for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+                for obj in page.get('Contents', []):
+                    object_index[obj['Key']] = {'etag': normalize_etag(obj['ETag']), 'size': obj['Size']}
+
+        return object_index
+
+    async def verify_uploaded_objects(self, bucket_name, expected_etags, poll_delay=DEFAULT_POLL_DELAY
+                                      , max_polls=DEFAULT_MAX_POLLS):
+        '''
+            Verifies a batch of objects against their expected ETags, with one
+            listing per prefix; see upload_verification.verify_uploaded_objects.
+
+            Returns
+            ----------------
+            dict of key -> VERIFIED, ETAG_MISMATCH or MISSING
+        '''
+        results = {}
+        pending = dict(expected_etags)
+        polls = 0
+
+        while pending:
+            object_index = await self.get_object_index(bucket_name, get_key_prefixes(pending))
+
+            for key in [key for key in pending if key in object_index]:
+                results[key] = VERIFIED if is_etag_verified(object_index[key]['etag'], pending.pop(key)) \
+                    else ETAG_MISMATCH
+
+            if not pending or polls >= max_polls:
+                break
+            polls += 1
+            await asyncio.sleep(poll_delay)
+
+        for key in pending:
+            results[key] = MISSING
+
+        return results
+
+    async def upload_many(self, files, bucket_name, max_concurrency=DEFAULT_ASYNC_CONCURRENCY
+                          , multipart_threshold=DEFAULT_ASYNC_THRESHOLD, threshold_unit=MB
+                          , multipart_chunksize=25, chunk_size_unit=MB, max_multipart_files=DEFAULT_MAX_MULTIPART_FILES
+                          , verify=False, poll_delay=DEFAULT_POLL_DELAY, max_polls=DEFAULT_MAX_POLLS):
+        '''
+            Uploads many files, :max_concurrency at the same time; files larger than
+            :multipart_threshold in parts. See S3_landing.upload_many.
+
+            Single part uploads are sent with their Content-MD5 and verified with
+            the ETag returned, multipart ones with the ETag of the completed upload.
+            With :verify, all the uploads are verified again with one listing per
+            prefix, as S3_landing.upload_many.
+
+            Memory is bounded by about :max_concurrency * :multipart_threshold for the
+            single part files, plus :max_multipart_files * 10 parts in flight.
+
+            Returns
+            ----------------
+            List of UploadResult, in the order of :files.
+        '''
+        files = list(files.items()) if isinstance(files, dict) else list(files)
+        slots = asyncio.Semaphore(max_concurrency)
+        multipart_slots = asyncio.Semaphore(max_multipart_files)
+
+        async def upload(file_name, key):
+            result = UploadResult(file_name=file_name, key=key, status=UPLOAD_STATUS_FAILED)
+            async with slots:
+                try:
+                    result.size_bytes = get_file_size(file_name)
+                except OSError as e:
+                    result.error = f'{type(e).__name__}: {e}'
+                    return result
+
+                result.multipart = result.size_bytes >= multipart_threshold * threshold_unit
+                if result.multipart:
+                    async with multipart_slots:
+                        success_code = await self.upload_file_to_bucket_multipart(bucket_name, file_name, key
+                                            , multipart_threshold, threshold_unit=threshold_unit
+                                            , multipart_chunksize=multipart_chunksize
+                                            , chunk_size_unit=chunk_size_unit)
+                else:
+                    success_code, res = await self.upload_file_to_bucket(file_name, bucket_name, key
+                                                                         , check_transfered_data=True
+                                                                         , multipart_threshold=multipart_threshold
+                                                                         , threshold_unit=threshold_unit)
+                    if success_code == -1:
+                        result.error = f"{res['error']}: {res['error_msg']}"
+
+            if success_code != -1:
+                result.status = UPLOAD_STATUS_UPLOADED
+                result.details['verification'] = VERIFIED if success_code == 0 else ETAG_MISMATCH
+            elif result.error is None:
+                result.error = 'Upload failed'
+
+            return result
+
+        results = list(await asyncio.gather(*(upload(file_name, key) for file_name, key in files)))
+
+        if verify:
+            await self._verify_results(bucket_name, results, multipart_chunksize * chunk_size_unit
+                                       , poll_delay, max_polls)
+
+        return results
+
+    async def _verify_results(self, bucket_name, results, part_size, poll_delay, max_polls):
+        '''
+            Verifies the uploaded files of upload_many in one batch.
+        '''
+        expected_etags = {}
+        for result in results:
+            if result.status != UPLOAD_STATUS_UPLOADED:
+                continue
+            try:
+                checksums = await asyncio.to_thread(checksum_utility.get_file_checksums, result.file_name
+                                                    , (part_size,))
+            except OSError as e:
+                result.error = f'{type(e).__name__}: {e}'
+                continue
+            result.details['etag'] = checksums.get_etag(part_size) if result.multipart else checksums.md5_hex
+            expected_etags[result.key] = result.details['etag']
+
+        try:
+            verification = await self.verify_uploaded_objects(bucket_name, expected_etags, poll_delay, max_polls)
+        except (ClientError, BotoCoreError) as e:
+            print(f"Could not verify the uploads into S3://{bucket_name}: {e}")  # TODO: Logging
+            return
+
+        for result in results:
+            if result.key in verification:
+                result.details['verification'] = verification[result.key]
+                if verification[result.key] != VERIFIED:
+                    result.error = f'Verification: {verification[result.key]}'
+
+    async def upload_directory(self, directory, bucket_name, key_prefix=None, top_level_directory=None
+                               , **upload_kwargs):
+        '''
+            Uploads every file of :directory with upload_many; keys as
+            S3_landing.upload_directory.
+        '''
+        files = get_directory_files(directory, top_level_directory, key_prefix)
+
+        return await self.upload_many(files, bucket_name, **upload_kwargs)
@@ -1,36 +1,63 @@
 import hashlib
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError, WaiterError
 from botocore.exceptions import BotoCoreError # base exception class for all Boto3 error types
 
 
-def calculate_s3_etag(file_path, chunk_size=5 * 1024 ** 2):
+def _md5_digest(view, start, chunk_size):
     '''
-        chunk_size: type: int, default: 5MB
+        Binary MD5 of view[start:start + chunk_size], without copying it.
     '''
-    
-    md5s = []
+    with view[start:start + chunk_size] as part:
+        return hashlib.md5(part).digest()
+
 
-    with open(file_path, 'rb') as fp:
-        while True:
-            data = fp.read(chunk_size)
-            if not data:
-                break
-            md5s.append(hashlib.md5(data))
+def calculate_s3_etag(file_path, chunk_size=5 * 1024 ** 2, max_workers=None):
+    '''
+        ETag S3 gives to :file_path when uploaded in parts of :chunk_size, ex:
+        'ea7528d0be3572e7cfeefe1cb4a77ac8-3'; the plain MD5 for a single part.
 
-    if len(md5s) < 1:
+        The file is memory mapped and its parts are hashed by a pool of threads
+        (hashlib releases the GIL), straight from the mapping without copying them.
+
+        Parameters
+        ----------------
+        chunk_size : type: int, default: 5MB
+        max_workers: Parts hashed at the same time, default: number of CPUs.
+    '''
+    file_size = os.path.getsize(file_path)
+
+    if file_size == 0:
+        # an empty file can not be mapped
         return '{}'.format(hashlib.md5().hexdigest())
 
-    if len(md5s) == 1:
-        return '{}'.format(md5s[0].hexdigest())
+    with open(file_path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with memoryview(mm) as view:
+            if file_size <= chunk_size:
+                with view[:file_size] as data:
+                    return '{}'.format(hashlib.md5(data).hexdigest())
+
+            starts = range(0, file_size, chunk_size)
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1
+                                    , thread_name_prefix='etag') as executor:
+                # map keeps the order of the parts
+                digests = list(executor.map(lambda start: _md5_digest(view, start, chunk_size), starts))
 
-    digests = b''.join(m.digest() for m in md5s)
-    digests_md5 = hashlib.md5(digests)
-    return '{}-{}'.format(digests_md5.hexdigest(), len(md5s))
+    digests_md5 = hashlib.md5(b''.join(digests))
+    return '{}-{}'.format(digests_md5.hexdigest(), len(digests))
 
 
-def verify_multipart_uploaded_fl(s3_client, s3_resource, expected_eTag, bucket_name, key):
+def verify_multipart_uploaded_fl(s3_client, s3_resource, expected_eTag, bucket_name, key
+        , poll_delay=5, max_polls=20):
     '''
     Checks if a multipart upload file has been corrupted during Network Traversal.
+
+    A single HEAD request normally; only if the object is not found yet, polls
+    for it every :poll_delay seconds, at most :max_polls times, then HEADs again.
+    For many objects see upload_verification.verify_uploaded_objects, and an
+    upload returning its ETag needs no verification request at all.
     
     Refer:
          https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.head_object
@@ -38,7 +65,9 @@ def verify_multipart_uploaded_fl(s3_client, s3_resource, expected_eTag, bucket_n
     Parameters:
     ---------------------
     s3_client: S3 Client Object
+    s3_resource: Not used anymore, kept for compatibility
     expected_eTag: expected_ETag that must be compared to 
+    poll_delay, max_polls: Fallback polling for an object not found yet
 
     Returns:
     --------------------
@@ -49,11 +78,16 @@ def verify_multipart_uploaded_fl(s3_client, s3_resource, expected_eTag, bucket_n
     SUCCESS_FLAG = False
     
     try:
-        # wait for object to exist; polls for 20 times every 5 seconds
-        # then throws exception 
-        s3_resource.Object(bucket_name, key).wait_until_exists()
-        
-        res = s3_client.head_object(Bucket=bucket_name, Key=key)
+        try:
+            res = s3_client.head_object(Bucket=bucket_name, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+                raise e
+            # wait for object to exist; polls :max_polls times every :poll_delay seconds
+            # then throws WaiterError
+            s3_client.get_waiter('object_exists').wait(Bucket=bucket_name, Key=key
+                    , WaiterConfig={'Delay': poll_delay, 'MaxAttempts': max_polls})
+            res = s3_client.head_object(Bucket=bucket_name, Key=key)
         # example ETag returned by S3 client ==> 'ETag': '"ea7528d0be3572e7cfeefe1cb4a77ac8-3"'
         
         # compare the eTags
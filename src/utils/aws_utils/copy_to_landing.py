@@ -1,18 +1,41 @@
 
+import os
 import boto3
 from botocore.config import Config
-from boto3.s3.transfer import TransferConfig
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
 from botocore.exceptions import ClientError
 from botocore.exceptions import BotoCoreError # base exception class for all Boto3 error types
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from src.utils.common_utils import checksum_utility
 from src.utils.file_utility import get_file_size
-from src.utils.aws_utils.aws_utility import verify_multipart_uploaded_fl, calculate_s3_etag
+from src.utils.aws_utils.aws_utility import calculate_s3_etag
+from src.utils.aws_utils.streaming_upload import MultipartUploadStream, UploadVerificationError
+from src.utils.aws_utils.upload_verification import get_key_prefixes, list_object_index, verify_uploaded_objects
+from src.utils.aws_utils.upload_verification import is_etag_verified, VERIFIED, DEFAULT_POLL_DELAY, DEFAULT_MAX_POLLS
+from src.utils.aws_utils.upload_tuning import get_upload_part_size, AdaptiveConcurrency
+from src.utils.aws_utils.resumable_upload import upload_file_resumable, cleanup_stale_uploads, DEFAULT_STALE_HOURS
+from src.utils.aws_utils.upload_tuning import DEFAULT_INITIAL_CONCURRENCY, DEFAULT_MAX_TUNED_CONCURRENCY
 from src.config.definitions import MB
 
 
+# files above are uploaded in parts by upload_file_to_bucket; in MB
+DEFAULT_SINGLE_PART_THRESHOLD = 100
+
+# batch uploads; mostly small files, bound by the latency of each request
+DEFAULT_BATCH_CONCURRENCY = 32
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+
+UPLOAD_STATUS_UPLOADED = 'uploaded'
+UPLOAD_STATUS_FAILED = 'failed'
+# identical object already in the bucket
+UPLOAD_STATUS_SKIPPED = 'skipped'
+
+# metadata of the objects uploaded with an auto tuned part size
+PART_SIZE_METADATA = 'part-size'
+
+
 @dataclass
 class ErrorTypeClass:
     '''
@@ -42,18 +65,90 @@ class ErrorTypeClass:
         return {'error': name, 'error_msg': msg}
 
 
+@dataclass
+class UploadResult:
+    '''
+        Outcome of the upload of a file by upload_many.
+    '''
+    file_name: str
+    key: str
+    status: str
+    size_bytes: int = 0
+    multipart: bool = False
+    error: str = None
+    # any additional detail, ex: ETag
+    details: dict = field(default_factory=dict)
+
+
+def get_object_key(file_name, top_level_directory, key_prefix=None):
+    '''
+        top_level_directory/yyyymmdd/db_name/sales.csv.gz -> key_prefix/yyyymmdd/db_name/sales.csv.gz
+    '''
+    key = os.path.relpath(file_name, top_level_directory).replace(os.sep, '/')
+
+    return f"{key_prefix.strip('/')}/{key}" if key_prefix else key
+
+
+def get_directory_files(directory, top_level_directory=None, key_prefix=None):
+    '''
+        Walks :directory and maps every file to its S3 key, relative to
+        :top_level_directory. Unfinished (.tmp) files are left out.
+
+        top_level_directory: default: two levels above :directory, ie. for
+                             source_system_data/yyyymmdd/db_name the keys are
+                             key_prefix/yyyymmdd/db_name/...
+
+        Returns
+        ----------------
+        dict of file name -> key, in sorted file name order.
+    '''
+    if top_level_directory is None:
+        top_level_directory = os.path.dirname(os.path.dirname(os.path.normpath(directory)))
+
+    files = {}
+    for root, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            if not file_name.endswith('.tmp'):
+                full_file_name = os.path.join(root, file_name)
+                files[full_file_name] = get_object_key(full_file_name, top_level_directory, key_prefix)
+
+    return dict(sorted(files.items()))
+
+
+def get_etag_part_size(size_bytes, remote_etag, part_size):
+    '''
+        Part size to calculate the local ETag with, to be compared with
+        :remote_etag: :part_size, unless the remote object has a different
+        number of parts; it was then uploaded with another part size, taken as
+        size / parts rounded up to a whole MB (what uploaders use).
+
+        Returns None if the remote object was uploaded in a single part.
+    '''
+    if '-' not in remote_etag:
+        return None
+
+    parts = int(remote_etag.rsplit('-', 1)[1])
+    if parts == -(-size_bytes // part_size):
+        return part_size
+
+    return -(-size_bytes // parts // MB) * MB or MB
+
+
 class S3_landing:
     '''
         For each session a seperate Object will be created.
     '''
 
 
-    def __init__(self, region_name='us-east-1', max_attempts=3, mode='standard', profile='default'):
+    def __init__(self, region_name='us-east-1', max_attempts=3, mode='standard', profile='default'
+            , max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS):
         self.S3_config = Config(
             retries= {
                 'max_attempts': max_attempts
                 , 'mode': mode
             }
+            # enough connections for the concurrent requests of upload_many
+            , max_pool_connections=max_pool_connections
         )
 
         # self.session = boto3.Session(profile_name='prfl-entertainment-retailer'
@@ -64,10 +159,16 @@ class S3_landing:
 
 
     def upload_file_to_bucket(self, file_name=None, bucket_name=None, key=None
-            , check_transfered_data=False):#, is_object=False):
+            , check_transfered_data=False, multipart_threshold=DEFAULT_SINGLE_PART_THRESHOLD
+            , threshold_unit=MB):#, is_object=False):
         '''
-        Uploads a Single file to the specifed S3 location. Multipart upload is
-        not supported. Max file size cannot be greater than 5 GB.
+        Uploads a Single file to the specifed S3 location. Files larger than
+        :multipart_threshold are uploaded with upload_file_to_bucket_multipart
+        instead; a single part cannot be greater than 5 GB.
+
+        The file is streamed from its handle, never read into memory as a whole.
+        When the transfer is to be checked, the MD5 is calculated beforehand
+        (one chunked read) and sent as Content-MD5, so S3 rejects a corrupted body.
 
         Amazon S3 never adds partial objects; if you receive a success response,
         Amazon S3 added the entire object to the bucket.
@@ -76,10 +177,11 @@ class S3_landing:
 
         Parameter:
         --------------
-        bucket_name: Name of the bucket S3 
-        file_name  : Fully Qualified Name of the file to be uploaded. 
-        key        : Name of the oject in S3, ie. what will the name with which
-                     the file will be stored in S3.
+        bucket_name        : Name of the bucket S3 
+        file_name          : Fully Qualified Name of the file to be uploaded. 
+        key                : Name of the oject in S3, ie. what will the name with which
+                             the file will be stored in S3.
+        multipart_threshold: provided in :threshold_unit; larger files are uploaded in parts.
 
         Returns:
         ----------------
@@ -106,76 +208,109 @@ class S3_landing:
         # will hold error type if Error, empty Otherwise
         res = {}
 
+        try:
+            file_size = get_file_size(file_name)
+        except OSError as e:
+            return (SUCCESS_CODE, ErrorTypeClass(type(e).__name__, e))
+
+        if file_size > multipart_threshold * threshold_unit:
+            return (self.upload_file_to_bucket_multipart(bucket_name=bucket_name, file_name=file_name, key=key
+                        , multipart_threshold=multipart_threshold, threshold_unit=threshold_unit), res)
+
         # calulate MD5 Hash only if data is to be checked for corruption during Network traversal
         if check_transfered_data:
             # pass md5 hash for data to be checked for corruption during Network traversal
             try:
+                # single read of the file for both
+                checksums = checksum_utility.get_file_checksums(file_name, etag_chunk_sizes=())
                 # base64 encoded - needed for providing 
-                file_hash = checksum_utility.get_md5_checksum(file_name=file_name, is_file=True, base64_encode=True)
+                file_hash = checksums.md5_base64
                 # string type - will be compared with eTag
-                file_hash_string = checksum_utility.get_md5_checksum(file_name=file_name, is_file=True)
+                file_hash_string = checksums.md5_hex
             except Exception as e:
                 print("Checksum utitlity produced error")
-                res = ErrorTypeClass(type(e).__name__, e)
+                return (SUCCESS_CODE, ErrorTypeClass(type(e).__name__, e))
 
 
-            # Actual File Upload Code block
-            try:  
+        # Actual File Upload Code block
+        try:
+            # the body is streamed from the file handle
+            with open(file_name, 'rb') as f:
                 if check_transfered_data: # need to use MD5 Hash
-                    # provide file contents as binary
-                    with open(file_name, 'rb') as f:
-                        # print(">> Within Open")
-                        res = self.s3_client.put_object(Body=f.read(), Bucket=bucket_name
-                                    , Key=key, ContentMD5=file_hash)
-                        
-                        # file upload operation completion successful, still need 
-                        # to check for corruption during Network traversal
-                        SUCCESS_CODE = 1 
+                    res = self.s3_client.put_object(Body=f, Bucket=bucket_name, Key=key
+                                , ContentLength=file_size, ContentMD5=file_hash)
                     
-                    # check if corrupted during Network trversal
-                    if res['ETag'] == file_hash_string: 
+                    # file upload operation completion successful, still need 
+                    # to check for corruption during Network traversal
+                    SUCCESS_CODE = 1 
+                
+                    # check if corrupted during Network trversal; ETag is quoted
+                    if res['ETag'].strip('"') == file_hash_string: 
                         SUCCESS_CODE = 0 # not corrupted
                 
                 else: # confirmation check for successful uploaded not required
-                    res = self.s3_client.put_object(Body=file_name, Bucket=bucket_name, Key=key)
+                    res = self.s3_client.put_object(Body=f, Bucket=bucket_name, Key=key
+                                , ContentLength=file_size)
                     
                     # file upload operation completion successful 
                     # no guarantees for whether file corrupted or not
                     SUCCESS_CODE = 1
+    
+        except ClientError as e:
+            print("MD5 error")
+            res = ErrorTypeClass(type(e).__name__, e)
+
+        except BotoCoreError as e:
+            print("Boto core error")
+            res = ErrorTypeClass(type(e).__name__, e)
         
-            except ClientError as e:
-                print("MD5 error")
-                res = ErrorTypeClass(type(e).__name__, e)
-
-            except BotoCoreError as e:
-                print("Boto core error")
-                res = ErrorTypeClass(type(e).__name__, e)
-            
-            except FileNotFoundError as e:
-                res = ErrorTypeClass(type(e).__name__, e)
+        except FileNotFoundError as e:
+            res = ErrorTypeClass(type(e).__name__, e)
 
-            except OSError as e:
-                res = ErrorTypeClass(type(e).__name__, e)
+        except OSError as e:
+            res = ErrorTypeClass(type(e).__name__, e)
 
-            except Exception as e:
-                res = ErrorTypeClass(type(e).__name__, e)
+        except Exception as e:
+            res = ErrorTypeClass(type(e).__name__, e)
 
         return (SUCCESS_CODE, res)
 
 
     def upload_file_to_bucket_multipart(self, bucket_name=None, file_name=None
             , key = None, binary_object=False, multipart_threshold=25, max_concurrency=10
-            , threshold_unit=MB, multipart_chunksize=25, chunk_size_unit=MB):
+            , threshold_unit=MB, multipart_chunksize=25, chunk_size_unit=MB, expected_etag=None
+            , auto_tune=False, resumable=False, journal=None):
         '''
         uploads a file or binary in multiple parts. The destination file name will be same as
         The expected file name 
 
+        Files smaller than :multipart_threshold are uploaded in a single part by
+        upload_file_to_bucket. Larger files are streamed into a MultipartUploadStream:
+        every part is sent with its Content-MD5, and the ETag returned when the upload
+        is completed is compared with the one of the parts read; no polling or HEAD
+        request is needed to verify the object.
+
         Parameters:
         -------------------
         multipart_threshold: provided in Mb. 
-        max_concurrency    :
+        max_concurrency    : Parts uploaded at the same time.
         file_name          : Fully qualified name of the file to be uploaded.
         key                : Fully qualified name of the object in S3
+        expected_etag      : ETag of the file for the part size of the upload (see
+                             upload_tuning.get_upload_part_size), if already calculated
+                             (ex: by the checksum stage of a pipeline); must also match,
+                             thus the file did not change since.
+        auto_tune          : The part size is picked from the file size, see
+                             upload_tuning.get_part_size (:multipart_chunksize is
+                             ignored; an :expected_etag must be calculated with the
+                             same part size), and the parts in flight follow the
+                             measured throughput, from 4 up to :max_concurrency (at
+                             least 32). The part size is recorded in the metadata of
+                             the object, as 'part-size'; is_unchanged reads it back.
+        resumable          : Journal the upload and its parts, so that the upload of the
+                             same file is resumed where it stopped if the process dies;
+                             see resumable_upload. The throughput is then not measured.
+        journal            : resumable_upload.UploadJournal; default one otherwise.
 
 
         Returns:
@@ -200,53 +335,305 @@ class S3_landing:
         #   : -1 (default); unsuccessful
         SUCCESS_CODE = -1 
 
-        config = TransferConfig(multipart_threshold=multipart_threshold * threshold_unit
-                    , max_concurrency=max_concurrency
-                    , multipart_chunksize=multipart_chunksize * chunk_size_unit, use_threads=True)
-        
+        try:
+            file_size = get_file_size(file_name)
+        except OSError as e:
+            return SUCCESS_CODE
+
+        part_size = get_upload_part_size(file_size, multipart_chunksize * chunk_size_unit
+                                         , multipart_threshold * threshold_unit, auto_tune)
+        if part_size is None:
+            SUCCESS_CODE, res = self.upload_file_to_bucket(file_name=file_name, bucket_name=bucket_name, key=key
+                                    , check_transfered_data=True, multipart_threshold=multipart_threshold
+                                    , threshold_unit=threshold_unit)
+            if SUCCESS_CODE == 0 and expected_etag and not is_etag_verified(res['ETag'], expected_etag):
+                SUCCESS_CODE = 1
+            return SUCCESS_CODE
+
+        concurrency, extra_args = None, None
+        if auto_tune:
+            concurrency = AdaptiveConcurrency(DEFAULT_INITIAL_CONCURRENCY
+                                              , max(max_concurrency, DEFAULT_MAX_TUNED_CONCURRENCY))
+            extra_args = {'Metadata': {PART_SIZE_METADATA: str(part_size)}}
+
         # Upload the file 
         try:
-            if binary_object: # generally for zipped files
-                with open(file_name, 'rb') as f:
-                    self.s3_client.upload_fileobj(f, bucket_name, key, Config=config)
-            else:
-                self.s3_client.upload_file(file_name, bucket_name, key, Config=config)
+            if resumable:
+                res = upload_file_resumable(self.s3_client, bucket_name, file_name, key, part_size
+                                            , max_concurrency, journal, extra_args)
+                SUCCESS_CODE = 0
+                if expected_etag and not is_etag_verified(res['ETag'], expected_etag):
+                    print(f"File changed since its ETag was calculated: {file_name}")  # TODO: Logging
+                    SUCCESS_CODE = 1
+                return SUCCESS_CODE
+
+            with open(file_name, 'rb') as f:
+                with self.open_upload_stream(bucket_name, key, part_size, 1, max_concurrency, extra_args
+                                             , concurrency) as stream:
+                    buffer = bytearray(part_size)
+                    with memoryview(buffer) as view:
+                        while True:
+                            n = f.readinto(buffer)
+                            if not n:
+                                break
+                            stream.write(view[:n])
+
+            # upload completed and its ETag verified against the parts sent
+            SUCCESS_CODE = 0
+            print("Multipart Upload attempted")
+
+            if expected_etag and not is_etag_verified(stream.etag, expected_etag):
+                print(f"File changed since its ETag was calculated: {file_name}")  # TODO: Logging
+                SUCCESS_CODE = 1
 
-            # upload operation attempted succesfully without Network or Access error
+        except UploadVerificationError as e:
+            # object uploaded, but not as read
+            print(f"ETag mismatch after Multipart Upload of: S3://{bucket_name}/{key}", e, sep="\n")
             SUCCESS_CODE = 1
 
         except ClientError as botoerror:
             #TODO: LOG
             print(">>Boto3 error", botoerror, sep="\n")
-        #TODO: all other exceptions
-        except Exception as e:
-            #  Handle it here
-            ''
-        else:
-            print("Multipart Upload attempted")
-        ### verify file not corrupted during Network Traversal    #####
-        
-        # calculate the ETag
-        try:
-            eTag = calculate_s3_etag(file_name, config.multipart_chunksize)
-        
-        except FileNotFoundError as e:
-            print(f"FileNotFoundError occured while calculating expected ETag, while reading file: {file_name}")
+
+        except BotoCoreError as e:
+            print(f"Produced BotoCoreError during Multipart Upload of: S3://{bucket_name}/{key}")
 
         except OSError as e:
-            print(f"OSError occured while calculating expected ETag, while reading file: {file_name}")
-            
-        # check for non - corrupt upload
-        else:
-            try:
-                if verify_multipart_uploaded_fl(self.s3_client, self.s3_resource, eTag, bucket_name, key):
-                    SUCCESS_CODE = 0
+            print(f"OSError occured while reading file: {file_name}")
 
-            except BotoCoreError as e:
-                print(f"Produced BotoCoreError while verifying Multipart Upload of: S3://{bucket_name}/{key}")
-                
-            except Exception as e:
-                print(f"Unknown Exception occured while verifying Multipart Upload of: S3://{bucket_name}/{key}")
+        except Exception as e:
+            print(f"Unknown Exception occured during Multipart Upload of: S3://{bucket_name}/{key}")
 
         # SUCCESS_CODE = -1: Failed upload
         return SUCCESS_CODE
+
+
+    def open_upload_stream(self, bucket_name, key, part_size=25, part_size_unit=MB
+            , max_concurrency=4, extra_args=None, concurrency=None):
+        '''
+        Returns a writable binary stream which uploads whatever is written to it
+        into S3://bucket_name/key as a multipart upload, part by part, without
+        staging the data on local disk. Per part MD5s and the final ETag are
+        calculated on the fly and verified. See streaming_upload.MultipartUploadStream.
+
+        The upload is completed when the `with` block exits, aborted if it raises:
+
+            with s3_lan.open_upload_stream(bucket_name, 'jade/sales.csv.gz') as stream:
+                with gzip.open(stream, 'wb') as f:
+                    ...
+
+        Parameters:
+        -------------------
+        part_size      : Size of each part, in :part_size_unit. At least 5 MB.
+        max_concurrency: Parts uploaded at the same time.
+        concurrency    : upload_tuning.AdaptiveConcurrency, to adapt the parts in flight
+                         to the throughput instead.
+        '''
+        return MultipartUploadStream(self.s3_client, bucket_name, key, part_size * part_size_unit
+                    , max_concurrency, extra_args, concurrency)
+
+
+    def cleanup_stale_uploads(self, bucket_name, prefix='', max_age_hours=DEFAULT_STALE_HOURS, journal=None):
+        '''
+        Aborts the incomplete multipart uploads of the bucket started more than
+        :max_age_hours ago, ex: left by a landing process which died and was not
+        resumed. See resumable_upload.cleanup_stale_uploads.
+
+        Returns:
+        ---------------------
+        List of (key, upload_id) aborted.
+        '''
+        return cleanup_stale_uploads(self.s3_client, bucket_name, prefix, max_age_hours, journal)
+
+
+    def upload_many(self, files, bucket_name, max_concurrency=DEFAULT_BATCH_CONCURRENCY
+            , multipart_threshold=25, threshold_unit=MB, multipart_chunksize=25, chunk_size_unit=MB
+            , extra_args=None, skip_unchanged=False, verify=False, poll_delay=DEFAULT_POLL_DELAY
+            , max_polls=DEFAULT_MAX_POLLS):
+        '''
+        Uploads many files concurrently, through a single TransferManager shared by
+        all the files: every request (a small file, or a part of a large one) runs
+        on the same pool of :max_concurrency threads, and the connections are reused.
+        Files larger than :multipart_threshold are uploaded in parts, the others
+        with a single request.
+
+        Parameters:
+        -------------------
+        files              : dict of file name -> key, or iterable of (file name, key).
+        max_concurrency    : Requests in flight at the same time, over all the files.
+                             Bounded by max_pool_connections of the client.
+        multipart_threshold: provided in :threshold_unit.
+        multipart_chunksize: provided in :chunk_size_unit.
+        extra_args         : Passed on to every upload, ex: {'ContentType': 'text/csv'}.
+        skip_unchanged     : Files identical to the object already under their key (same
+                             size and ETag) are not uploaded again, ex: when rerunning a
+                             partially failed landing. The existing objects are indexed
+                             with one listing per prefix, see get_object_index.
+        verify             : Verify the uploaded objects against the ETags of the files,
+                             with one listing per prefix for the whole batch; keys not
+                             listed yet are listed again every :poll_delay seconds, at
+                             most :max_polls times. See upload_verification.
+                             Outcome in details['verification'] of every UploadResult.
+
+        Returns:
+        ---------------------
+        List of UploadResult, in the order of :files. A failed file never stops
+        the others.
+        '''
+        files = list(files.items()) if isinstance(files, dict) else list(files)
+        config = TransferConfig(multipart_threshold=multipart_threshold * threshold_unit
+                    , max_concurrency=max_concurrency
+                    , multipart_chunksize=multipart_chunksize * chunk_size_unit, use_threads=True)
+
+        object_index = {}
+        if skip_unchanged:
+            try:
+                object_index = self.get_object_index(bucket_name, get_key_prefixes(key for _, key in files))
+            except (ClientError, BotoCoreError) as e:
+                # everything is uploaded
+                print(f"Could not index S3://{bucket_name}, no upload skipped: {e}")  # TODO: Logging
+
+        results, futures = [], []
+        with create_transfer_manager(self.s3_client, config) as manager:
+            for file_name, key in files:
+                result = UploadResult(file_name=file_name, key=key, status=UPLOAD_STATUS_FAILED)
+                try:
+                    result.size_bytes = get_file_size(file_name)
+                    result.multipart = result.size_bytes >= config.multipart_threshold
+
+                    if key in object_index and self.is_unchanged(file_name, result.size_bytes, object_index[key]
+                                                                 , config.multipart_chunksize, bucket_name, key):
+                        result.status = UPLOAD_STATUS_SKIPPED
+                        result.details['etag'] = object_index[key]['etag']
+                        future = None
+                    else:
+                        future = manager.upload(file_name, bucket_name, key, extra_args=extra_args)
+                except Exception as e:
+                    result.error = f'{type(e).__name__}: {e}'
+                    future = None
+                results.append(result)
+                futures.append(future)
+
+            for result, future in zip(results, futures):
+                if future is None:
+                    continue
+                try:
+                    future.result()
+                    result.status = UPLOAD_STATUS_UPLOADED
+                except Exception as e:
+                    print(f"Upload failed: {result.file_name} -> S3://{bucket_name}/{result.key}")  # TODO: Logging
+                    result.error = f'{type(e).__name__}: {e}'
+
+        if verify:
+            self._verify_results(bucket_name, results, config.multipart_chunksize, poll_delay, max_polls)
+
+        return results
+
+
+    def _verify_results(self, bucket_name, results, part_size, poll_delay, max_polls):
+        '''
+        Verifies the uploaded files of upload_many in one batch.
+        '''
+        expected_etags = {}
+        for result in results:
+            if result.status != UPLOAD_STATUS_UPLOADED:
+                continue
+            try:
+                checksums = checksum_utility.get_file_checksums(result.file_name, etag_chunk_sizes=(part_size,))
+            except OSError as e:
+                result.error = f'{type(e).__name__}: {e}'
+                continue
+            result.details['etag'] = checksums.get_etag(part_size) if result.multipart else checksums.md5_hex
+            expected_etags[result.key] = result.details['etag']
+
+        try:
+            verification = verify_uploaded_objects(self.s3_client, bucket_name, expected_etags, poll_delay, max_polls)
+        except (ClientError, BotoCoreError) as e:
+            print(f"Could not verify the uploads into S3://{bucket_name}: {e}")  # TODO: Logging
+            return
+
+        for result in results:
+            if result.key in verification:
+                result.details['verification'] = verification[result.key]
+                if verification[result.key] != VERIFIED:
+                    result.error = f'Verification: {verification[result.key]}'
+
+
+    def upload_directory(self, directory, bucket_name, key_prefix=None, top_level_directory=None
+            , **upload_kwargs):
+        '''
+        Uploads every file of :directory (recursively), ex: a
+        source_system_data/yyyymmdd/db_name directory, with upload_many.
+
+            s3_lan.upload_directory('source_system_data/20210701/jade', BUCKET_NAME, 'landing')
+            # -> landing/20210701/jade/sales.csv, landing/20210701/jade/sales_format.xml, ...
+
+        Parameters:
+        -------------------
+        key_prefix         : Prefix of all the keys.
+        top_level_directory: Keys are the file paths relative to it; default: two
+                             levels above :directory. See get_directory_files.
+        upload_kwargs      : Passed on to upload_many.
+
+        Returns:
+        ---------------------
+        List of UploadResult, one per file.
+        '''
+        files = get_directory_files(directory, top_level_directory, key_prefix)
+
+        return self.upload_many(files, bucket_name, **upload_kwargs)
+
+
+    def get_object_index(self, bucket_name, prefixes=('',)):
+        '''
+        Indexes the objects under :prefixes with one paginated list_objects_v2
+        per prefix (1000 objects per request), instead of a HEAD per object.
+
+        Returns:
+        ---------------------
+        dict of key -> {'etag': ETag without quotes, 'size': bytes}
+        '''
+        return list_object_index(self.s3_client, bucket_name, prefixes)
+
+
+    def get_recorded_part_size(self, bucket_name, key):
+        '''
+        Part size recorded in the metadata of the object by
+        upload_file_to_bucket_multipart (auto_tune), with a HEAD request.
+
+        Returns None if not recorded, or if the object could not be read.
+        '''
+        try:
+            metadata = self.s3_client.head_object(Bucket=bucket_name, Key=key).get('Metadata', {})
+        except (ClientError, BotoCoreError) as e:
+            print(f"Could not read the metadata of S3://{bucket_name}/{key}: {e}")  # TODO: Logging
+            return None
+
+        part_size = metadata.get(PART_SIZE_METADATA)
+        return int(part_size) if part_size and part_size.isdigit() else None
+
+
+    def is_unchanged(self, file_name, size_bytes, remote_object, part_size, bucket_name=None, key=None):
+        '''
+        Whether the file is identical to the indexed :remote_object: same size,
+        then same ETag, calculated for the part size of the remote object.
+
+        When the remote object has another number of parts than :part_size
+        gives, and :bucket_name and :key are known, its part size is read
+        from its metadata (see get_recorded_part_size) before being guessed
+        by get_etag_part_size.
+        '''
+        if size_bytes != remote_object['size']:
+            return False
+
+        remote_etag = remote_object['etag']
+        if '-' in remote_etag and bucket_name is not None \
+                and int(remote_etag.rsplit('-', 1)[1]) != -(-size_bytes // part_size):
+            part_size = self.get_recorded_part_size(bucket_name, key) or part_size
+
+        etag_part_size = get_etag_part_size(size_bytes, remote_etag, part_size)
+        if etag_part_size is None:
+            # single part: plain md5; no larger than 5 GB
+            return checksum_utility.get_md5_checksum(file_name=file_name, is_file=True) == remote_etag
+
+        return calculate_s3_etag(file_name, etag_part_size) == remote_etag
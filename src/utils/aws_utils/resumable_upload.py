@@ -0,0 +1,365 @@
+'''
+    Multipart uploads which survive a restart of the landing process.
+
+    For every file being uploaded a local journal keeps the upload ID, the
+    identity of the file (size, modification time) and the part size, and for
+    every part uploaded its number, ETag and MD5. Like the schema cache, the
+    journal is a SQLite database (source_system_data/upload_journal.db by
+    default), written after every part, thus current even if the process dies.
+
+    When the same file is uploaded again to the same key, the parts already
+    in S3 are listed (list_parts) and only the missing ones are uploaded; the
+    upload is then completed and verified with the ETag calculated from the
+    MD5s of all the parts. If the file changed, or the upload no longer exists,
+    it starts from the first part.
+
+    Uploads which are never resumed are left incomplete in S3 (and billed);
+    cleanup_stale_uploads aborts those older than a given age.
+'''
+
+import base64
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from src.process_source_system import SOURCE_DATA_PATH
+from src.utils.aws_utils.streaming_upload import get_multipart_etag, UploadVerificationError
+from src.utils.aws_utils.upload_tuning import MIN_PART_SIZE, MAX_PARTS
+from src.utils.aws_utils.upload_verification import normalize_etag
+
+
+DEFAULT_UPLOAD_JOURNAL_FILE = os.path.join(SOURCE_DATA_PATH, 'upload_journal.db')
+DEFAULT_STALE_HOURS = 7 * 24
+
+# seconds to wait for a concurrent writer to finish
+LOCK_TIMEOUT = 30
+
+
+def get_file_identity(file_name):
+    '''
+        (size, modification time in ns) of the file; a changed file can not be resumed.
+    '''
+    stat = os.stat(file_name)
+
+    return stat.st_size, stat.st_mtime_ns
+
+
+def get_error_code(error):
+    '''
+        Error code of a botocore ClientError, ex: 'NoSuchUpload'; None otherwise.
+    '''
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+class UploadJournal:
+    '''
+        Usage:
+            journal = UploadJournal()
+            journal.start(bucket_name, key, upload_id, file_name, part_size)
+            journal.add_part(bucket_name, key, 1, etag, md5_hex)
+            ...
+            journal.finish(bucket_name, key)
+    '''
+
+    def __init__(self, file_name=DEFAULT_UPLOAD_JOURNAL_FILE):
+        self.file_name = file_name
+
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('''
+                    CREATE TABLE IF NOT EXISTS multipart_uploads (
+                        bucket_name TEXT NOT NULL
+                        , object_key TEXT NOT NULL
+                        , upload_id TEXT NOT NULL
+                        , file_name TEXT NOT NULL
+                        , size_bytes INTEGER NOT NULL
+                        , mtime_ns INTEGER NOT NULL
+                        , part_size INTEGER NOT NULL
+                        , started_at REAL NOT NULL
+                        , PRIMARY KEY (bucket_name, object_key)
+                    )
+                ''')
+                connection.execute('''
+                    CREATE TABLE IF NOT EXISTS multipart_upload_parts (
+                        bucket_name TEXT NOT NULL
+                        , object_key TEXT NOT NULL
+                        , part_number INTEGER NOT NULL
+                        , etag TEXT NOT NULL
+                        , md5 TEXT NOT NULL
+                        , PRIMARY KEY (bucket_name, object_key, part_number)
+                    )
+                ''')
+        finally:
+            connection.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.file_name, timeout=LOCK_TIMEOUT)
+
+    def get(self, bucket_name, key):
+        '''
+            Returns the journaled upload of the key as a dict, None if there is none.
+        '''
+        connection = self._connect()
+        try:
+            row = connection.execute('''
+                SELECT upload_id, file_name, size_bytes, mtime_ns, part_size, started_at
+                FROM multipart_uploads WHERE bucket_name = ? AND object_key = ?
+            ''', (bucket_name, key)).fetchone()
+        finally:
+            connection.close()
+
+        if row is None:
+            return None
+
+        return dict(zip(('upload_id', 'file_name', 'size_bytes', 'mtime_ns', 'part_size', 'started_at'), row))
+
+    def get_uploads(self):
+        '''
+            Returns all the journaled uploads, as (bucket_name, key, upload_id).
+        '''
+        connection = self._connect()
+        try:
+            return connection.execute('SELECT bucket_name, object_key, upload_id FROM multipart_uploads').fetchall()
+        finally:
+            connection.close()
+
+    def start(self, bucket_name, key, upload_id, file_name, part_size):
+        '''
+            Records a new upload of :file_name; forgets any previous one of the key.
+        '''
+        size_bytes, mtime_ns = get_file_identity(file_name)
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('DELETE FROM multipart_upload_parts WHERE bucket_name = ? AND object_key = ?'
+                                   , (bucket_name, key))
+                connection.execute('''
+                    INSERT OR REPLACE INTO multipart_uploads
+                        (bucket_name, object_key, upload_id, file_name, size_bytes, mtime_ns, part_size, started_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (bucket_name, key, upload_id, os.path.abspath(file_name), size_bytes, mtime_ns, part_size
+                      , time.time()))
+        finally:
+            connection.close()
+
+    def get_parts(self, bucket_name, key):
+        '''
+            Returns dict of part number -> (ETag, hex MD5) of the parts uploaded.
+        '''
+        connection = self._connect()
+        try:
+            rows = connection.execute('''
+                SELECT part_number, etag, md5 FROM multipart_upload_parts
+                WHERE bucket_name = ? AND object_key = ?
+            ''', (bucket_name, key)).fetchall()
+        finally:
+            connection.close()
+
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def add_part(self, bucket_name, key, part_number, etag, md5):
+        '''
+            Records an uploaded part.
+        '''
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('''
+                    INSERT OR REPLACE INTO multipart_upload_parts (bucket_name, object_key, part_number, etag, md5)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (bucket_name, key, part_number, normalize_etag(etag), md5))
+        finally:
+            connection.close()
+
+    def finish(self, bucket_name, key):
+        '''
+            Forgets the upload of the key, once completed or aborted.
+        '''
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('DELETE FROM multipart_upload_parts WHERE bucket_name = ? AND object_key = ?'
+                                   , (bucket_name, key))
+                connection.execute('DELETE FROM multipart_uploads WHERE bucket_name = ? AND object_key = ?'
+                                   , (bucket_name, key))
+        finally:
+            connection.close()
+
+
+def list_uploaded_parts(s3_client, bucket_name, key, upload_id):
+    '''
+        Returns dict of part number -> {'etag':..., 'size':...} of the parts in S3.
+    '''
+    parts = {}
+    for page in s3_client.get_paginator('list_parts').paginate(Bucket=bucket_name, Key=key, UploadId=upload_id):
+        for part in page.get('Parts', []):
+            parts[part['PartNumber']] = {'etag': normalize_etag(part['ETag']), 'size': part['Size']}
+
+    return parts
+
+
+def abort_upload(s3_client, bucket_name, key, upload_id):
+    try:
+        s3_client.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+    except Exception as e:
+        if get_error_code(e) != 'NoSuchUpload':
+            print(f'Could not abort multipart upload of s3://{bucket_name}/{key}: {e}')  # TODO: Logging
+
+
+def _read_part(file_name, part_number, part_size):
+    with open(file_name, 'rb') as f:
+        f.seek((part_number - 1) * part_size)
+        return f.read(part_size)
+
+
+def get_resumable_parts(s3_client, journal, bucket_name, key, file_name, part_size):
+    '''
+        Returns (upload_id, dict of part number -> (ETag, hex MD5)) of the
+        journaled upload of the file which can be resumed: the parts both
+        journaled and in S3, with the same ETag. (None, {}) if there is none;
+        an upload which can not be resumed (file changed) is aborted.
+    '''
+    upload = journal.get(bucket_name, key)
+    if upload is None:
+        return None, {}
+
+    size_bytes, mtime_ns = get_file_identity(file_name)
+    if (upload['file_name'] != os.path.abspath(file_name) or upload['size_bytes'] != size_bytes
+            or upload['mtime_ns'] != mtime_ns or upload['part_size'] != part_size):
+        print(f'File changed since its upload started, uploading from start: {file_name}')  # TODO: Logging
+        abort_upload(s3_client, bucket_name, key, upload['upload_id'])
+        journal.finish(bucket_name, key)
+        return None, {}
+
+    try:
+        uploaded_parts = list_uploaded_parts(s3_client, bucket_name, key, upload['upload_id'])
+    except Exception as e:
+        if get_error_code(e) != 'NoSuchUpload':
+            raise e
+        # completed, aborted or expired meanwhile
+        journal.finish(bucket_name, key)
+        return None, {}
+
+    parts = {number: part for number, part in journal.get_parts(bucket_name, key).items()
+             if number in uploaded_parts and uploaded_parts[number]['etag'] == part[0]}
+
+    return upload['upload_id'], parts
+
+
+def upload_file_resumable(s3_client, bucket_name, file_name, key, part_size, max_concurrency=10
+                          , journal=None, extra_args=None):
+    '''
+        Uploads :file_name in parts of :part_size bytes, resuming the previous
+        upload of the same file to the same key if any: only the parts not in S3
+        yet are uploaded.
+
+        Parameters
+        ----------------
+        max_concurrency: Parts uploaded at the same time.
+        journal        : UploadJournal; a default one is used otherwise.
+        extra_args     : Passed on to create_multipart_upload, for a new upload.
+
+        Returns
+        ----------------
+        Response of complete_multipart_upload. Raises UploadVerificationError if
+        the ETag of the object is not the one of the parts; on any other error
+        the upload is left for the next run to resume. No part is started once
+        one has failed.
+    '''
+    if part_size < MIN_PART_SIZE:
+        raise ValueError(f'part_size should be at least {MIN_PART_SIZE} bytes, got: {part_size}')
+
+    journal = journal or UploadJournal()
+    size_bytes = os.path.getsize(file_name)
+    part_count = max(-(-size_bytes // part_size), 1)
+    if part_count > MAX_PARTS:
+        raise ValueError(f'More than {MAX_PARTS} parts; increase part_size')
+
+    upload_id, parts = get_resumable_parts(s3_client, journal, bucket_name, key, file_name, part_size)
+    if upload_id is None:
+        upload_id = s3_client.create_multipart_upload(Bucket=bucket_name, Key=key, **(extra_args or {}))['UploadId']
+        journal.start(bucket_name, key, upload_id, file_name, part_size)
+    else:
+        print(f'Resuming upload of s3://{bucket_name}/{key}: {len(parts)} of {part_count} parts done')
+
+    lock = threading.Lock()
+    # a part is read only once a thread is free, which bounds the memory used
+    slots = threading.BoundedSemaphore(max_concurrency)
+    failed = threading.Event()
+
+    def upload_part(part_number):
+        try:
+            data = _read_part(file_name, part_number, part_size)
+            digest = hashlib.md5(data).digest()
+            res = s3_client.upload_part(Bucket=bucket_name, Key=key, UploadId=upload_id, PartNumber=part_number
+                                        , Body=data, ContentMD5=base64.b64encode(digest).decode('utf-8'))
+            journal.add_part(bucket_name, key, part_number, res['ETag'], digest.hex())
+            with lock:
+                parts[part_number] = (normalize_etag(res['ETag']), digest.hex())
+        except BaseException:
+            failed.set()
+            raise
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='upload-part') as executor:
+        futures = []
+        for part_number in range(1, part_count + 1):
+            if part_number not in parts:
+                slots.acquire()
+                if failed.is_set():
+                    # ex: an outage; the remaining parts are left for the next run to resume
+                    slots.release()
+                    break
+                futures.append(executor.submit(upload_part, part_number))
+        for future in futures:
+            future.result()
+
+    res = s3_client.complete_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id
+                , MultipartUpload={'Parts': [{'ETag': f'"{parts[n][0]}"', 'PartNumber': n} for n in sorted(parts)]})
+    journal.finish(bucket_name, key)
+
+    expected_etag = get_multipart_etag([bytes.fromhex(parts[n][1]) for n in sorted(parts)])
+    if normalize_etag(res['ETag']) != expected_etag:
+        raise UploadVerificationError(f'ETag of s3://{bucket_name}/{key} is {normalize_etag(res["ETag"])}'
+                                      f', expected {expected_etag}')
+    return res
+
+
+def cleanup_stale_uploads(s3_client, bucket_name, prefix='', max_age_hours=DEFAULT_STALE_HOURS, journal=None):
+    '''
+        Aborts the incomplete multipart uploads of the bucket (under :prefix)
+        started more than :max_age_hours ago, journaled or not, and forgets the
+        journaled uploads which no longer exist in S3.
+
+        Returns
+        ----------------
+        List of (key, upload_id) aborted.
+    '''
+    journal = journal or UploadJournal()
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+
+    aborted, open_uploads = [], set()
+    paginator = s3_client.get_paginator('list_multipart_uploads')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for upload in page.get('Uploads', []):
+            if upload['Initiated'] < cutoff:
+                abort_upload(s3_client, bucket_name, upload['Key'], upload['UploadId'])
+                aborted.append((upload['Key'], upload['UploadId']))
+            else:
+                open_uploads.add(upload['UploadId'])
+
+    for journal_bucket_name, key, upload_id in journal.get_uploads():
+        if journal_bucket_name == bucket_name and key.startswith(prefix) and upload_id not in open_uploads:
+            journal.finish(bucket_name, key)
+
+    return aborted
@@ -0,0 +1,211 @@
+'''
+    Writable stream uploading everything written to it into an S3 object, as a
+    multipart upload, without staging the data on local disk.
+
+    Written bytes are buffered until a part is full; full parts are uploaded
+    by a small pool of threads while the writer keeps producing data. At most
+    max_concurrency parts are in flight, thus memory use is bounded by about
+    (max_concurrency + 1) * part_size. With an AdaptiveConcurrency the number of
+    parts in flight follows the measured throughput, up to its maximum.
+
+    The MD5 of every part is calculated on the fly and sent as Content-MD5, so
+    S3 rejects any part corrupted in transit. The multipart ETag expected for
+    the object (md5 of the part digests, suffixed with the number of parts) is
+    compared with the one returned when the upload is completed.
+
+    close() only ends writing, which allows wrappers (gzip, TextIOWrapper, ...)
+    to close the stream. The upload is completed (or aborted) by the stream's
+    context manager, or explicitly with complete() / abort():
+
+        with MultipartUploadStream(s3_client, bucket_name, key) as stream:
+            with gzip.open(stream, 'wb') as f:
+                f.write(data)
+        # completed; aborted if the with block raised
+'''
+
+import base64
+import hashlib
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config.definitions import MB
+from src.utils.aws_utils.upload_tuning import AdaptiveConcurrency, MIN_PART_SIZE, MAX_PARTS
+
+
+DEFAULT_PART_SIZE = 25 * MB
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class UploadVerificationError(Exception):
+    '''
+        Raised when the ETag returned by S3 differs from the one calculated
+        from the uploaded parts.
+    '''
+
+
+def get_multipart_etag(part_digests):
+    '''
+        ETag of a multipart upload from the binary MD5 digests of its parts.
+    '''
+    return f'{hashlib.md5(b"".join(part_digests)).hexdigest()}-{len(part_digests)}'
+
+
+class MultipartUploadStream(io.BufferedIOBase):
+    '''
+        Binary writable stream into s3://bucket_name/key.
+
+        Parameters
+        ----------------
+        s3_client      : boto3 S3 client.
+        part_size      : Bytes per part; at least 5 MB (S3 minimum, except the last part).
+        max_concurrency: Parts uploaded at the same time.
+        extra_args     : Passed on to create_multipart_upload, ex: {'ContentType': 'text/csv'}.
+        concurrency    : AdaptiveConcurrency limiting the parts in flight, instead of
+                         a fixed :max_concurrency.
+
+        Once completed:
+            etag      : ETag of the object (verified)
+            md5       : hex MD5 of the whole object
+            size_bytes: Number of bytes uploaded
+    '''
+
+    def __init__(self, s3_client, bucket_name, key, part_size=DEFAULT_PART_SIZE
+                 , max_concurrency=DEFAULT_MAX_CONCURRENCY, extra_args=None, concurrency=None):
+        super().__init__()
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f'part_size should be at least {MIN_PART_SIZE} bytes, got: {part_size}')
+
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+
+        self.upload_id = s3_client.create_multipart_upload(Bucket=bucket_name, Key=key
+                                                          , **(extra_args or {}))['UploadId']
+
+        self.etag = None
+        self.size_bytes = 0
+        self.finished = False
+
+        self._buffer = bytearray()
+        self._md5 = hashlib.md5()
+        self._parts = {}  # part number -> (ETag, md5 digest)
+        self._futures = []
+        self.concurrency = concurrency or AdaptiveConcurrency(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency.maximum, thread_name_prefix='upload-part')
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('write to closed stream')
+        self._raise_part_error()
+
+        self._buffer += data
+        self._md5.update(data)
+        self.size_bytes += len(data)
+
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit_part(part)
+
+        return len(data)
+
+    def _submit_part(self, part):
+        part_number = len(self._futures) + 1
+        if part_number > MAX_PARTS:
+            raise ValueError(f'More than {MAX_PARTS} parts; increase part_size')
+
+        # blocks while the limit of parts are in flight
+        self.concurrency.acquire()
+        future = self._executor.submit(self._upload_part, part_number, part)
+        future.add_done_callback(lambda f, size_bytes=len(part): self.concurrency.release(size_bytes))
+        self._futures.append(future)
+
+    def _upload_part(self, part_number, part):
+        digest = hashlib.md5(part).digest()
+        res = self.s3_client.upload_part(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id
+                                         , PartNumber=part_number, Body=part
+                                         , ContentMD5=base64.b64encode(digest).decode('utf-8'))
+        self._parts[part_number] = (res['ETag'], digest)
+
+    def _raise_part_error(self):
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+    @property
+    def md5(self):
+        return self._md5.hexdigest()
+
+    @property
+    def expected_etag(self):
+        return get_multipart_etag([self._parts[n][1] for n in sorted(self._parts)])
+
+    def complete(self):
+        '''
+            Uploads the last part, completes the upload and verifies its ETag.
+            Returns the response of complete_multipart_upload.
+        '''
+        if self.finished:
+            return None
+
+        try:
+            # the last part may be smaller than part_size; an empty object is one empty part
+            if self._buffer or not self._futures:
+                self._submit_part(bytes(self._buffer))
+                self._buffer = bytearray()
+
+            for future in self._futures:
+                future.result()
+
+            res = self.s3_client.complete_multipart_upload(Bucket=self.bucket_name, Key=self.key
+                        , UploadId=self.upload_id
+                        , MultipartUpload={'Parts': [{'ETag': self._parts[n][0], 'PartNumber': n}
+                                                     for n in sorted(self._parts)]})
+        except Exception as e:
+            self.abort()
+            raise e
+
+        self.finished = True
+        self._executor.shutdown()
+        self.etag = res['ETag'].strip('"')
+
+        if self.etag != self.expected_etag:
+            raise UploadVerificationError(f'ETag of s3://{self.bucket_name}/{self.key} is {self.etag}'
+                                          f', expected {self.expected_etag}')
+        return res
+
+    def abort(self):
+        '''
+            Aborts the upload; S3 discards the parts uploaded so far.
+        '''
+        if self.finished:
+            return
+
+        self.finished = True
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id)
+        except Exception as e:
+            print(f'Could not abort multipart upload of s3://{self.bucket_name}/{self.key}: {e}')  # TODO: Logging
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.complete()
+        else:
+            self.abort()
+        self.close()
+
+    def __del__(self):
+        # never complete an upload implicitly
+        if not getattr(self, 'finished', True):
+            self.abort()
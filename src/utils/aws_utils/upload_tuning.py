@@ -0,0 +1,139 @@
+'''
+    Auto-tuning of multipart uploads.
+
+    - Part size from the file size: large enough to stay well under the 10,000
+      parts limit of S3 (and not pay a request per few MB on huge files), small
+      enough to give every thread a part on medium files. Always a whole number
+      of MB, and deterministic, so an ETag calculated beforehand with
+      get_part_size matches the upload.
+
+    - Concurrency from the measured throughput: after every window of completed
+      parts, the number of parts in flight is raised while the throughput keeps
+      improving, and lowered when it drops (ex: saturated uplink, throttling).
+'''
+
+import threading
+import time
+
+from src.config.definitions import MB, GB
+
+
+# S3 limits
+MIN_PART_SIZE = 5 * MB
+MAX_PART_SIZE = 5 * GB
+MAX_PARTS = 10000
+
+# parts for a huge file; headroom under MAX_PARTS
+TARGET_PARTS = 1000
+# parts for a medium file, to upload it in parallel
+MIN_PARTS = 8
+MIN_TUNED_PART_SIZE = 8 * MB
+
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MAX_TUNED_CONCURRENCY = 32
+# relative change of throughput considered as better / worse
+THROUGHPUT_TOLERANCE = 0.1
+
+
+def get_part_size(file_size, target_parts=TARGET_PARTS, min_parts=MIN_PARTS):
+    '''
+        Part size, in bytes, to upload a file of :file_size bytes.
+
+            30 MB  -> 5 MB   (6 parts)
+            1 GB   -> 8 MB   (128 parts)
+            300 GB -> 308 MB (998 parts)
+    '''
+    part_size = max(-(-file_size // target_parts), MIN_TUNED_PART_SIZE)
+    # medium files: at least :min_parts parts, if not smaller than S3 allows
+    part_size = max(min(part_size, -(-file_size // min_parts)), MIN_PART_SIZE)
+    # whole MB, as the other uploads
+    part_size = -(-part_size // MB) * MB
+
+    # never more than MAX_PARTS parts
+    part_size = max(part_size, -(-file_size // MAX_PARTS // MB) * MB)
+
+    return min(part_size, MAX_PART_SIZE)
+
+
+def get_upload_part_size(file_size, part_size, multipart_threshold, auto_tune=False):
+    '''
+        Part size, in bytes, of the upload of a file of :file_size bytes, as done
+        by S3_landing.upload_file_to_bucket_multipart; None when the file is below
+        :multipart_threshold and sent with a single PUT (plain MD5 ETag).
+
+        An ETag calculated beforehand (ex: by a checksum stage) has to use the same
+        part size, or the upload fails its verification.
+
+        part_size, multipart_threshold: bytes. :part_size is ignored with :auto_tune.
+    '''
+    if file_size < multipart_threshold:
+        return None
+
+    return get_part_size(file_size) if auto_tune else part_size
+
+
+class AdaptiveConcurrency:
+    '''
+        Limits the number of parts in flight; the limit follows the throughput.
+
+        acquire() blocks while :limit parts are in flight; release(size_bytes)
+        when a part is done. Once :limit parts completed, the throughput of the
+        window is compared with the previous one and the limit is adapted,
+        between 1 and :maximum.
+
+        maximum: None for a fixed :initial limit.
+    '''
+
+    def __init__(self, initial=DEFAULT_INITIAL_CONCURRENCY, maximum=None):
+        if initial < 1:
+            raise ValueError(f'initial should be a positive integer, got: {initial}')
+
+        self.limit = initial
+        self.maximum = max(maximum or initial, initial)
+        self.adaptive = maximum is not None
+        # (limit, bytes per second) of every window
+        self.history = []
+
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._window_start = None
+        self._window_bytes = 0
+        self._window_parts = 0
+        self._previous_throughput = None
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+            if self._window_start is None:
+                self._window_start = time.perf_counter()
+
+    def release(self, size_bytes=0):
+        with self._condition:
+            self._in_flight -= 1
+            self._window_bytes += size_bytes
+            self._window_parts += 1
+            if self.adaptive and self._window_parts >= self.limit:
+                self._adapt()
+            self._condition.notify_all()
+
+    def _adapt(self):
+        '''
+            Adapts the limit to the throughput of the window. Caller holds the lock.
+        '''
+        now = time.perf_counter()
+        throughput = self._window_bytes / max(now - self._window_start, 1e-9)
+        self.history.append((self.limit, throughput))
+
+        previous = self._previous_throughput
+        if previous is None or throughput > previous * (1 + THROUGHPUT_TOLERANCE):
+            # more parallelism paid off; grow by a quarter
+            self.limit = min(self.limit + max(1, self.limit // 4), self.maximum)
+        elif throughput < previous * (1 - THROUGHPUT_TOLERANCE):
+            self.limit = max(self.limit - max(1, self.limit // 4), 1)
+
+        self._previous_throughput = throughput
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_parts = 0
@@ -0,0 +1,118 @@
+'''
+    Verifies uploaded objects against their expected ETags.
+
+    A single upload is verified with the ETag returned by the upload itself
+    (put_object / complete_multipart_upload), no further request needed.
+
+    A batch of uploads is verified with one paginated list_objects_v2 per key
+    prefix (1000 objects per request) instead of a waiter plus a HEAD per
+    object. Keys not listed yet are listed again every poll_delay seconds, at
+    most max_polls times, before being reported missing.
+
+    Usage:
+        results = verify_uploaded_objects(s3_client, bucket_name
+                                          , {'landing/20210701/jade/sales.csv.gz': 'ea7528d0...-3'})
+        # {'landing/20210701/jade/sales.csv.gz': VERIFIED}
+'''
+
+import time
+
+
+# same as the object_exists waiter: every 5 seconds, 20 times
+DEFAULT_POLL_DELAY = 5
+DEFAULT_MAX_POLLS = 20
+
+VERIFIED = 'verified'
+ETAG_MISMATCH = 'etag_mismatch'
+MISSING = 'missing'
+
+
+def normalize_etag(etag):
+    '''
+        '"ea7528d0be3572e7cfeefe1cb4a77ac8-3"' -> 'ea7528d0be3572e7cfeefe1cb4a77ac8-3'
+    '''
+    return etag.strip('"').strip("'")
+
+
+def is_etag_verified(returned_etag, expected_etag):
+    '''
+        Compares the ETag returned by an upload with the expected one.
+    '''
+    return normalize_etag(returned_etag) == normalize_etag(expected_etag)
+
+
+def get_key_prefixes(keys):
+    '''
+        Distinct "directories" of :keys, without those nested in another one;
+        each is listed once to index the existing objects. A key at the root of
+        the bucket is its own prefix: listing '' would list the whole bucket.
+
+            ['l/20210701/jade/a.csv', 'l/20210701/jade/b.csv', 'l/20210701/x.csv'] -> ['l/20210701/']
+            ['l/20210701/jade/a.csv', 'top.csv'] -> ['l/20210701/jade/', 'top.csv']
+    '''
+    prefixes = sorted({key.rsplit('/', 1)[0] + '/' if '/' in key else key for key in keys})
+
+    top_prefixes = []
+    for prefix in prefixes:
+        if not any(prefix.startswith(top_prefix) for top_prefix in top_prefixes):
+            top_prefixes.append(prefix)
+
+    return top_prefixes
+
+
+def list_object_index(s3_client, bucket_name, prefixes=('',)):
+    '''
+        Indexes the objects under :prefixes with one paginated list_objects_v2
+        per prefix.
+
+        Returns
+        ----------------
+        dict of key -> {'etag': ETag without quotes, 'size': bytes}
+    '''
+    object_index = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+
+    for prefix in prefixes:
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                object_index[obj['Key']] = {'etag': normalize_etag(obj['ETag']), 'size': obj['Size']}
+
+    return object_index
+
+
+def verify_uploaded_objects(s3_client, bucket_name, expected_etags, poll_delay=DEFAULT_POLL_DELAY
+                            , max_polls=DEFAULT_MAX_POLLS):
+    '''
+        Verifies a batch of uploaded objects against their expected ETags.
+
+        Parameters
+        ----------------
+        expected_etags: dict of key -> expected ETag.
+        poll_delay    : Seconds between two listings of the keys not found yet.
+        max_polls     : Listings of the keys not found yet, at most; 0 to report
+                        them missing straight away.
+
+        Returns
+        ----------------
+        dict of key -> VERIFIED, ETAG_MISMATCH or MISSING
+    '''
+    results = {}
+    pending = dict(expected_etags)
+    polls = 0
+
+    while pending:
+        object_index = list_object_index(s3_client, bucket_name, get_key_prefixes(pending))
+
+        for key in [key for key in pending if key in object_index]:
+            results[key] = VERIFIED if is_etag_verified(object_index[key]['etag'], pending.pop(key)) \
+                else ETAG_MISMATCH
+
+        if not pending or polls >= max_polls:
+            break
+        polls += 1
+        time.sleep(poll_delay)
+
+    for key in pending:
+        results[key] = MISSING
+
+    return results
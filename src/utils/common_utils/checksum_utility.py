@@ -1,5 +1,18 @@
 import hashlib
 import base64
+from dataclasses import dataclass, field
+
+try:
+    import crc32c as crc32c_module
+except ImportError:  # CRC32C is optional; MD5, ETag and SHA-256 are always available
+    crc32c_module = None
+
+from src.config.definitions import MB
+
+
+# large reads; the buffer is allocated once per file and reused
+CHECKSUM_BUFFER_SIZE = 8 * MB
+DEFAULT_ETAG_CHUNK_SIZE = 5 * MB
 
 
 def get_md5_checksum(string_value=None, file_name=None, is_file=False
@@ -31,7 +44,7 @@ def get_md5_checksum(string_value=None, file_name=None, is_file=False
         read_file_in_chunks: type: Bool, default: False
                           If set to True reads the file chunkwise, with each chunk
                              equal to as set by :chunk_size
-                          Else reads the whole file as a single chunk.
+                          Else reads the file in chunks of CHECKSUM_BUFFER_SIZE.
 
         chunk_size: The size of each chunk if the file is being read chunk wise as 
                    opposed to being read in full.
@@ -52,9 +65,11 @@ def get_md5_checksum(string_value=None, file_name=None, is_file=False
                 for chunk in iter(lambda: f.read(chunk_size), b""):
                     hash_md5.update(chunk)
         
-        else: # read the file as whole
+        else: # whole file in large reads; never loaded into memory at once
+            hash_md5 = hashlib.md5()
             with open(file_name, 'rb') as f:
-                hash_md5 = hashlib.md5(f.read())
+                for chunk in iter(lambda: f.read(CHECKSUM_BUFFER_SIZE), b""):
+                    hash_md5.update(chunk)
 
     else:   # create hash for String value provided
         hash_md5 = hashlib.md5(string_value.encode('utf-8'))
@@ -74,3 +89,113 @@ def get_md5_checksum(string_value=None, file_name=None, is_file=False
 
     else: # create hash in String format
         return hash_md5.hexdigest()
+
+
+@dataclass
+class FileChecksums:
+    '''
+        All the checksums of a file, as calculated by get_file_checksums().
+
+        etags : dict of multipart chunk size (bytes) -> S3 ETag for that part size,
+                ex: 'd41d8cd98f00b204e9800998ecf8427e' or '9b2cf535f27731c974343645a3985328-3'
+        sha256: hex SHA-256, None if not requested.
+        crc32c: base64 CRC32C (as used by S3 x-amz-checksum-crc32c), None if not requested.
+    '''
+    size_bytes: int
+    md5_hex: str
+    md5_base64: str
+    etags: dict = field(default_factory=dict)
+    sha256: str = None
+    crc32c: str = None
+
+    def get_etag(self, chunk_size=DEFAULT_ETAG_CHUNK_SIZE):
+        return self.etags[chunk_size]
+
+
+class _EtagAccumulator:
+    '''
+        Multipart ETag of a stream for one chunk size, fed with consecutive pieces.
+    '''
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.digests = []
+        self.current = hashlib.md5()
+        self.current_size = 0
+
+    def update(self, view):
+        while len(view):
+            take = min(len(view), self.chunk_size - self.current_size)
+            self.current.update(view[:take])
+            self.current_size += take
+            view = view[take:]
+
+            if self.current_size == self.chunk_size:
+                self.digests.append(self.current.digest())
+                self.current = hashlib.md5()
+                self.current_size = 0
+
+    def etag(self):
+        digests = self.digests + ([self.current.digest()] if self.current_size else [])
+
+        if not digests:  # empty file
+            return hashlib.md5().hexdigest()
+        if len(digests) == 1:
+            return digests[0].hex()
+
+        return '{}-{}'.format(hashlib.md5(b''.join(digests)).hexdigest(), len(digests))
+
+
+def get_file_checksums(file_name, etag_chunk_sizes=(DEFAULT_ETAG_CHUNK_SIZE,), sha256=False, crc32c=False
+        , buffer_size=CHECKSUM_BUFFER_SIZE):
+    '''
+        Reads the file once and returns its hex MD5, base64 MD5 (Content-MD5),
+        S3 multipart ETag for every chunk size and optionally SHA-256 / CRC32C.
+
+        Parameters:
+        ---------------
+        file_name       : Fully qualified name of the file.
+        etag_chunk_sizes: type: iterable of int, default: (5 MB,)
+                          Multipart chunk sizes, in bytes, to calculate the ETag for.
+        sha256          : type: Bool, default: False
+        crc32c          : type: Bool, default: False. Requires the crc32c package.
+        buffer_size     : Bytes read at a time.
+
+        Returns:
+        ------------
+        FileChecksums
+    '''
+    if crc32c and crc32c_module is None:
+        raise ImportError('CRC32C checksum requires the crc32c package')
+
+    md5 = hashlib.md5()
+    etags = [_EtagAccumulator(chunk_size) for chunk_size in etag_chunk_sizes]
+    sha256_hash = hashlib.sha256() if sha256 else None
+    crc = 0
+    size_bytes = 0
+
+    buffer = bytearray(buffer_size)
+    buffer_view = memoryview(buffer)
+
+    with open(file_name, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            view = buffer_view[:n]
+            size_bytes += n
+
+            md5.update(view)
+            for etag in etags:
+                etag.update(view)
+            if sha256_hash is not None:
+                sha256_hash.update(view)
+            if crc32c:
+                crc = crc32c_module.crc32c(view, crc)
+
+    return FileChecksums(size_bytes=size_bytes
+                , md5_hex=md5.hexdigest()
+                , md5_base64=base64.b64encode(md5.digest()).decode('utf-8')
+                , etags={etag.chunk_size: etag.etag() for etag in etags}
+                , sha256=sha256_hash.hexdigest() if sha256_hash is not None else None
+                , crc32c=base64.b64encode(crc.to_bytes(4, 'big')).decode('utf-8') if crc32c else None)
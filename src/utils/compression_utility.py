@@ -1,12 +1,44 @@
 import os
-from zipfile import ZipFile
+import io
+import gzip
+import shutil
+import struct
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from zipfile import ZipInfo
 from zipfile import BadZipFile, LargeZipFile
 import logging
 
-from utils.common_utils import common_utility
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
 
+try:
+    import lz4.frame
+except ImportError:  # lz4 is optional; gzip is always available
+    lz4 = None
 
-def _compress_file(input_file, out_file_name=None):
+from src.utils.common_utils import general_utility as common_utility
+from src.config.definitions import MB
+
+
+# streaming codecs -> file extension
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst', 'lz4': '.lz4'}
+DEFAULT_COMPRESSION_LEVELS = {'gzip': 6, 'zstd': 3, 'lz4': 0}
+STREAM_BUFFER_SIZE = 1 * MB
+
+# parallel compression: independent blocks of a file are compressed by a pool
+# of processes, then written in order as consecutive gzip members / zstd or lz4
+# frames, which gzip -d (pigz), zstd -d and lz4 -d read as one stream
+DEFAULT_BLOCK_SIZE = 16 * MB
+DEFAULT_ZIP_LEVEL = 6
+
+
+def _compress_file(input_file, out_file_name=None, compression_level=None, max_workers=None):
     '''
     Compresses a single file to a zip file
     '''
@@ -14,12 +46,7 @@ def _compress_file(input_file, out_file_name=None):
         out_file_name = input_file+'.zip'
 
     try:
-        with ZipFile(out_file_name, 'w') as zip:
-            zip.write(input_file)
-    except BadZipFile:
-        print("Bad zip")
-    except LargeZipFile:
-        print("require Zip64 functionality")
+        write_zip([input_file], out_file_name, compression_level, max_workers)
     except FileNotFoundError as e:
         # Log
         raise e
@@ -28,24 +55,18 @@ def _compress_file(input_file, out_file_name=None):
         raise e
 
 
-def _compress_directory(input_files, out_file_name=None):
+def _compress_directory(input_files, out_file_name=None, compression_level=None, max_workers=None):
     '''
         files        : A list of fully qualified file names
         out_file_name: Name of the output zipped file
+
+        The files are deflated in parallel, see write_zip.
     '''
     if not common_utility.is_iterable(input_files, str_ok=False):
         raise TypeError("`input_files` should be iterable, ex: list type.")
 
     try:
-        with ZipFile(out_file_name, 'w') as zip:
-            for file in input_files:
-                zip.write(file)
-    except BadZipFile as e:
-        print("Bad zip")
-        raise e
-    except LargeZipFile as e:
-        print("require Zip64 functionality")
-        raise e
+        write_zip(input_files, out_file_name, compression_level, max_workers)
     except FileNotFoundError as e:
         # Log
         raise e
@@ -85,9 +106,11 @@ def _get_all_files(directory):
     
 #     for 
 
-def dump_zipped_file(input_files, output_file_name, is_directory=True):
+def dump_zipped_file(input_files, output_file_name, is_directory=True, compression_level=None, max_workers=None):
     '''
     input_files: Can be a list or a single file. The values are expected
+    compression_level: Deflate level of the zip entries, 0-9; default: DEFAULT_ZIP_LEVEL
+    max_workers: Processes deflating the entries; default: number of CPUs
     '''
 
     if is_directory:
@@ -95,7 +118,7 @@ def dump_zipped_file(input_files, output_file_name, is_directory=True):
         if not common_utility.is_iterable(input_files, str_ok=False):
             raise TypeError("`input_files` should be iterable, ex: list type.")
 
-        _compress_directory(input_files, output_file_name)
+        _compress_directory(input_files, output_file_name, compression_level, max_workers)
 
     else:
         # input_files shoud not be iterable (string expected)
@@ -103,4 +126,455 @@ def dump_zipped_file(input_files, output_file_name, is_directory=True):
         if common_utility.is_iterable(input_files, str_ok=False):
             raise TypeError("`input_files` should be String not iterable.")
 
-        _compress_file(input_files, output_file_name)
+        _compress_file(input_files, output_file_name, compression_level, max_workers)
+
+
+def get_compressed_file_name(file_name, compression):
+    '''
+        Appends the extension of the codec, ex: sales.csv -> sales.csv.gz
+        Returns the file name unchanged if compression is None.
+    '''
+    if not compression:
+        return file_name
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f'Compression not supported: {compression}')
+
+    return file_name + COMPRESSION_EXTENSIONS[compression]
+
+
+def open_compressed(file_name, mode='wb', compression='gzip', compression_level=None, encoding='utf-8'):
+    '''
+        Opens a file which is compressed on the fly while being written.
+
+        Parameters:
+        ------------
+        file_name        : Fully qualified name of the compressed file, or a binary
+                           stream to write the compressed bytes to (ex: an upload stream).
+        mode             : 'wb' for bytes, 'wt' for text.
+        compression      : 'gzip', 'zstd' or 'lz4'. zstd requires the zstandard package,
+                           lz4 the lz4 package.
+        compression_level: Codec specific level; defaults to DEFAULT_COMPRESSION_LEVELS.
+    '''
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f'Compression not supported: {compression}')
+    if mode not in ('wb', 'wt'):
+        raise ValueError(f'Mode not supported: {mode}')
+
+    if compression_level is None:
+        compression_level = DEFAULT_COMPRESSION_LEVELS[compression]
+
+    is_stream = hasattr(file_name, 'write')
+
+    if compression == 'gzip':
+        binary_file = gzip.open(file_name, 'wb', compresslevel=compression_level)
+    elif compression == 'lz4':
+        if lz4 is None:
+            raise ImportError('lz4 compression requires the lz4 package')
+        binary_file = lz4.frame.open(file_name, 'wb', compression_level=compression_level)
+    else:
+        if zstandard is None:
+            raise ImportError('zstd compression requires the zstandard package')
+        binary_file = zstandard.ZstdCompressor(level=compression_level).stream_writer(
+                        file_name if is_stream else open(file_name, 'wb'))
+
+    if mode == 'wt':
+        # newline='' -> line endings are written as provided (ex: by csv writer)
+        return io.TextIOWrapper(binary_file, encoding=encoding, newline='')
+
+    return binary_file
+
+
+def compress_stream(input_stream, output_file_name, compression='gzip', compression_level=None
+                    , buffer_size=STREAM_BUFFER_SIZE):
+    '''
+        Compresses everything read from a binary stream into output_file_name,
+        :buffer_size bytes at a time. Returns number of uncompressed bytes.
+
+        output_file_name: File name, or a binary stream (see open_compressed).
+                          Without :compression the bytes are copied as they are.
+    '''
+    total_bytes = 0
+    if compression:
+        out = open_compressed(output_file_name, 'wb', compression, compression_level)
+    elif hasattr(output_file_name, 'write'):
+        out = output_file_name
+    else:
+        out = open(output_file_name, 'wb')
+
+    with out:
+        while True:
+            data = input_stream.read(buffer_size)
+            if not data:
+                break
+            out.write(data)
+            total_bytes += len(data)
+
+    return total_bytes
+
+
+@contextmanager
+def compressed_output(output_file_name, compression=None, compression_level=None, output_stream_factory=None):
+    '''
+        Yields a file name for an external process (ex: bcp) to write to. Whatever
+        it writes ends up compressed in get_compressed_file_name(output_file_name).
+
+        Where named pipes are available (POSIX), the yielded name is a fifo which is
+        compressed while the process writes to it; the uncompressed data never
+        touches the disk. The process must then be run without a shell from a list
+        of arguments (a single command string is not split on POSIX). Otherwise the process writes the plain file, which is
+        compressed and removed on exit.
+
+        Without :compression the output file name itself is yielded.
+
+        output_stream_factory: Called as output_stream_factory(compressed file name);
+                               returns a context manager yielding a binary stream
+                               (ex: an S3 upload stream) which receives the output
+                               instead of the file. The context exits with the
+                               exception raised in the with block, if any.
+
+        If the with block raises (ex: the caller checks the return code of the
+        process), the compressed file is removed: a truncated file would pass for
+        a complete extract.
+
+        Usage:
+            with compressed_output('sales.csv', 'gzip') as bcp_output_file:
+                subprocess.run(['bcp', ..., 'out', bcp_output_file, ...])
+            # sales.csv.gz
+    '''
+    if not compression and output_stream_factory is None:
+        yield output_file_name
+        return
+
+    compressed_file_name = get_compressed_file_name(output_file_name, compression)
+
+    if output_stream_factory is None:
+        try:
+            with _process_output(output_file_name, compressed_file_name, compression, compression_level) as process_file_name:
+                yield process_file_name
+        except BaseException:
+            if os.path.exists(compressed_file_name):
+                os.remove(compressed_file_name)
+            raise
+        return
+
+    with output_stream_factory(compressed_file_name) as output_stream:
+        with _process_output(output_file_name, output_stream, compression, compression_level) as process_file_name:
+            yield process_file_name
+
+
+@contextmanager
+def _process_output(output_file_name, output, compression=None, compression_level=None):
+    '''
+        Yields the file name for the process to write to; what it writes is
+        (compressed and) written to :output, a file name or a binary stream.
+    '''
+    if not hasattr(os, 'mkfifo'):
+        try:
+            yield output_file_name
+        except BaseException:
+            # partial output of the process
+            if os.path.exists(output_file_name):
+                os.remove(output_file_name)
+            raise
+        with open(output_file_name, 'rb') as f:
+            compress_stream(f, output, compression, compression_level)
+        os.remove(output_file_name)
+        return
+
+    fifo_name = output_file_name + '.fifo'
+    if os.path.exists(fifo_name):
+        os.remove(fifo_name)
+    os.mkfifo(fifo_name)
+
+    errors = []
+
+    def compress_fifo():
+        try:
+            # blocks until the writer opens the fifo
+            with open(fifo_name, 'rb') as f:
+                compress_stream(f, output, compression, compression_level)
+        except Exception as e:
+            errors.append(e)
+
+    compress_thread = threading.Thread(target=compress_fifo, name='fifo-compress', daemon=True)
+    compress_thread.start()
+
+    try:
+        yield fifo_name
+    finally:
+        # the writer may have failed before opening the fifo; open and close it
+        # once so that the reader sees end of file instead of blocking forever.
+        # Opening fails (ENXIO) until the reader has reached open() itself.
+        while compress_thread.is_alive():
+            try:
+                os.close(os.open(fifo_name, os.O_WRONLY | os.O_NONBLOCK))
+                break
+            except OSError:
+                compress_thread.join(0.05)
+        compress_thread.join()
+        os.remove(fifo_name)
+
+    if errors:
+        raise errors[0]
+
+
+def compress_block(data, compression='gzip', compression_level=None):
+    '''
+        Compresses :data into one self contained gzip member / zstd or lz4 frame.
+        Run by the worker processes of compress_files_parallel.
+    '''
+    if compression_level is None:
+        compression_level = DEFAULT_COMPRESSION_LEVELS[compression]
+
+    if compression == 'gzip':
+        # mtime=0: same block, same bytes
+        return gzip.compress(data, compresslevel=compression_level, mtime=0)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError('zstd compression requires the zstandard package')
+        return zstandard.ZstdCompressor(level=compression_level).compress(data)
+    if compression == 'lz4':
+        if lz4 is None:
+            raise ImportError('lz4 compression requires the lz4 package')
+        return lz4.frame.compress(data, compression_level=compression_level)
+
+    raise ValueError(f'Compression not supported: {compression}')
+
+
+def compress_files_parallel(input_file_names, compression='gzip', compression_level=None
+                            , block_size=DEFAULT_BLOCK_SIZE, max_workers=None, executor=None
+                            , remove_input=False, block_callback=None):
+    '''
+        Compresses every file into get_compressed_file_name(file, compression),
+        on all the cores: the files are cut into blocks of :block_size, which are
+        compressed independently by a pool of processes, many blocks (of one
+        large file, or of many files) at the same time. The compressed blocks
+        are written in order, as consecutive gzip members / zstd or lz4 frames;
+        the output is read by the standard tools and libraries as one stream
+        (multi-member gzip, as written by pigz).
+
+        Parameters:
+        ------------
+        compression      : 'gzip' (deflate), 'zstd' or 'lz4'.
+        compression_level: Codec specific level; defaults to DEFAULT_COMPRESSION_LEVELS.
+        block_size       : Bytes per block; larger blocks compress slightly better.
+        max_workers      : Processes; default: number of CPUs.
+        executor         : concurrent.futures executor to use instead of a new
+                           process pool, ex: one shared by many calls.
+        remove_input     : Remove every input file once compressed.
+        block_callback   : Called as block_callback(input_file_name, block) with every
+                           uncompressed block, in order, ex: to count the rows or hash
+                           the input in the same read.
+
+        Returns:
+        ------------
+        dict of input file name -> compressed file name
+    '''
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f'Compression not supported: {compression}')
+
+    max_workers = max_workers or os.cpu_count() or 1
+    own_executor = executor is None
+    executor = executor or ProcessPoolExecutor(max_workers=max_workers)
+    # blocks in memory at most, compressed or waiting to be
+    max_in_flight = 2 * max_workers
+
+    output_file_names = {}
+    # every output opened; closed before any cleanup
+    output_files = []
+    # (output file, future, is last block of the file)
+    pending = deque()
+
+    def write_next():
+        out, future, is_last = pending.popleft()
+        out.write(future.result())
+        if is_last:
+            out.close()
+
+    try:
+        for input_file_name in input_file_names:
+            output_file_name = get_compressed_file_name(input_file_name, compression)
+            out = open(output_file_name, 'wb')
+            output_files.append(out)
+            output_file_names[input_file_name] = output_file_name
+
+            with open(input_file_name, 'rb') as f:
+                block = f.read(block_size)
+                while True:
+                    if block_callback is not None:
+                        block_callback(input_file_name, block)
+                    # an empty file is one empty block
+                    next_block = f.read(block_size) if block else b''
+                    pending.append((out, executor.submit(compress_block, block, compression, compression_level)
+                                    , not next_block))
+                    while len(pending) >= max_in_flight:
+                        write_next()
+                    if not next_block:
+                        break
+                    block = next_block
+
+        while pending:
+            write_next()
+
+    except Exception as e:
+        for _, future, _ in pending:
+            future.cancel()
+        for out in output_files:
+            out.close()
+        for output_file_name in output_file_names.values():
+            if os.path.exists(output_file_name):
+                os.remove(output_file_name)
+        raise e
+
+    finally:
+        # no-op for the outputs already closed
+        for out in output_files:
+            out.close()
+        if own_executor:
+            executor.shutdown()
+
+    if remove_input:
+        for input_file_name in output_file_names:
+            os.remove(input_file_name)
+
+    return output_file_names
+
+
+def compress_file_parallel(input_file_name, compression='gzip', compression_level=None
+                           , block_size=DEFAULT_BLOCK_SIZE, max_workers=None, executor=None, remove_input=False):
+    '''
+        Compresses one file on all the cores, see compress_files_parallel.
+        Returns the compressed file name.
+    '''
+    return compress_files_parallel([input_file_name], compression, compression_level, block_size
+                                   , max_workers, executor, remove_input)[input_file_name]
+
+
+def _deflate_file(input_file_name, output_file_name, compression_level):
+    '''
+        Raw deflate of a file, for a zip entry. Run by the worker processes of
+        write_zip. Returns (crc32, file size, compressed size).
+    '''
+    compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    crc, file_size, compressed_size = 0, 0, 0
+
+    with open(input_file_name, 'rb') as f, open(output_file_name, 'wb') as out:
+        while True:
+            data = f.read(STREAM_BUFFER_SIZE)
+            if not data:
+                break
+            crc = zlib.crc32(data, crc)
+            file_size += len(data)
+            compressed_size += out.write(compressor.compress(data))
+        compressed_size += out.write(compressor.flush())
+
+    return crc, file_size, compressed_size
+
+
+# zip format; zip64 extra fields are written only where a value overflows
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+ZIP_FLAG_UTF8 = 0x800
+
+
+def _get_zip_entry_header(zip_info, crc, file_size, compressed_size, header_offset=None):
+    '''
+        Local file header of a deflated entry; its central directory header if
+        :header_offset is given.
+    '''
+    name = zip_info.filename.encode('utf-8')
+    date_time = zip_info.date_time
+    dos_time = date_time[3] << 11 | date_time[4] << 5 | date_time[5] // 2
+    dos_date = (date_time[0] - 1980) << 9 | date_time[1] << 5 | date_time[2]
+
+    values = [file_size, compressed_size] + ([header_offset] if header_offset is not None else [])
+    is_zip64 = any(value >= ZIP64_LIMIT for value in values)
+    extra = struct.pack(f'<HH{len(values)}Q', 1, 8 * len(values), *values) if is_zip64 else b''
+    version = ZIP64_VERSION if is_zip64 else ZIP_VERSION
+    sizes = (ZIP64_LIMIT, ZIP64_LIMIT) if is_zip64 else (compressed_size, file_size)
+
+    if header_offset is None:
+        return struct.pack('<IHHHHHIIIHH', 0x04034b50, version, ZIP_FLAG_UTF8, zlib.DEFLATED, dos_time, dos_date
+                           , crc, *sizes, len(name), len(extra)) + name + extra
+
+    return struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, zip_info.create_system << 8 | version, version
+                       , ZIP_FLAG_UTF8, zlib.DEFLATED
+                       , dos_time, dos_date, crc, *sizes, len(name), len(extra), 0, 0, 0
+                       , zip_info.external_attr, ZIP64_LIMIT if is_zip64 else header_offset) + name + extra
+
+
+def write_zip(input_file_names, output_file_name, compression_level=None, max_workers=None, executor=None):
+    '''
+        Writes a standard zip of the files, deflated (ZIP_DEFLATED), each file
+        deflated by a process of a pool, all the files at the same time. Entry
+        names are the file paths, as ZipFile.write(file_name) names them.
+
+        Parameters:
+        ------------
+        compression_level: Deflate level, 0-9; default: DEFAULT_ZIP_LEVEL.
+        max_workers      : Processes; default: number of CPUs.
+        executor         : concurrent.futures executor to use instead of a new
+                           process pool.
+    '''
+    if compression_level is None:
+        compression_level = DEFAULT_ZIP_LEVEL
+
+    input_file_names = list(input_file_names)
+    # deflated entries are staged next to the zip, then copied into it in order
+    part_file_names = [f'{output_file_name}.{i}.tmp' for i in range(len(input_file_names))]
+    own_executor = executor is None
+    executor = executor or ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1)
+    futures = []
+
+    try:
+        futures = [executor.submit(_deflate_file, input_file_name, part_file_name, compression_level)
+                   for input_file_name, part_file_name in zip(input_file_names, part_file_names)]
+
+        central_directory = []
+        with open(output_file_name, 'wb') as out:
+            for input_file_name, part_file_name, future in zip(input_file_names, part_file_names, futures):
+                crc, file_size, compressed_size = future.result()
+                zip_info = ZipInfo.from_file(input_file_name)
+
+                header_offset = out.tell()
+                out.write(_get_zip_entry_header(zip_info, crc, file_size, compressed_size))
+                with open(part_file_name, 'rb') as f:
+                    shutil.copyfileobj(f, out, STREAM_BUFFER_SIZE)
+                os.remove(part_file_name)
+
+                central_directory.append(_get_zip_entry_header(zip_info, crc, file_size, compressed_size
+                                                               , header_offset))
+
+            directory_offset = out.tell()
+            for header in central_directory:
+                out.write(header)
+            directory_size = out.tell() - directory_offset
+            count = len(central_directory)
+
+            if count >= ZIP64_COUNT_LIMIT or directory_offset >= ZIP64_LIMIT or directory_size >= ZIP64_LIMIT:
+                zip64_end_offset = out.tell()
+                out.write(struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, ZIP64_VERSION, ZIP64_VERSION, 0, 0
+                                      , count, count, directory_size, directory_offset))
+                out.write(struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1))
+
+            out.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, ZIP64_COUNT_LIMIT)
+                                  , min(count, ZIP64_COUNT_LIMIT), min(directory_size, ZIP64_LIMIT)
+                                  , min(directory_offset, ZIP64_LIMIT), 0))
+
+    except Exception as e:
+        for future in futures:
+            future.cancel()
+        # the running ones may still write their entry
+        wait(futures)
+        for file_name in part_file_names + [output_file_name]:
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        raise e
+
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    return output_file_name
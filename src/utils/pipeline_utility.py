@@ -0,0 +1,148 @@
+'''
+    Runs items through a sequence of stages, each stage with its own pool of
+    worker threads, connected by bounded queues.
+
+    An item moves on to the next stage as soon as the previous stage is done
+    with it, so different items are in different stages at the same time
+    (ex: one table uploading while the next ones are still being extracted).
+    A full queue blocks the stage feeding it, which bounds the number of items
+    waiting between two stages (ex: compressed files waiting on disk for upload).
+
+    A stage fails an item by raising. A failed item skips all the remaining
+    stages. Failures never stop the pipeline for the other items.
+
+    Usage:
+        stages = [PipelineStage('extract', extract, max_workers=4)
+                  , PipelineStage('upload', upload, max_workers=2)]
+        results = run_pipeline(tables, stages)
+'''
+
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+
+
+DEFAULT_QUEUE_SIZE = 2
+
+# marks the end of the input of a stage
+_END = object()
+
+
+@dataclass
+class PipelineStage:
+    '''
+        func       : Called as func(item) by a worker thread of the stage; raises
+                     to fail the item.
+        max_workers: Number of items processed by the stage at the same time.
+        queue_size : Number of items waiting for the stage at most.
+    '''
+    name: str
+    func: object
+    max_workers: int = 1
+    queue_size: int = DEFAULT_QUEUE_SIZE
+
+
+@dataclass
+class PipelineResult:
+    '''
+        Outcome of an item. failed_stage is None if all the stages succeeded.
+    '''
+    item: object
+    failed_stage: str = None
+    error: str = None
+    # stage name -> seconds spent in the stage
+    stage_seconds: dict = field(default_factory=dict)
+
+
+def _run_stage(stage, input_queue, output_queue, on_stage_end):
+    '''
+        Worker loop of a stage.
+    '''
+    while True:
+        result = input_queue.get()
+        if result is _END:
+            on_stage_end()
+            return
+
+        if result.failed_stage is None:
+            start = time.perf_counter()
+            try:
+                stage.func(result.item)
+            except Exception as e:
+                result.failed_stage = stage.name
+                result.error = f'{type(e).__name__}: {e}'
+            result.stage_seconds[stage.name] = time.perf_counter() - start
+
+        output_queue.put(result)
+
+
+def run_pipeline(items, stages, on_result=None):
+    '''
+        Runs every item through all the stages.
+
+        Parameters
+        ----------------
+        items    : Iterable of items; enter the first stage in the given order.
+        stages   : List of PipelineStage.
+        on_result: Called as on_result(result) once an item has left the pipeline.
+
+        Returns
+        ----------------
+        List of PipelineResult in the same order as :items.
+    '''
+    if not stages:
+        raise ValueError('At least one stage is required')
+    for stage in stages:
+        if stage.max_workers < 1:
+            raise ValueError(f'max_workers of stage {stage.name} should be a positive integer, got: {stage.max_workers}')
+
+    # queue i feeds stage i; the last queue is drained by this thread, thus unbounded
+    queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages] + [queue.Queue()]
+    threads = []
+
+    for i, stage in enumerate(stages):
+        remaining = [stage.max_workers]
+        lock = threading.Lock()
+        next_workers = stages[i + 1].max_workers if i + 1 < len(stages) else 1
+
+        def on_stage_end(remaining=remaining, lock=lock, output_queue=queues[i + 1], next_workers=next_workers):
+            # the last worker of a stage ends the input of the next stage
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    for _ in range(next_workers):
+                        output_queue.put(_END)
+
+        for n in range(stage.max_workers):
+            thread = threading.Thread(target=_run_stage, args=(stage, queues[i], queues[i + 1], on_stage_end)
+                                      , name=f'{stage.name}-{n}', daemon=True)
+            thread.start()
+            threads.append(thread)
+
+    results = [PipelineResult(item=item) for item in items]
+
+    def feed():
+        for result in results:
+            queues[0].put(result)
+        for _ in range(stages[0].max_workers):
+            queues[0].put(_END)
+
+    feeder = threading.Thread(target=feed, name='pipeline-feed', daemon=True)
+    feeder.start()
+
+    while True:
+        result = queues[-1].get()
+        if result is _END:
+            break
+        if on_result is not None:
+            try:
+                on_result(result)
+            except Exception as e:
+                print(f'Pipeline result callback failed: {type(e).__name__}: {e}')  # TODO: Logging
+
+    feeder.join()
+    for thread in threads:
+        thread.join()
+
+    return results
@@ -0,0 +1,104 @@
+from unittest import TestCase as tc
+import os
+
+import pytest
+
+from src.process_source_system import change_extract as ce
+
+
+dummy_object = tc()
+
+COLUMNS = [('order_id', True), ('line_no', True), ('amount', False)]
+
+
+def test_in_db_statement():
+    tc.assertEqual(dummy_object, ce.in_db_statement('jade', '@a int, @b int')
+                   , 'EXEC jade.sys.sp_executesql @stmt = ?, @params = ?, @a = ?, @b = ?;')
+    tc.assertEqual(dummy_object, ce.in_db_statement('jade'), 'EXEC jade.sys.sp_executesql @stmt = ?, @params = ?;')
+
+
+def test_change_tracking_query_keeps_keys_of_deleted_rows():
+    query = ce.build_change_tracking_query('sales_line', COLUMNS)
+
+    tc.assertIn(dummy_object, 'CHANGETABLE(CHANGES [dbo].[sales_line], @last_version) AS ct', query)
+    tc.assertIn(dummy_object, 'ct.[order_id], ct.[line_no], t.[amount]', query)
+    tc.assertIn(dummy_object, 't.[order_id] = ct.[order_id] AND t.[line_no] = ct.[line_no]', query)
+    tc.assertIn(dummy_object, 'ct.SYS_CHANGE_VERSION <= @current_version', query)
+
+
+def test_change_tracking_requires_primary_key():
+    with pytest.raises(ValueError):
+        ce.build_change_tracking_query('heap', [('a', False)])
+
+
+def test_snapshot_query_marks_inserts():
+    query = ce.build_snapshot_query('sales_line', COLUMNS)
+
+    tc.assertTrue(dummy_object, query.startswith("SELECT 'I' AS [__operation], @current_version AS [__version]"))
+
+
+def test_cdc_query():
+    query = ce.build_cdc_query('dbo_sales_line', COLUMNS)
+    empty = ce.build_cdc_query('dbo_sales_line', COLUMNS, no_changes=True)
+
+    tc.assertIn(dummy_object, "cdc.fn_cdc_get_all_changes_dbo_sales_line(@from_lsn, @to_lsn, N'all')", query)
+    tc.assertIn(dummy_object, "WHEN 1 THEN 'D' WHEN 2 THEN 'I' ELSE 'U'", query)
+    tc.assertIn(dummy_object, 'SELECT TOP 0 * FROM cdc.[dbo_sales_line_CT]', empty)
+    tc.assertNotIn(dummy_object, 'fn_cdc_get_all_changes', empty)
+
+
+class CdcCursor:
+    '''
+    Answers the catalog queries of extract_cdc; records the extract statement.
+    '''
+
+    def __init__(self, statements):
+        self.statements = statements
+        self.description = (('__operation', str, None, 1, 1, 0, False),)
+        self.arraysize = 1
+
+    def execute(self, query, *params):
+        self.query, self.params = query, params
+        return self
+
+    def fetchone(self):
+        # sys.fn_cdc_get_min_lsn
+        return ('0x0000002a000000100001',)
+
+    def fetchall(self):
+        if 'captured_columns' in self.query:
+            return [('order_id',), ('amount',)]
+        # table columns, one added after CDC was enabled
+        return [('order_id', 1), ('line_no', 1), ('amount', 0), ('added_later', 0)]
+
+    def fetchmany(self, size):
+        self.statements.append(self.params[0])
+        return []
+
+    def close(self):
+        ''
+
+
+class CdcConnection:
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return CdcCursor(self.statements)
+
+    def add_output_converter(self, sql_type, func):
+        ''
+
+
+def test_cdc_extract_selects_captured_columns_only(tmp_path):
+    connection = CdcConnection()
+
+    ce.extract_cdc(connection, 'jade', 'sales_line', None, '0x0000002a000000200001', str(tmp_path))
+
+    tc.assertEqual(dummy_object, len(connection.statements), 1)
+    tc.assertIn(dummy_object, ', [order_id], [amount] FROM cdc.fn_cdc_get_all_changes_dbo_sales_line'
+                , connection.statements[0])
+    tc.assertNotIn(dummy_object, 'line_no', connection.statements[0])
+    tc.assertNotIn(dummy_object, 'added_later', connection.statements[0])
+    tc.assertTrue(dummy_object, os.path.isfile(os.path.join(tmp_path, 'sales_line.csv')))
@@ -0,0 +1,100 @@
+from unittest import TestCase as tc
+import threading
+import time
+
+import pytest
+
+from src.process_source_system.connection_pool import ConnectionPool, PoolTimeoutError
+
+
+dummy_object = tc()
+
+
+class FakeConnection:
+
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.closed = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        if not self.healthy:
+            raise ConnectionError('connection reset')
+        return self
+
+    def execute(self, query):
+        return self
+
+    def fetchone(self):
+        return (1,)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+def test_connection_is_reused():
+    created = []
+    pool = ConnectionPool(lambda: created.append(FakeConnection()) or created[-1])
+
+    with pool.connection() as first:
+        ''
+    with pool.connection() as second:
+        ''
+
+    tc.assertIs(dummy_object, first, second)
+    tc.assertEqual(dummy_object, len(created), 1)
+    tc.assertEqual(dummy_object, first.rollbacks, 2)
+
+
+def test_connection_discarded_on_error():
+    created = []
+    pool = ConnectionPool(lambda: created.append(FakeConnection()) or created[-1])
+
+    with pytest.raises(RuntimeError):
+        with pool.connection():
+            raise RuntimeError('query failed')
+
+    with pool.connection() as connection:
+        ''
+
+    tc.assertTrue(dummy_object, created[0].closed)
+    tc.assertIsNot(dummy_object, connection, created[0])
+
+
+def test_max_size_blocks_until_release():
+    pool = ConnectionPool(FakeConnection, max_size=1)
+    first = pool.acquire()
+
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire(timeout=0.05)
+
+    threading.Timer(0.05, pool.release, args=(first,)).start()
+    tc.assertIs(dummy_object, pool.acquire(timeout=2), first)
+
+
+def test_broken_idle_connection_is_replaced():
+    pool = ConnectionPool(FakeConnection, health_check_after=0)
+    broken = pool.acquire()
+    pool.release(broken)
+    broken.healthy = False
+
+    time.sleep(0.01)
+    connection = pool.acquire()
+
+    tc.assertIsNot(dummy_object, connection, broken)
+    tc.assertTrue(dummy_object, broken.closed)
+
+
+def test_idle_timeout_closes_connection():
+    pool = ConnectionPool(FakeConnection, idle_timeout=0)
+    old = pool.acquire()
+    pool.release(old)
+
+    time.sleep(0.01)
+    new = pool.acquire()
+
+    tc.assertIsNot(dummy_object, new, old)
+    tc.assertTrue(dummy_object, old.closed)
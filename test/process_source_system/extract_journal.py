@@ -0,0 +1,73 @@
+from unittest import TestCase as tc
+import hashlib
+import json
+import os
+
+from src.process_source_system import extract_scheduler as es
+from src.process_source_system.extract_journal import ExtractJournal, get_journal_file_name
+
+
+dummy_object = tc()
+
+
+def _write(file_name, content):
+    with open(file_name, 'w', newline='') as f:
+        f.write(content)
+
+
+def test_done_table_is_journaled_with_files(tmp_path):
+    output_directory = os.path.join(tmp_path, '20220101', 'jade')
+    os.makedirs(output_directory)
+    _write(os.path.join(output_directory, 'customer.csv'), '1,a\n')
+    _write(os.path.join(output_directory, 'customer_format.xml'), '<BCPFORMAT/>')
+    _write(os.path.join(output_directory, 'customer_address.csv'), '1,b\n')
+
+    job = es.ExtractJob('dbo', 'customer')
+    journal = ExtractJournal(output_directory, 'jade')
+    journal.on_start(job)
+    journal.on_finish(job, es.TableExtractResult('dbo', 'customer', status=es.STATUS_DONE))
+
+    with open(get_journal_file_name(output_directory)) as f:
+        entry = json.load(f)['tables']['dbo.customer']
+
+    tc.assertEqual(dummy_object, entry['status'], es.STATUS_DONE)
+    tc.assertEqual(dummy_object, sorted(entry['files']), ['customer.csv', 'customer_format.xml'])
+    tc.assertEqual(dummy_object, entry['bytes'], 16)
+    # not read again only to be journaled
+    tc.assertNotIn(dummy_object, 'md5', entry['files']['customer.csv'])
+    tc.assertTrue(dummy_object, get_journal_file_name(output_directory).endswith(os.path.join('20220101', 'jade.journal.json')))
+
+
+def test_done_table_is_journaled_with_given_checksums(tmp_path):
+    output_directory = str(tmp_path)
+    file_name = os.path.join(output_directory, 'customer.csv.gz')
+    _write(file_name, '1,a\n')
+
+    journal = ExtractJournal(output_directory, 'jade')
+    journal.on_finish(es.ExtractJob('dbo', 'customer'), es.TableExtractResult('dbo', 'customer', status=es.STATUS_DONE)
+                      , checksums={file_name: hashlib.md5(b'1,a\n').hexdigest()})
+
+    tc.assertEqual(dummy_object, journal.get('dbo', 'customer')['files']
+                   , {'customer.csv.gz': {'bytes': 4, 'md5': hashlib.md5(b'1,a\n').hexdigest()}})
+
+
+def test_resume_skips_only_done_tables(tmp_path):
+    output_directory = str(tmp_path)
+    _write(os.path.join(output_directory, 'customer.csv'), '1,a\n')
+
+    journal = ExtractJournal(output_directory, 'jade')
+    journal.add_pending([es.ExtractJob('dbo', 'customer'), es.ExtractJob('dbo', 'sales')])
+    journal.on_finish(es.ExtractJob('dbo', 'customer'), es.TableExtractResult('dbo', 'customer', status=es.STATUS_DONE))
+    journal.on_finish(es.ExtractJob('dbo', 'sales')
+                      , es.TableExtractResult('dbo', 'sales', status=es.STATUS_FAILED, error='data: exited with return code 1'))
+
+    resumed = ExtractJournal(output_directory, 'jade', resume=True)
+    tc.assertTrue(dummy_object, resumed.is_done('dbo', 'customer'))
+    tc.assertFalse(dummy_object, resumed.is_done('dbo', 'sales'))
+
+    # a file changed since the previous run
+    _write(os.path.join(output_directory, 'customer.csv'), '1,a\n2,b\n')
+    tc.assertFalse(dummy_object, resumed.is_done('dbo', 'customer'))
+
+    # without resume the journal starts over
+    tc.assertIsNone(dummy_object, ExtractJournal(output_directory, 'jade').get('dbo', 'customer'))
@@ -0,0 +1,138 @@
+from unittest import TestCase as tc
+from subprocess import CompletedProcess
+import threading
+import time
+
+import pytest
+
+from src.process_source_system import extract_scheduler as es
+
+
+dummy_object = tc()
+
+
+def _completed(returncode=0, **kwargs):
+    return CompletedProcess(args='bcp', returncode=returncode)
+
+
+def test_jobs_run_all_steps_in_order():
+    calls = []
+
+    def step(name):
+        calls.append(name)
+        return _completed()
+
+    job = es.ExtractJob('dbo', 'customer', [es.ExtractStep('format', step, {'name': 'format'})
+                                            , es.ExtractStep('data', step, {'name': 'data'})])
+    results = es.run_extract_jobs([job], max_workers=2)
+
+    tc.assertEqual(dummy_object, calls, ['format', 'data'])
+    tc.assertEqual(dummy_object, results[0].status, es.STATUS_DONE)
+    tc.assertEqual(dummy_object, results[0].return_codes, {'format': 0, 'data': 0})
+
+
+def test_rows_reported_by_the_steps_are_recorded():
+    from src.process_source_system.native_extract import NativeExtractResult
+
+    native = es.ExtractJob('dbo', 'customer', [es.ExtractStep('format', _completed)
+                                               , es.ExtractStep('data', lambda: NativeExtractResult('customer.csv', 0, 42))])
+    bcp = es.ExtractJob('dbo', 'sales', [es.ExtractStep('data', _completed)])
+    results = es.run_extract_jobs([native, bcp])
+
+    tc.assertEqual(dummy_object, results[0].rows_extracted, 42)
+    tc.assertIsNone(dummy_object, results[1].rows_extracted)
+
+
+def test_failed_step_stops_job():
+    '''
+    A non zero return code fails the table and skips its remaining steps.
+    '''
+    calls = []
+
+    def failing(**kwargs):
+        calls.append('format')
+        return _completed(returncode=1)
+
+    def data(**kwargs):
+        calls.append('data')
+        return _completed()
+
+    job = es.ExtractJob('dbo', 'sales', [es.ExtractStep('format', failing), es.ExtractStep('data', data)])
+    result = es.run_extract_jobs([job])[0]
+
+    tc.assertEqual(dummy_object, result.status, es.STATUS_FAILED)
+    tc.assertEqual(dummy_object, calls, ['format'])
+
+
+def test_exception_is_recorded_not_raised():
+
+    def boom(**kwargs):
+        raise OSError('disk full')
+
+    result = es.run_extract_jobs([es.ExtractJob('dbo', 'sales', [es.ExtractStep('data', boom)])])[0]
+
+    tc.assertEqual(dummy_object, result.status, es.STATUS_FAILED)
+    tc.assertIn(dummy_object, 'disk full', result.error)
+
+
+def test_jobs_run_concurrently_within_bound():
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow(**kwargs):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        return _completed()
+
+    jobs = [es.ExtractJob('dbo', f'tbl_{i}', [es.ExtractStep('data', slow)]) for i in range(8)]
+    results = es.run_extract_jobs(jobs, max_workers=3)
+
+    tc.assertEqual(dummy_object, [r.tbl_name for r in results], [f'tbl_{i}' for i in range(8)])
+    tc.assertTrue(dummy_object, 1 < max(peak) <= 3)
+
+
+def test_invalid_max_workers():
+    with pytest.raises(ValueError):
+        es.run_extract_jobs([], max_workers=0)
+
+
+def test_order_jobs_biggest_first():
+    jobs = [es.ExtractJob('dbo', name) for name in ['small', 'unknown', 'huge', 'medium']]
+    sizes = {('dbo', 'small'): (10, 1), ('dbo', 'huge'): (10 ** 9, 10 ** 6), ('dbo', 'medium'): (10 ** 5, 500)}
+
+    ordered = es.order_jobs_by_size(jobs, sizes)
+
+    tc.assertEqual(dummy_object, [j.tbl_name for j in ordered], ['huge', 'medium', 'small', 'unknown'])
+    tc.assertEqual(dummy_object, ordered[0].row_count, 10 ** 9)
+    tc.assertIsNone(dummy_object, ordered[-1].reserved_pages)
+
+
+def test_report_shows_estimates():
+    job = es.ExtractJob('dbo', 'huge', [es.ExtractStep('data', _completed)], row_count=1234, reserved_pages=128)
+    report = es.get_extract_report(es.run_extract_jobs([job]))
+
+    tc.assertIn(dummy_object, '1234', report)
+    tc.assertIn(dummy_object, '1.0', report) # 128 pages * 8 KB = 1 MB
+
+
+def test_callbacks_observe_every_job():
+    events = []
+
+    def broken_callback(job, result):
+        raise OSError('disk full')
+
+    jobs = [es.ExtractJob('dbo', 'customer', [es.ExtractStep('data', _completed)])
+            , es.ExtractJob('dbo', 'sales', [es.ExtractStep('data', _completed, {'returncode': 1})])]
+    results = es.run_extract_jobs(jobs, max_workers=1, on_start=lambda job: events.append(('start', job.tbl_name))
+                                  , on_finish=lambda job, result: events.append((result.status, job.tbl_name)))
+
+    tc.assertEqual(dummy_object, events, [('start', 'customer'), (es.STATUS_DONE, 'customer')
+                                          , ('start', 'sales'), (es.STATUS_FAILED, 'sales')])
+    # a failing callback does not fail the job
+    results = es.run_extract_jobs(jobs[:1], on_finish=broken_callback)
+    tc.assertEqual(dummy_object, results[0].status, es.STATUS_DONE)
@@ -1,5 +1,257 @@
-# TODO: Test cases for extract source systems
 from unittest import TestCase as tc
+from contextlib import contextmanager
+import gzip
+import json
+import os
+import stat
+import subprocess
+import sys
 
-from src.etl.source_data import extract_source_systems as ess
+import pytest
 
+pytest.importorskip('pyodbc')
+pytest.importorskip('pytz')
+
+from src.process_source_system import extract__source_systems as ess
+from src.process_source_system import extract_scheduler as es
+from src.process_source_system.extract_journal import get_journal_file_name
+from src.process_source_system.table_artifacts import ARTIFACT_MANIFEST_FILE
+from src.process_source_system.schema_capture import ColumnDefinition
+from src.process_source_system.schema_cache import SchemaCache
+from src.process_source_system.watermark_store import WatermarkStore
+
+
+dummy_object = tc()
+
+COLUMNS = [ColumnDefinition(1, 'id', 'int', 4, 10, 0, False)]
+
+
+class FakePool:
+
+    @contextmanager
+    def connection(self):
+        yield None
+
+
+@pytest.fixture
+def fake_database(monkeypatch):
+    '''
+        extract() against fake bcp steps; returns the tables whose format was dumped.
+    '''
+    dumped_formats = []
+
+    def dump_table_format(db_name, tbl_name, outputfile_path, schema_name='dbo', **kwargs):
+        dumped_formats.append(tbl_name)
+        os.makedirs(outputfile_path, exist_ok=True)
+        with open(os.path.join(outputfile_path, f'{tbl_name}_format.xml'), 'w') as f:
+            f.write('<BCPFORMAT/>')
+        return subprocess.CompletedProcess(args=tbl_name, returncode=0)
+
+    def full_extract(db_name, tbl_name, outputfile_path, **kwargs):
+        os.makedirs(outputfile_path, exist_ok=True)
+        with open(os.path.join(outputfile_path, f'{tbl_name}.csv'), 'w', newline='') as f:
+            f.write('1,a\n2,b\n')
+        return subprocess.CompletedProcess(args=tbl_name, returncode=0)
+
+    monkeypatch.setattr(ess, 'get_connection_pool', lambda *args, **kwargs: FakePool())
+    monkeypatch.setattr(ess.schema_capture, 'get_table_schemas'
+                        , lambda connection, db_name, schemas, table_names:
+                            {('dbo', tbl_name): COLUMNS for tbl_name in table_names})
+    monkeypatch.setattr(ess, 'dump_table_format', dump_table_format)
+    monkeypatch.setattr(ess, 'db_dump_full_extract', full_extract)
+
+    return dumped_formats
+
+
+def test_bcp_format_is_dumped_only_for_changed_schemas(tmp_path, fake_database):
+    schema_cache = SchemaCache(os.path.join(tmp_path, 'schema_cache.db'))
+
+    for date in ('20220101', '20220102'):
+        results = ess.extract('jade', table_names=['customer'], extract_format=True, bulk_format=False
+                              , top_level_directory=str(tmp_path), date=date, order_by_size=False
+                              , schema_cache=schema_cache)
+
+        tc.assertEqual(dummy_object, [r.status for r in results], [es.STATUS_DONE])
+        tc.assertTrue(dummy_object, os.path.isfile(os.path.join(tmp_path, date, 'jade', 'customer_format.xml')))
+
+    # the second run reuses the format of the first one
+    tc.assertEqual(dummy_object, fake_database, ['customer'])
+
+
+def test_artifact_compression_compresses_every_table(tmp_path, fake_database):
+    results = ess.extract('jade', table_names=['customer', 'sales'], top_level_directory=str(tmp_path)
+                          , date='20220101', order_by_size=False, max_workers=2, artifact_compression='gzip')
+    output_directory = os.path.join(tmp_path, '20220101', 'jade')
+
+    tc.assertEqual(dummy_object, [r.status for r in results], [es.STATUS_DONE, es.STATUS_DONE])
+    with open(os.path.join(output_directory, ARTIFACT_MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+
+    for tbl_name in ('customer', 'sales'):
+        file_name = os.path.join(output_directory, f'{tbl_name}.csv.gz')
+        with gzip.open(file_name, 'rb') as f:
+            tc.assertEqual(dummy_object, f.read(), b'1,a\n2,b\n')
+        tc.assertFalse(dummy_object, os.path.exists(os.path.join(output_directory, f'{tbl_name}.csv')))
+
+        entry = manifest['tables'][f'dbo.{tbl_name}']['files'][f'{tbl_name}.csv.gz']
+        tc.assertEqual(dummy_object, entry['bytes'], os.path.getsize(file_name))
+        tc.assertEqual(dummy_object, entry['lines'], 2)
+
+    # journaled with the compressed files, and the MD5s of the manifest
+    with open(get_journal_file_name(output_directory)) as f:
+        journaled = json.load(f)['tables']['dbo.customer']['files']
+    tc.assertEqual(dummy_object, journaled['customer.csv.gz']['md5']
+                   , manifest['tables']['dbo.customer']['files']['customer.csv.gz']['md5'])
+
+
+def test_tables_of_several_schemas_never_share_files(tmp_path, fake_database, monkeypatch):
+    # customer exists in both schemas, orders in sales only
+    monkeypatch.setattr(ess, 'get_tables', lambda db_name, connection, schemas:
+                        [('dbo', 'customer'), ('sales', 'customer'), ('sales', 'orders')])
+
+    results = ess.extract('jade', schemas=['dbo', 'sales'], table_names=['customer', 'orders']
+                          , top_level_directory=str(tmp_path), date='20220101', order_by_size=False
+                          , max_workers=3, artifact_compression='gzip')
+    output_directory = os.path.join(tmp_path, '20220101', 'jade')
+
+    tc.assertEqual(dummy_object, sorted((r.schema_name, r.tbl_name, r.status) for r in results), [
+        ('dbo', 'customer', es.STATUS_DONE), ('sales', 'customer', es.STATUS_DONE)
+        , ('sales', 'orders', es.STATUS_DONE)])
+    for relative_name in ('dbo/customer.csv.gz', 'sales/customer.csv.gz', 'sales/orders.csv.gz'):
+        tc.assertTrue(dummy_object, os.path.isfile(os.path.join(output_directory, relative_name)))
+
+    with open(os.path.join(output_directory, ARTIFACT_MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    tc.assertEqual(dummy_object, list(manifest['tables']['sales.customer']['files'])
+                   , [os.path.join('sales', 'customer.csv.gz')])
+
+    # resumed from the journaled files of each schema
+    results = ess.extract('jade', schemas=['dbo', 'sales'], table_names=['customer', 'orders']
+                          , top_level_directory=str(tmp_path), date='20220101', order_by_size=False
+                          , resume=True)
+    tc.assertEqual(dummy_object, {r.status for r in results}, {es.STATUS_SKIPPED})
+
+
+class SourceClockConnection:
+    '''
+        Answers the current time queries of the source server.
+    '''
+
+    def __init__(self):
+        self.queries = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, *params):
+        self.queries.append(query)
+        return self
+
+    def fetchone(self):
+        return ('2022-01-01 09:00:00',)
+
+
+def test_watermark_is_read_from_the_source_clock(tmp_path, fake_database, monkeypatch):
+    connection = SourceClockConnection()
+
+    class SourcePool:
+
+        @contextmanager
+        def connection(self):
+            yield connection
+
+    extracted = []
+
+    def incremental_extract(**kwargs):
+        extracted.append((kwargs['last_extract_time'], kwargs['current_extract_time']))
+        return subprocess.CompletedProcess(args=kwargs['tbl_name'], returncode=0)
+
+    monkeypatch.setattr(ess, 'get_connection_pool', lambda *args, **kwargs: SourcePool())
+    monkeypatch.setattr(ess, 'db_dump_incremental_extract', incremental_extract)
+    watermark_store = WatermarkStore(os.path.join(tmp_path, 'watermarks.db'))
+    watermark_store.set('jade', 'dbo', 'sales', 'modified_at', '2021-12-31 09:00:00')
+
+    results = ess.extract('jade', lte_column='modified_at', table_names=['sales'], extract_mode='incremental'
+                          , use_watermarks=True, watermark_store=watermark_store, top_level_directory=str(tmp_path)
+                          , date='20220101', order_by_size=False, lte_time_zone='utc')
+
+    tc.assertEqual(dummy_object, [r.status for r in results], [es.STATUS_DONE])
+    # upper bound and next watermark from the server, not from this host
+    tc.assertEqual(dummy_object, extracted, [('2021-12-31 09:00:00', '2022-01-01 09:00:00')])
+    tc.assertEqual(dummy_object, watermark_store.get('jade', 'dbo', 'sales', 'modified_at'), '2022-01-01 09:00:00')
+    tc.assertIn(dummy_object, 'SYSUTCDATETIME()', connection.queries[0])
+
+
+FAKE_BCP = '''#!{python}
+import json, os, stat, sys
+# records its arguments, and whether it writes into a named pipe
+with open(os.path.join(os.path.dirname(__file__), 'bcp_calls.json'), 'a') as f:
+    fifo = os.path.exists(sys.argv[3]) and stat.S_ISFIFO(os.stat(sys.argv[3]).st_mode)
+    f.write(json.dumps({{'argv': sys.argv[1:], 'fifo': fifo}}) + '\\n')
+with open(sys.argv[3], 'wb') as f:
+    f.write(b'1,a\\n2,b\\n')
+sys.exit(int(os.environ.get('FAKE_BCP_RETURNCODE', '0')))
+'''
+
+
+@pytest.fixture
+def fake_bcp(tmp_path, monkeypatch):
+    '''
+        A bcp executable first on the PATH; returns the file its calls are recorded in.
+    '''
+    bin_directory = os.path.join(tmp_path, 'bin')
+    os.makedirs(bin_directory)
+    bcp_file_name = os.path.join(bin_directory, 'bcp')
+    with open(bcp_file_name, 'w') as f:
+        f.write(FAKE_BCP.format(python=sys.executable))
+    os.chmod(bcp_file_name, os.stat(bcp_file_name).st_mode | stat.S_IEXEC)
+
+    monkeypatch.setenv('PATH', bin_directory + os.pathsep + os.environ.get('PATH', ''))
+    return os.path.join(bin_directory, 'bcp_calls.json')
+
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='bcp writes into a named pipe on POSIX only')
+def test_bcp_output_is_compressed_in_flight(tmp_path, fake_bcp, monkeypatch):
+    output_directory = os.path.join(tmp_path, 'jade')
+    log_directory = os.path.join(tmp_path, 'log')
+
+    completed = ess.db_dump_full_extract('jade', 'customer', output_directory, log_file_path=log_directory
+                                         , error_file_path=log_directory, compression='gzip')
+
+    tc.assertEqual(dummy_object, completed.returncode, 0)
+    tc.assertEqual(dummy_object, os.listdir(output_directory), ['customer.csv.gz'])
+    with gzip.open(os.path.join(output_directory, 'customer.csv.gz'), 'rb') as f:
+        tc.assertEqual(dummy_object, f.read(), b'1,a\n2,b\n')
+
+    with open(fake_bcp) as f:
+        call = json.loads(f.readline())
+    # no plain csv written: bcp wrote into the fifo
+    tc.assertTrue(dummy_object, call['fifo'])
+    tc.assertEqual(dummy_object, call['argv'], [
+        'jade.dbo.customer', 'out', os.path.join(output_directory, 'customer.csv.fifo'), '-c', '-t,'
+        , '-o', os.path.join(log_directory, 'customer_output.log')
+        , '-e', os.path.join(log_directory, 'customer_error.log'), '-T'])
+
+    # a failed bcp leaves nothing behind
+    monkeypatch.setenv('FAKE_BCP_RETURNCODE', '1')
+    with pytest.raises(subprocess.CalledProcessError):
+        ess.db_dump_full_extract('jade', 'customer', output_directory, log_file_path=log_directory
+                                 , error_file_path=log_directory, compression='gzip')
+    tc.assertEqual(dummy_object, os.listdir(output_directory), [])
+
+
+def test_bcp_query_is_a_single_argument(tmp_path, fake_bcp):
+    output_directory = os.path.join(tmp_path, 'jade')
+    log_directory = os.path.join(tmp_path, 'log')
+
+    ess.db_dump_incremental_extract('jade', 'sales', '2022-01-01 00:00:00', 'modified_at', '2022-01-02 00:00:00'
+                                    , output_directory, log_directory, log_directory
+                                    , userName='etl', password='secret')
+
+    with open(fake_bcp) as f:
+        argv = json.loads(f.readline())['argv']
+    tc.assertEqual(dummy_object, argv[:4], [
+        "SELECT * FROM jade.dbo.sales WHERE [modified_at] <= '2022-01-02 00:00:00'"
+        " AND [modified_at] > '2022-01-01 00:00:00'"
+        , 'queryout', os.path.join(output_directory, 'sales.csv'), '-c'])
+    tc.assertEqual(dummy_object, argv[-4:], ['-U', 'etl', '-P', 'secret'])
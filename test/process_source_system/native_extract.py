@@ -0,0 +1,219 @@
+from unittest import TestCase as tc
+from datetime import datetime
+import os
+import struct
+
+import pytest
+
+from src.process_source_system import native_extract as ne
+
+
+dummy_object = tc()
+
+
+class FakeCursor:
+    '''
+    Minimal stand in of a pyodbc cursor.
+    '''
+
+    def __init__(self, rows, description=(('id', int, None, 10, 10, 0, False), ('name', str, None, 50, 50, 0, True))
+                 , column_types=()):
+        self.rows = list(rows)
+        self.column_types = list(column_types)
+        self.description = description
+        self.arraysize = 1
+        self.fetch_sizes = []
+        self.closed = False
+
+    def execute(self, query, *params):
+        self.query = query
+        self.params = params
+        return self
+
+    def fetchall(self):
+        # INFORMATION_SCHEMA.COLUMNS
+        return self.column_types
+
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.output_converters = {}
+
+    def cursor(self):
+        return self._cursor
+
+    def add_output_converter(self, sql_type, func):
+        self.output_converters[sql_type] = func
+
+
+def test_estimate_fetch_size_bounds():
+    narrow = [('id', int, None, 4, 10, 0, False)]
+    wide = [('blob', bytes, None, 0, 0, 0, True)] * 1000
+
+    tc.assertEqual(dummy_object, ne.estimate_fetch_size(narrow), ne.MAX_FETCH_SIZE)
+    tc.assertEqual(dummy_object, ne.estimate_fetch_size(wide), ne.MIN_FETCH_SIZE)
+
+
+def test_format_value():
+    tc.assertEqual(dummy_object, ne.format_value(None), '')
+    tc.assertEqual(dummy_object, ne.format_value(True), '1')
+    tc.assertEqual(dummy_object, ne.format_value(datetime(2022, 1, 30, 23, 21, 18)), '2022-01-30 23:21:18.000')
+    tc.assertEqual(dummy_object, ne.format_value(b'\x0a\xff'), '0AFF')
+
+
+def test_full_extract_streams_all_rows(tmp_path):
+    rows = [(i, f'name, {i}') for i in range(25)]
+    cursor = FakeCursor(rows)
+
+    result = ne.native_full_extract(FakeConnection(cursor), 'jade', 'customer', str(tmp_path), fetch_size=10)
+
+    tc.assertEqual(dummy_object, result.returncode, 0)
+    tc.assertEqual(dummy_object, result.row_count, 25)
+    tc.assertEqual(dummy_object, cursor.fetch_sizes, [10, 10, 10, 10])
+    tc.assertTrue(dummy_object, cursor.closed)
+
+    with open(os.path.join(tmp_path, 'customer.csv'), newline='') as f:
+        lines = f.read().splitlines()
+    tc.assertEqual(dummy_object, len(lines), 25)
+    # embedded delimiter is quoted
+    tc.assertEqual(dummy_object, lines[0], '0,"name, 0"')
+
+
+def test_types_pyodbc_can_not_fetch(tmp_path):
+    cursor = FakeCursor([], column_types=[('id', 'int', 10, 0), ('changed_at', 'datetimeoffset', 7, None)
+                                          , ('attribute', 'sql_variant', None, None)])
+    connection = FakeConnection(cursor)
+
+    ne.native_full_extract(connection, 'jade', 'customer', str(tmp_path))
+
+    # sql_variant is cast in the select list
+    tc.assertEqual(dummy_object, cursor.query, 'SELECT [id], [changed_at], CAST([attribute] AS nvarchar(max))'
+                                               ' AS [attribute] FROM jade.dbo.customer')
+    # datetimeoffset is converted from its ODBC struct
+    convert = connection.output_converters[ne.SQL_DATETIMEOFFSET]
+    tc.assertEqual(dummy_object, convert(struct.pack('<6hI2h', 2022, 1, 30, 23, 21, 18, 123456700, 5, 30))
+                   , '2022-01-30 23:21:18.1234567 +05:30')
+    tc.assertEqual(dummy_object, convert(struct.pack('<6hI2h', 2022, 1, 30, 23, 21, 18, 0, -3, -30))
+                   , '2022-01-30 23:21:18.0000000 -03:30')
+    tc.assertIsNone(dummy_object, convert(None))
+
+    # other tables keep SELECT *
+    tc.assertEqual(dummy_object, ne.get_select_list([('id', 'int', 10, 0)]), '*')
+
+
+def test_incremental_extract_uses_parameters(tmp_path):
+    cursor = FakeCursor([])
+
+    ne.native_incremental_extract(FakeConnection(cursor), 'jade', 'sales', '2022-01-01', 'modified_at'
+                                  , '2022-01-02', str(tmp_path))
+
+    tc.assertEqual(dummy_object, cursor.params, ('2022-01-02', '2022-01-01'))
+    tc.assertIn(dummy_object, '[modified_at] > ?', cursor.query)
+
+
+def test_incremental_extract_without_lower_bound(tmp_path):
+    cursor = FakeCursor([])
+
+    ne.native_incremental_extract(FakeConnection(cursor), 'jade', 'sales', None, 'modified_at'
+                                  , '2022-01-02', str(tmp_path))
+
+    tc.assertEqual(dummy_object, cursor.params, ('2022-01-02',))
+    tc.assertNotIn(dummy_object, '>', cursor.query)
+
+
+def test_failed_write_leaves_no_file(tmp_path):
+
+    class BadCursor(FakeCursor):
+        def fetchmany(self, size):
+            raise OSError('connection reset')
+
+    with pytest.raises(OSError):
+        ne.native_full_extract(FakeConnection(BadCursor([])), 'jade', 'sales', str(tmp_path))
+
+    tc.assertEqual(dummy_object, os.listdir(tmp_path), [])
+
+
+def test_full_extract_compressed_while_written(tmp_path):
+    import gzip
+
+    result = ne.native_full_extract(FakeConnection(FakeCursor([(1, 'a'), (2, 'b')])), 'jade', 'customer'
+                                    , str(tmp_path), compression='gzip')
+
+    tc.assertEqual(dummy_object, os.listdir(tmp_path), ['customer.csv.gz'])
+    tc.assertEqual(dummy_object, result.args, os.path.join(tmp_path, 'customer.csv.gz'))
+    with gzip.open(result.args, 'rb') as f:
+        tc.assertEqual(dummy_object, f.read(), b'1,a\r\n2,b\r\n')
+
+
+def test_parquet_file_name_has_no_codec_extension():
+    tc.assertEqual(dummy_object, ne.get_output_file_name('out', 'sales', 'parquet', 'gzip')
+                   , os.path.join('out', 'sales.parquet'))
+    tc.assertEqual(dummy_object, ne.get_output_file_name('out', 'sales', 'csv', 'gzip')
+                   , os.path.join('out', 'sales.csv.gz'))
+
+
+def test_unsupported_output_format():
+    with pytest.raises(ValueError):
+        ne.open_row_writer('sales.json', output_format='json')
+
+
+def test_parquet_types_from_sql_types():
+    pyarrow = pytest.importorskip('pyarrow')
+
+    tc.assertEqual(dummy_object, ne.arrow_type('int'), pyarrow.int32())
+    tc.assertEqual(dummy_object, ne.arrow_type('numeric', 12, 2), pyarrow.decimal128(12, 2))
+    tc.assertEqual(dummy_object, ne.arrow_type('datetime2', 7), pyarrow.timestamp('us'))
+    tc.assertEqual(dummy_object, ne.arrow_type('uniqueidentifier'), pyarrow.string())
+
+
+def test_parquet_row_groups(tmp_path):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+
+    rows = [(i, f'name {i % 3}') for i in range(25)]
+    file_name = os.path.join(tmp_path, 'customer.parquet')
+
+    row_count = ne.extract_query(FakeConnection(FakeCursor(rows)), 'SELECT * FROM customer', [], file_name
+                                 , fetch_size=10, output_format='parquet'
+                                 , column_types=[('id', 'int', 10, 0), ('name', 'nvarchar', None, None)]
+                                 , row_group_size=10)
+
+    parquet_file = pyarrow.parquet.ParquetFile(file_name)
+    tc.assertEqual(dummy_object, row_count, 25)
+    tc.assertEqual(dummy_object, parquet_file.metadata.num_row_groups, 3)
+    tc.assertEqual(dummy_object, str(parquet_file.schema_arrow.field('id').type), 'int32')
+    tc.assertEqual(dummy_object, parquet_file.read().to_pylist()[24], {'id': 24, 'name': 'name 0'})
+
+
+def test_extract_into_output_stream(tmp_path):
+    import io
+    from contextlib import contextmanager
+
+    streams = {}
+
+    class KeptBytesIO(io.BytesIO):
+        def close(self):
+            ''
+
+    @contextmanager
+    def open_stream(file_name):
+        streams[file_name] = KeptBytesIO()
+        yield streams[file_name]
+
+    result = ne.native_full_extract(FakeConnection(FakeCursor([(1, 'a'), (2, 'b')])), 'jade', 'customer'
+                                    , str(tmp_path), output_stream_factory=open_stream)
+
+    tc.assertEqual(dummy_object, result.row_count, 2)
+    # nothing staged locally
+    tc.assertEqual(dummy_object, os.listdir(tmp_path), [])
+    tc.assertEqual(dummy_object, streams[os.path.join(tmp_path, 'customer.csv')].getvalue(), b'1,a\r\n2,b\r\n')
@@ -0,0 +1,63 @@
+from unittest import TestCase as tc
+import os
+import sqlite3
+
+import pytest
+
+from src.process_source_system import schema_capture
+from src.process_source_system.schema_capture import ColumnDefinition
+from src.process_source_system.schema_cache import SchemaCache, get_fingerprint
+
+
+dummy_object = tc()
+
+COLUMNS = [ColumnDefinition(1, 'id', 'int', 4, 10, 0, False)
+           , ColumnDefinition(2, 'name', 'nvarchar', 100, 0, 0, True, 'SQL_Latin1_General_CP1_CI_AS')]
+
+
+def test_fingerprint_changes_with_definition():
+    changed = [COLUMNS[0], ColumnDefinition(2, 'name', 'nvarchar', 200, 0, 0, True, 'SQL_Latin1_General_CP1_CI_AS')]
+
+    tc.assertEqual(dummy_object, get_fingerprint(COLUMNS), get_fingerprint(list(COLUMNS)))
+    tc.assertNotEqual(dummy_object, get_fingerprint(COLUMNS), get_fingerprint(changed))
+
+
+def test_unchanged_schema_reuses_previous_file(tmp_path):
+    cache = SchemaCache(os.path.join(tmp_path, 'schema_cache.db'))
+    fingerprint = get_fingerprint(COLUMNS)
+    previous = schema_capture.write_format_file(os.path.join(tmp_path), 'customer', COLUMNS)
+    cache.set('jade', 'dbo', 'customer', fingerprint, previous)
+
+    new_file_name = os.path.join(tmp_path, '20220102', 'customer_format.xml')
+
+    tc.assertTrue(dummy_object, cache.reuse('jade', 'dbo', 'customer', fingerprint, new_file_name))
+    tc.assertTrue(dummy_object, os.path.samefile(previous, new_file_name))
+    tc.assertFalse(dummy_object, cache.reuse('jade', 'dbo', 'customer', 'other', new_file_name))
+    tc.assertFalse(dummy_object, cache.reuse('jade', 'dbo', 'sales', fingerprint, new_file_name))
+
+
+def test_rewrite_does_not_change_linked_file(tmp_path):
+    cache = SchemaCache(os.path.join(tmp_path, 'schema_cache.db'))
+    previous = schema_capture.write_format_file(str(tmp_path), 'customer', COLUMNS)
+    cache.set('jade', 'dbo', 'customer', get_fingerprint(COLUMNS), previous)
+    cache.reuse('jade', 'dbo', 'customer', get_fingerprint(COLUMNS), os.path.join(tmp_path, 'new', 'customer_format.xml'))
+
+    schema_capture.write_format_file(os.path.join(tmp_path, 'new'), 'customer', COLUMNS[:1])
+
+    with open(previous) as f:
+        tc.assertIn(dummy_object, 'NAME="name"', f.read())
+
+
+def test_cache_closes_its_connections(tmp_path, monkeypatch):
+    connections = []
+    connect = SchemaCache._connect
+    monkeypatch.setattr(SchemaCache, '_connect', lambda self: connections.append(connect(self)) or connections[-1])
+
+    cache = SchemaCache(os.path.join(tmp_path, 'schema_cache.db'))
+    cache.set('jade', 'dbo', 'customer', get_fingerprint(COLUMNS), os.path.join(tmp_path, 'customer_format.xml'))
+    cache.get('jade', 'dbo', 'customer')
+
+    tc.assertEqual(dummy_object, len(connections), 3)
+    for connection in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            connection.execute('SELECT 1')
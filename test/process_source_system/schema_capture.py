@@ -0,0 +1,80 @@
+from unittest import TestCase as tc
+import json
+import os
+import xml.etree.ElementTree as ET
+
+from src.process_source_system import schema_capture as sc
+
+
+dummy_object = tc()
+
+ROWS = [
+    ('dbo', 'customer', 1, 'id', 'int', 4, 10, 0, False, None)
+    , ('dbo', 'customer', 2, 'name', 'nvarchar', 100, 0, 0, True, 'SQL_Latin1_General_CP1_CI_AS')
+    , ('dbo', 'customer', 3, 'balance', 'decimal', 9, 12, 2, True, None)
+    , ('dbo', 'sales', 1, 'notes', 'varchar', -1, 0, 0, True, 'SQL_Latin1_General_CP1_CI_AS')
+]
+
+
+class FakeCursor:
+
+    def execute(self, query, *params):
+        self.query = query
+        self.params = params
+        return self
+
+    def fetchall(self):
+        return ROWS
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self._cursor = FakeCursor()
+
+    def cursor(self):
+        return self._cursor
+
+
+def test_single_query_for_all_tables():
+    connection = FakeConnection()
+
+    table_schemas = sc.get_table_schemas(connection, 'jade', ['dbo'], ['customer', 'sales'])
+
+    tc.assertEqual(dummy_object, connection._cursor.params, ('dbo', 'customer', 'sales'))
+    tc.assertEqual(dummy_object, list(table_schemas), [('dbo', 'customer'), ('dbo', 'sales')])
+    tc.assertEqual(dummy_object, [c.name for c in table_schemas[('dbo', 'customer')]], ['id', 'name', 'balance'])
+
+
+def test_render_format_xml():
+    columns = sc.get_table_schemas(FakeConnection(), 'jade')[('dbo', 'customer')]
+    namespaces = {'f': sc.FORMAT_NAMESPACE, 'xsi': sc.XSI_NAMESPACE}
+    xsi_type = f'{{{sc.XSI_NAMESPACE}}}type'
+
+    root = ET.fromstring(sc.render_format_xml(columns))
+    fields = root.findall('f:RECORD/f:FIELD', namespaces)
+    row_columns = root.findall('f:ROW/f:COLUMN', namespaces)
+
+    tc.assertEqual(dummy_object, [f.get('TERMINATOR') for f in fields], [',', ',', r'\r\n'])
+    tc.assertEqual(dummy_object, [f.get('MAX_LENGTH') for f in fields], ['12', '100', '41'])
+    tc.assertEqual(dummy_object, fields[1].get('COLLATION'), 'SQL_Latin1_General_CP1_CI_AS')
+    tc.assertEqual(dummy_object, [c.get(xsi_type) for c in row_columns], ['SQLINT', 'SQLNVARCHAR', 'SQLDECIMAL'])
+    tc.assertIsNone(dummy_object, row_columns[0].get('NULLABLE'))
+    tc.assertEqual(dummy_object, (row_columns[2].get('PRECISION'), row_columns[2].get('SCALE')), ('12', '2'))
+
+
+def test_max_types_have_no_max_length():
+    column = sc.ColumnDefinition(1, 'notes', 'varchar', -1, 0, 0, True)
+
+    tc.assertIsNone(dummy_object, sc.get_character_length(column))
+
+
+def test_capture_schemas_writes_files(tmp_path):
+    sc.capture_schemas(FakeConnection(), 'jade', str(tmp_path))
+
+    tc.assertEqual(dummy_object, sorted(os.listdir(tmp_path))
+                   , ['customer_format.xml', 'sales_format.xml', sc.SCHEMA_CATALOG_FILE])
+    with open(os.path.join(tmp_path, sc.SCHEMA_CATALOG_FILE)) as f:
+        catalog = json.load(f)
+    tc.assertEqual(dummy_object, len(catalog['tables']), 2)
+    tc.assertEqual(dummy_object, catalog['tables'][0]['columns'][1]['data_type'], 'nvarchar')
@@ -0,0 +1,123 @@
+from unittest import TestCase as tc
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import hashlib
+import json
+import os
+
+from src.process_source_system import extract_scheduler as es
+from src.process_source_system import table_partitioning
+from src.process_source_system.table_artifacts import ArtifactManifest, compress_table_files, describe_artifact
+from src.process_source_system.table_artifacts import set_row_count
+from src.process_source_system.table_artifacts import ARTIFACT_MANIFEST_FILE
+
+
+dummy_object = tc()
+
+
+def _write(file_name, content):
+    with open(file_name, 'w', newline='') as f:
+        f.write(content)
+
+
+def test_compress_table_files_compresses_only_data_files(tmp_path):
+    data_file_name = os.path.join(tmp_path, 'sales.csv')
+    format_file_name = os.path.join(tmp_path, 'sales_format.xml')
+    _write(data_file_name, '1,a\n2,b\n3,c')
+    _write(format_file_name, '<BCPFORMAT/>')
+
+    # the blocks are compressed in threads instead of processes; same code path
+    for executor in (None, ThreadPoolExecutor(max_workers=2)):
+        files, input_stats = compress_table_files([data_file_name, format_file_name], 'gzip'
+                                                  , executor=executor, remove_input=False)
+
+        tc.assertEqual(dummy_object, files, [data_file_name + '.gz', format_file_name])
+        tc.assertEqual(dummy_object, input_stats, {data_file_name + '.gz': {
+            'uncompressed_bytes': 11, 'uncompressed_md5': hashlib.md5(b'1,a\n2,b\n3,c').hexdigest(), 'lines': 2}})
+        with gzip.open(data_file_name + '.gz', 'rb') as f:
+            tc.assertEqual(dummy_object, f.read(), b'1,a\n2,b\n3,c')
+
+    compress_table_files([data_file_name], 'gzip')
+    tc.assertFalse(dummy_object, os.path.exists(data_file_name))
+
+
+def test_quoted_new_lines_are_not_rows(tmp_path):
+    # one row, as written by CsvRowWriter
+    file_name = os.path.join(tmp_path, 'notes.csv')
+    _write(file_name, '1,"first line\nsecond line"\n')
+
+    files, input_stats = compress_table_files([file_name], 'gzip')
+    files = {f: {'kind': 'data', **input_stats[f]} for f in files}
+    tc.assertEqual(dummy_object, files[file_name + '.gz']['lines'], 2)
+    tc.assertNotIn(dummy_object, 'rows', files[file_name + '.gz'])
+
+    # only the count reported by the extraction is a row count
+    set_row_count(files, 1)
+    tc.assertEqual(dummy_object, files[file_name + '.gz']['rows'], 1)
+
+    # never guessed for several data files, ex: partitioned slices
+    slices = {'t.part-0000.csv.gz': {'kind': 'data'}, 't.part-0001.csv.gz': {'kind': 'data'}}
+    set_row_count(slices, 10)
+    tc.assertNotIn(dummy_object, 'rows', slices['t.part-0000.csv.gz'])
+
+
+def test_partition_manifest_lists_compressed_slices(tmp_path):
+    parts = []
+    for part_number in range(2):
+        file_name = table_partitioning.get_part_file_name('sales', part_number)
+        _write(os.path.join(tmp_path, file_name), '1,a\n' * (part_number + 1))
+        parts.append({'file': file_name, 'lower': None, 'upper': None, 'returncode': 0, 'size_bytes': 4})
+    manifest_file_name = table_partitioning.write_manifest(str(tmp_path), 'jade', 'dbo', 'sales', 'id', parts)
+
+    files, _ = compress_table_files([manifest_file_name] + [os.path.join(tmp_path, p['file']) for p in parts]
+                                    , 'gzip')
+
+    with open(manifest_file_name) as f:
+        manifest_parts = json.load(f)['parts']
+    tc.assertEqual(dummy_object, [p['file'] for p in manifest_parts]
+                   , ['sales.part-0000.csv.gz', 'sales.part-0001.csv.gz'])
+    for part in manifest_parts:
+        tc.assertEqual(dummy_object, part['size_bytes'], os.path.getsize(os.path.join(tmp_path, part['file'])))
+    tc.assertEqual(dummy_object, files[0], manifest_file_name)
+
+
+def test_describe_artifact(tmp_path):
+    file_name = os.path.join(tmp_path, 'sales_format.xml')
+    _write(file_name, '<BCPFORMAT/>')
+
+    tc.assertEqual(dummy_object, describe_artifact(file_name), {
+        'kind': 'format', 'bytes': 12, 'md5': hashlib.md5(b'<BCPFORMAT/>').hexdigest()
+        , 'sha256': hashlib.sha256(b'<BCPFORMAT/>').hexdigest()})
+
+
+def test_manifest_lists_compressed_tables(tmp_path):
+    output_directory = os.path.join(tmp_path, '20220101', 'jade')
+    os.makedirs(output_directory)
+    _write(os.path.join(output_directory, 'customer.csv'), '1,a\n2,b\n')
+    _write(os.path.join(output_directory, 'customer_format.xml'), '<BCPFORMAT/>')
+    _write(os.path.join(output_directory, 'customer_address.csv'), '1,b\n')
+
+    artifacts = ArtifactManifest(output_directory, 'jade', 'gzip')
+    artifacts.compress_table('dbo', 'customer', 'gzip', row_count=2)
+    artifacts.add_table('dbo', 'sales', es.STATUS_FAILED)
+
+    with open(os.path.join(output_directory, ARTIFACT_MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+
+    customer = manifest['tables']['dbo.customer']
+    tc.assertEqual(dummy_object, customer['status'], es.STATUS_DONE)
+    tc.assertEqual(dummy_object, sorted(customer['files']), ['customer.csv.gz', 'customer_format.xml'])
+    tc.assertEqual(dummy_object, customer['files']['customer.csv.gz']['rows'], 2)
+    tc.assertNotIn(dummy_object, 'rows', customer['files']['customer_format.xml'])
+    tc.assertEqual(dummy_object, customer['files']['customer.csv.gz']['bytes']
+                   , os.path.getsize(os.path.join(output_directory, 'customer.csv.gz')))
+    tc.assertEqual(dummy_object, manifest['tables']['dbo.sales'], {
+        'status': es.STATUS_FAILED, 'updated_at': manifest['tables']['dbo.sales']['updated_at'], 'files': {}})
+    # other tables are left alone
+    tc.assertTrue(dummy_object, os.path.isfile(os.path.join(output_directory, 'customer_address.csv')))
+
+    # a resumed run keeps the tables of the previous one
+    resumed = ArtifactManifest(output_directory, 'jade', 'gzip', resume=True)
+    resumed.add_table('dbo', 'sales', es.STATUS_FAILED)
+    tc.assertIn(dummy_object, 'dbo.customer', resumed.manifest['tables'])
+    tc.assertNotIn(dummy_object, 'dbo.customer', ArtifactManifest(output_directory, 'jade').manifest['tables'])
@@ -0,0 +1,53 @@
+from unittest import TestCase as tc
+
+from src.process_source_system import table_partitioning as tp
+
+
+dummy_object = tc()
+
+
+def test_split_histogram_even_rows():
+    histogram = [(10, 100), (20, 100), (30, 100), (40, 100)]
+
+    tc.assertEqual(dummy_object, tp.split_histogram(histogram, 2), [20])
+    tc.assertEqual(dummy_object, tp.split_histogram(histogram, 4), [10, 20, 30])
+
+
+def test_split_histogram_skewed_rows():
+    '''
+    A single heavy step should not produce duplicate boundaries.
+    '''
+    histogram = [(1, 5), (2, 1000), (3, 5), (4, 5)]
+
+    tc.assertEqual(dummy_object, tp.split_histogram(histogram, 4), [2, 3])
+
+
+def test_split_histogram_single_partition():
+    tc.assertEqual(dummy_object, tp.split_histogram([(10, 100), (20, 100)], 1), [])
+
+
+def test_split_min_max():
+    tc.assertEqual(dummy_object, tp.split_min_max(0, 100, 4), [25, 50, 75])
+    tc.assertEqual(dummy_object, tp.split_min_max(1, 2, 8), [1])
+    tc.assertEqual(dummy_object, tp.split_min_max(None, None, 8), [])
+
+
+def test_key_ranges_cover_everything():
+    tc.assertEqual(dummy_object, tp.get_key_ranges([10, 20]), [(None, 10), (10, 20), (20, None)])
+    tc.assertEqual(dummy_object, tp.get_key_ranges([]), [(None, None)])
+
+
+def test_range_predicate():
+    tc.assertEqual(dummy_object, tp.build_range_predicate('id', None, 10, 'int'), '([id] <= 10 OR [id] IS NULL)')
+    tc.assertEqual(dummy_object, tp.build_range_predicate('id', 10, 20, 'int'), '[id] > 10 AND [id] <= 20')
+    tc.assertEqual(dummy_object, tp.build_range_predicate('id', 20, None, 'int'), '[id] > 20')
+    tc.assertEqual(dummy_object, tp.build_range_predicate('id', None, None, 'int'), '')
+
+
+def test_string_literal_is_escaped():
+    tc.assertEqual(dummy_object, tp.sql_literal("O'Brien", 'nvarchar'), "N'O''Brien'")
+    tc.assertEqual(dummy_object, tp.sql_literal('2021-01-01T00:00:00', 'datetime2'), "'2021-01-01T00:00:00'")
+
+
+def test_part_file_name():
+    tc.assertEqual(dummy_object, tp.get_part_file_name('sales_line', 3), 'sales_line.part-0003.csv')
@@ -0,0 +1,56 @@
+from unittest import TestCase as tc
+import os
+import sqlite3
+
+import pytest
+
+from src.process_source_system.watermark_store import WatermarkStore
+
+
+dummy_object = tc()
+
+
+def test_missing_watermark_is_none(tmp_path):
+    store = WatermarkStore(os.path.join(tmp_path, 'watermarks.db'))
+
+    tc.assertIsNone(dummy_object, store.get('jade', 'dbo', 'sales', 'modified_at'))
+
+
+def test_watermark_is_advanced_and_durable(tmp_path):
+    file_name = os.path.join(tmp_path, 'watermarks.db')
+    store = WatermarkStore(file_name)
+
+    store.set('jade', 'dbo', 'sales', 'modified_at', '2022-01-01 00:00:00')
+    store.set('jade', 'dbo', 'sales', 'modified_at', '2022-01-02 00:00:00')
+
+    # a new store on the same file sees the latest value
+    tc.assertEqual(dummy_object, WatermarkStore(file_name).get('jade', 'dbo', 'sales', 'modified_at')
+                   , '2022-01-02 00:00:00')
+
+
+def test_watermarks_are_per_table_and_column(tmp_path):
+    store = WatermarkStore(os.path.join(tmp_path, 'watermarks.db'))
+
+    store.set('jade', 'dbo', 'sales', 'modified_at', 'a')
+    store.set('jade', 'dbo', 'sales', 'created_at', 'b')
+    store.set('jade', 'dbo', 'customer', 'modified_at', 'c')
+    store.set('zerodha', 'dbo', 'sales', 'modified_at', 'd')
+
+    tc.assertEqual(dummy_object, store.get_all('jade'), {('jade', 'dbo', 'sales', 'modified_at'): 'a'
+                                                         , ('jade', 'dbo', 'sales', 'created_at'): 'b'
+                                                         , ('jade', 'dbo', 'customer', 'modified_at'): 'c'})
+
+
+def test_store_closes_its_connections(tmp_path, monkeypatch):
+    connections = []
+    connect = WatermarkStore._connect
+    monkeypatch.setattr(WatermarkStore, '_connect', lambda self: connections.append(connect(self)) or connections[-1])
+
+    store = WatermarkStore(os.path.join(tmp_path, 'watermarks.db'))
+    store.set('jade', 'dbo', 'sales', 'modified_at', '2022-01-01 00:00:00')
+    store.get('jade', 'dbo', 'sales', 'modified_at')
+
+    tc.assertEqual(dummy_object, len(connections), 3)
+    for connection in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            connection.execute('SELECT 1')
@@ -0,0 +1,182 @@
+from unittest import TestCase as tc
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+pytest.importorskip('aiobotocore')
+moto_server = pytest.importorskip('moto.server')
+
+from botocore.exceptions import ClientError
+
+from src.config.definitions import MB
+from src.utils.aws_utils.async_landing import AsyncS3Landing
+from src.utils.aws_utils.copy_to_landing import UPLOAD_STATUS_UPLOADED
+from src.utils.aws_utils.upload_verification import VERIFIED
+
+
+dummy_object = tc()
+BUCKET_NAME = 'bckt-entertainment-master'
+
+
+@pytest.fixture(scope='module')
+def endpoint_url():
+    '''
+    Local S3 stand-in.
+    '''
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    server = moto_server.ThreadedMotoServer(port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f'http://{host}:{port}'
+    server.stop()
+
+
+def test_upload_directory(tmp_path, endpoint_url):
+    directory = os.path.join(tmp_path, 'source_system_data', '20210701', 'jade')
+    os.makedirs(directory)
+    for i in range(20):
+        with open(os.path.join(directory, f'tbl_{i}_format.xml'), 'w') as f:
+            f.write(f'<BCPFORMAT>{i}</BCPFORMAT>')
+    with open(os.path.join(directory, 'sales.csv'), 'wb') as f:
+        f.write(os.urandom(12 * MB))
+
+    async def land():
+        async with AsyncS3Landing(profile=None, endpoint_url=endpoint_url) as s3_lan:
+            await s3_lan.s3_client.create_bucket(Bucket=BUCKET_NAME)
+            return await s3_lan.upload_directory(directory, BUCKET_NAME, 'landing', verify=True, poll_delay=0
+                                                 , multipart_threshold=8, multipart_chunksize=5)
+
+    results = asyncio.run(land())
+
+    tc.assertEqual(dummy_object, len(results), 21)
+    for result in results:
+        tc.assertEqual(dummy_object, result.status, UPLOAD_STATUS_UPLOADED)
+        tc.assertEqual(dummy_object, result.details['verification'], VERIFIED)
+
+    sales = next(r for r in results if r.key == 'landing/20210701/jade/sales.csv')
+    tc.assertTrue(dummy_object, sales.multipart)
+    tc.assertTrue(dummy_object, sales.details['etag'].endswith('-3'))
+
+
+def test_single_part_upload_verified(tmp_path, endpoint_url):
+    file_name = os.path.join(tmp_path, 'manifest.json')
+    with open(file_name, 'w') as f:
+        f.write('{"rows": 10}')
+
+    async def land():
+        async with AsyncS3Landing(profile=None, endpoint_url=endpoint_url) as s3_lan:
+            await s3_lan.s3_client.create_bucket(Bucket=BUCKET_NAME)
+            return await s3_lan.upload_file_to_bucket(file_name, BUCKET_NAME, 'jade/manifest.json'
+                                                      , check_transfered_data=True)
+
+    success_code, res = asyncio.run(land())
+
+    tc.assertEqual(dummy_object, success_code, 0)
+    tc.assertEqual(dummy_object, res['ETag'].strip('"'), hashlib.md5(b'{"rows": 10}').hexdigest())
+
+
+class FailingPartClient:
+    '''
+    Part 1 fails while the other parts are in flight.
+    '''
+
+    def __init__(self):
+        self.in_flight = 0
+        self.in_flight_at_abort = None
+
+    async def create_multipart_upload(self, **kwargs):
+        return {'UploadId': 'upload-1'}
+
+    async def upload_part(self, PartNumber, **kwargs):
+        if PartNumber == 1:
+            await asyncio.sleep(0.05)
+            raise ClientError({'Error': {'Code': 'InternalError', 'Message': 'part failed'}}, 'UploadPart')
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(10)
+        finally:
+            self.in_flight -= 1
+
+    async def abort_multipart_upload(self, **kwargs):
+        self.in_flight_at_abort = self.in_flight
+
+
+def test_failed_part_cancels_the_others_before_abort(tmp_path):
+    file_name = os.path.join(tmp_path, 'sales.csv')
+    with open(file_name, 'wb') as f:
+        f.write(os.urandom(40))
+
+    s3_lan = AsyncS3Landing(profile=None)
+    s3_lan.s3_client = FailingPartClient()
+
+    # 4 parts of 10 bytes, all in flight
+    success_code = asyncio.run(s3_lan.upload_file_to_bucket_multipart(BUCKET_NAME, file_name, 'sales.csv'
+                                    , multipart_threshold=10, max_concurrency=4, threshold_unit=1
+                                    , multipart_chunksize=10, chunk_size_unit=1))
+
+    tc.assertEqual(dummy_object, success_code, -1)
+    tc.assertEqual(dummy_object, s3_lan.s3_client.in_flight_at_abort, 0)
+
+
+class RecordingClient:
+    '''
+    Records the requests; every part is accepted.
+    '''
+
+    def __init__(self):
+        self.requests = []
+
+    async def put_object(self, Body, **kwargs):
+        self.requests.append('put_object')
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    async def create_multipart_upload(self, **kwargs):
+        self.requests.append('create_multipart_upload')
+        return {'UploadId': 'upload-1'}
+
+    async def upload_part(self, Body, **kwargs):
+        self.requests.append('upload_part')
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    async def complete_multipart_upload(self, MultipartUpload, **kwargs):
+        self.requests.append('complete_multipart_upload')
+        return {'ETag': '"unverified"'}
+
+
+def test_large_single_upload_goes_multipart(tmp_path):
+    file_name = os.path.join(tmp_path, 'sales.csv')
+    with open(file_name, 'wb') as f:
+        f.write(os.urandom(40))
+
+    s3_lan = AsyncS3Landing(profile=None)
+    s3_lan.s3_client = RecordingClient()
+
+    # never read into memory as a whole
+    success_code, _ = asyncio.run(s3_lan.upload_file_to_bucket(file_name, BUCKET_NAME, 'sales.csv'
+                                                               , multipart_threshold=10, threshold_unit=1))
+
+    tc.assertNotEqual(dummy_object, success_code, -1)
+    tc.assertNotIn(dummy_object, 'put_object', s3_lan.s3_client.requests)
+    tc.assertIn(dummy_object, 'upload_part', s3_lan.s3_client.requests)
+
+
+def test_too_many_parts_never_creates_the_upload(tmp_path, monkeypatch):
+    from src.utils.aws_utils import async_landing
+
+    file_name = os.path.join(tmp_path, 'sales.csv')
+    with open(file_name, 'wb') as f:
+        f.write(os.urandom(40))
+    monkeypatch.setattr(async_landing, 'MAX_PARTS', 3)
+
+    s3_lan = AsyncS3Landing(profile=None)
+    s3_lan.s3_client = RecordingClient()
+
+    success_code = asyncio.run(s3_lan.upload_file_to_bucket_multipart(BUCKET_NAME, file_name, 'sales.csv'
+                                    , multipart_threshold=10, threshold_unit=1
+                                    , multipart_chunksize=10, chunk_size_unit=1))
+
+    tc.assertEqual(dummy_object, success_code, -1)
+    tc.assertEqual(dummy_object, s3_lan.s3_client.requests, [])
@@ -1,10 +1,12 @@
 from unittest import TestCase as tc
+import hashlib
+import os
 import boto3
 from botocore.config import Config
 from botocore.exceptions import ClientError, WaiterError
 import pytest
 
-from src.utils.aws_utils.aws_utility import verify_multipart_uploaded_fl 
+from src.utils.aws_utils.aws_utility import verify_multipart_uploaded_fl, calculate_s3_etag
 
 
 def get_s3(region_name="us-east-1"):
@@ -53,3 +55,25 @@ def test_verify_multipart_file_fail_wrong_key():
     
     with pytest.raises(WaiterError):
         verify_multipart_uploaded_fl(s3_client, s3_resource, expected_eTag, bucket_name, key)
+
+
+def test_calculate_s3_etag(tmp_path):
+    chunk_size = 5 * 1024 ** 2
+    data = os.urandom(2 * chunk_size + 7)
+    file_name = os.path.join(tmp_path, 'multi_part_file.txt')
+    with open(file_name, 'wb') as f:
+        f.write(data)
+
+    digests = b''.join(hashlib.md5(data[i:i + chunk_size]).digest() for i in range(0, len(data), chunk_size))
+
+    tc().assertEqual(calculate_s3_etag(file_name, chunk_size, max_workers=2)
+                     , f'{hashlib.md5(digests).hexdigest()}-3')
+    # a single part is the plain md5
+    tc().assertEqual(calculate_s3_etag(file_name, 3 * chunk_size), hashlib.md5(data).hexdigest())
+
+
+def test_calculate_s3_etag_empty_file(tmp_path):
+    file_name = os.path.join(tmp_path, 'empty.txt')
+    open(file_name, 'wb').close()
+
+    tc().assertEqual(calculate_s3_etag(file_name), hashlib.md5().hexdigest())
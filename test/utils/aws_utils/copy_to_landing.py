@@ -1,5 +1,9 @@
+import os
 import pytest
-from src.utils.aws_utils.copy_to_landing import S3_landing
+from src.utils.aws_utils.copy_to_landing import S3_landing, get_directory_files
+from src.utils.aws_utils.copy_to_landing import get_etag_part_size, PART_SIZE_METADATA
+from src.utils.aws_utils.aws_utility import calculate_s3_etag
+from src.config.definitions import MB
 
 # config = Config(
 #         retries = {
@@ -21,3 +25,58 @@ def test_upload_file_to_bucket_multipart_ok():
     assert (s3_lan.upload_file_to_bucket_multipart(bucket_name=BUCKET_NAME, file_name=FILE_NAME, key=KEY
         , multipart_threshold=5, multipart_chunksize=10) in [0,1])
     
+
+
+def test_get_directory_files(tmp_path):
+    directory = os.path.join(tmp_path, 'source_system_data', '20210701', 'jade')
+    os.makedirs(directory)
+    for file_name in ('sales.csv.gz', 'sales_format.xml', 'store.csv.tmp'):
+        open(os.path.join(directory, file_name), 'w').close()
+
+    files = get_directory_files(directory, key_prefix='landing/')
+
+    assert files == {os.path.join(directory, 'sales.csv.gz'): 'landing/20210701/jade/sales.csv.gz'
+                     , os.path.join(directory, 'sales_format.xml'): 'landing/20210701/jade/sales_format.xml'}
+
+
+def test_get_etag_part_size():
+    # single part
+    assert get_etag_part_size(10 * MB, 'ea7528d0be3572e7cfeefe1cb4a77ac8', 25 * MB) is None
+    # same number of parts as the local part size
+    assert get_etag_part_size(60 * MB, 'ea7528d0be3572e7cfeefe1cb4a77ac8-3', 25 * MB) == 25 * MB
+    # uploaded with 8 MB parts
+    assert get_etag_part_size(60 * MB, 'ea7528d0be3572e7cfeefe1cb4a77ac8-8', 25 * MB) == 8 * MB
+
+
+class MetadataClient:
+    '''
+    head_object returns :metadata.
+    '''
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.heads = 0
+
+    def head_object(self, Bucket, Key):
+        self.heads += 1
+        return {'Metadata': self.metadata}
+
+
+def test_is_unchanged_reads_the_recorded_part_size(tmp_path):
+    file_name = os.path.join(tmp_path, 'sales.csv')
+    with open(file_name, 'wb') as f:
+        f.write(os.urandom(20 * MB))
+    # 3 parts of 9 MB, ex: auto tuned; not the 7 MB guessed from the number of parts
+    remote_object = {'etag': calculate_s3_etag(file_name, 9 * MB), 'size': 20 * MB}
+
+    s3_lan.s3_client = MetadataClient({PART_SIZE_METADATA: str(9 * MB)})
+    assert s3_lan.is_unchanged(file_name, 20 * MB, remote_object, 25 * MB, BUCKET_NAME, KEY)
+
+    s3_lan.s3_client = MetadataClient({})
+    assert not s3_lan.is_unchanged(file_name, 20 * MB, remote_object, 25 * MB, BUCKET_NAME, KEY)
+
+    # same number of parts as the local part size: no HEAD request
+    s3_lan.s3_client = MetadataClient({})
+    remote_object = {'etag': calculate_s3_etag(file_name, 8 * MB), 'size': 20 * MB}
+    assert s3_lan.is_unchanged(file_name, 20 * MB, remote_object, 8 * MB, BUCKET_NAME, KEY)
+    assert s3_lan.s3_client.heads == 0
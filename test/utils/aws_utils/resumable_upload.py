@@ -0,0 +1,173 @@
+from unittest import TestCase as tc
+import hashlib
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.utils.aws_utils.resumable_upload import UploadJournal, upload_file_resumable, cleanup_stale_uploads
+from src.utils.aws_utils.upload_tuning import MIN_PART_SIZE
+
+
+dummy_object = tc()
+BUCKET_NAME = 'bucket'
+KEY = 'landing/20210701/jade/sales.csv'
+
+
+class NoSuchUpload(Exception):
+    response = {'Error': {'Code': 'NoSuchUpload'}}
+
+
+class FakePaginator:
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return self.pages(**kwargs)
+
+
+class FakeS3Client:
+    '''
+    Keeps multipart uploads in memory; :fail_parts fail once.
+    '''
+
+    def __init__(self, fail_parts=()):
+        self.uploads = {}  # upload id -> {'key':..., 'parts': {n: bytes}, 'initiated':...}
+        self.objects = {}
+        self.uploaded_parts = []
+        self.fail_parts = set(fail_parts)
+        self.lock = threading.Lock()
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = f'upload-{len(self.uploads) + 1}'
+        self.uploads[upload_id] = {'key': Key, 'parts': {}, 'initiated': datetime.now(timezone.utc)}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, ContentMD5):
+        with self.lock:
+            if PartNumber in self.fail_parts:
+                self.fail_parts.remove(PartNumber)
+                raise ConnectionError('connection reset')
+            self.uploads[UploadId]['parts'][PartNumber] = Body
+            self.uploaded_parts.append(PartNumber)
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def get_paginator(self, operation_name):
+        if operation_name == 'list_parts':
+            def pages(Bucket, Key, UploadId):
+                if UploadId not in self.uploads:
+                    raise NoSuchUpload()
+                yield {'Parts': [{'PartNumber': n, 'ETag': f'"{hashlib.md5(b).hexdigest()}"', 'Size': len(b)}
+                                 for n, b in sorted(self.uploads[UploadId]['parts'].items())]}
+        else:
+            def pages(Bucket, Prefix):
+                yield {'Uploads': [{'Key': u['key'], 'UploadId': upload_id, 'Initiated': u['initiated']}
+                                   for upload_id, u in self.uploads.items() if u['key'].startswith(Prefix)]}
+        return FakePaginator(pages)
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        numbers = [p['PartNumber'] for p in MultipartUpload['Parts']]
+        self.objects[Key] = b''.join(upload['parts'][n] for n in numbers)
+        digests = b''.join(hashlib.md5(upload['parts'][n]).digest() for n in numbers)
+        return {'ETag': f'"{hashlib.md5(digests).hexdigest()}-{len(numbers)}"'}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        if self.uploads.pop(UploadId, None) is None:
+            raise NoSuchUpload()
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    data = os.urandom(4 * MIN_PART_SIZE + 100)
+    file_name = os.path.join(tmp_path, 'sales.csv')
+    with open(file_name, 'wb') as f:
+        f.write(data)
+    return file_name, data
+
+
+def test_upload_resumed_after_failure(tmp_path, data_file):
+    file_name, data = data_file
+    client = FakeS3Client(fail_parts=[4])
+    journal = UploadJournal(os.path.join(tmp_path, 'upload_journal.db'))
+
+    # one part at a time; no part is started after the failed one
+    with pytest.raises(ConnectionError):
+        upload_file_resumable(client, BUCKET_NAME, file_name, KEY, MIN_PART_SIZE, max_concurrency=1, journal=journal)
+    tc.assertEqual(dummy_object, sorted(journal.get_parts(BUCKET_NAME, KEY)), [1, 2, 3])
+
+    # a new process: only the missing parts are uploaded
+    client.uploaded_parts = []
+    journal = UploadJournal(os.path.join(tmp_path, 'upload_journal.db'))
+    res = upload_file_resumable(client, BUCKET_NAME, file_name, KEY, MIN_PART_SIZE, journal=journal)
+
+    tc.assertEqual(dummy_object, sorted(client.uploaded_parts), [4, 5])
+    tc.assertEqual(dummy_object, client.objects[KEY], data)
+    tc.assertTrue(dummy_object, res['ETag'].strip('"').endswith('-5'))
+    tc.assertIsNone(dummy_object, journal.get(BUCKET_NAME, KEY))
+
+
+def test_no_part_started_after_a_failure(tmp_path, data_file):
+    file_name, _ = data_file
+    client = FakeS3Client(fail_parts=[1])
+    journal = UploadJournal(os.path.join(tmp_path, 'upload_journal.db'))
+
+    with pytest.raises(ConnectionError):
+        upload_file_resumable(client, BUCKET_NAME, file_name, KEY, MIN_PART_SIZE, max_concurrency=1, journal=journal)
+
+    # parts 2 to 5 are left for the next run
+    tc.assertEqual(dummy_object, client.uploaded_parts, [])
+
+
+def test_changed_file_uploaded_from_start(tmp_path, data_file):
+    file_name, _ = data_file
+    client = FakeS3Client(fail_parts=[2])
+    journal = UploadJournal(os.path.join(tmp_path, 'upload_journal.db'))
+
+    with pytest.raises(ConnectionError):
+        upload_file_resumable(client, BUCKET_NAME, file_name, KEY, MIN_PART_SIZE, max_concurrency=1, journal=journal)
+
+    data = os.urandom(2 * MIN_PART_SIZE)
+    with open(file_name, 'wb') as f:
+        f.write(data)
+    client.uploaded_parts = []
+    upload_file_resumable(client, BUCKET_NAME, file_name, KEY, MIN_PART_SIZE, journal=journal)
+
+    tc.assertEqual(dummy_object, sorted(client.uploaded_parts), [1, 2])
+    tc.assertEqual(dummy_object, client.objects[KEY], data)
+    # the previous upload was aborted
+    tc.assertEqual(dummy_object, client.uploads, {})
+
+
+def test_vanished_upload_restarted(tmp_path, data_file):
+    file_name, data = data_file
+    client = FakeS3Client(fail_parts=[1])
+    journal = UploadJournal(os.path.join(tmp_path, 'upload_journal.db'))
+
+    with pytest.raises(ConnectionError):
+        upload_file_resumable(client, BUCKET_NAME, file_name, KEY, MIN_PART_SIZE, journal=journal)
+    client.uploads.clear()  # expired
+
+    upload_file_resumable(client, BUCKET_NAME, file_name, KEY, MIN_PART_SIZE, journal=journal)
+
+    tc.assertEqual(dummy_object, client.objects[KEY], data)
+
+
+def test_cleanup_stale_uploads(tmp_path, data_file):
+    file_name, _ = data_file
+    client = FakeS3Client(fail_parts=[1])
+    journal = UploadJournal(os.path.join(tmp_path, 'upload_journal.db'))
+
+    with pytest.raises(ConnectionError):
+        upload_file_resumable(client, BUCKET_NAME, file_name, KEY, MIN_PART_SIZE, journal=journal)
+    stale_id = next(iter(client.uploads))
+    client.uploads[stale_id]['initiated'] -= timedelta(days=8)
+    recent_id = client.create_multipart_upload(Bucket=BUCKET_NAME, Key='landing/other.csv')['UploadId']
+
+    aborted = cleanup_stale_uploads(client, BUCKET_NAME, 'landing/', journal=journal)
+
+    tc.assertEqual(dummy_object, aborted, [(KEY, stale_id)])
+    tc.assertEqual(dummy_object, list(client.uploads), [recent_id])
+    tc.assertIsNone(dummy_object, journal.get(BUCKET_NAME, KEY))
@@ -0,0 +1,88 @@
+from unittest import TestCase as tc
+import gzip
+import hashlib
+import threading
+
+import pytest
+
+from src.config.definitions import MB
+from src.utils.aws_utils.streaming_upload import MultipartUploadStream, UploadVerificationError, MIN_PART_SIZE
+
+
+dummy_object = tc()
+
+
+class FakeS3Client:
+    '''
+    Keeps the parts in memory and returns the multipart ETag as S3 does.
+    '''
+
+    def __init__(self, corrupt_etag=False):
+        self.parts = {}
+        self.objects = {}
+        self.aborted = []
+        self.corrupt_etag = corrupt_etag
+        self.lock = threading.Lock()
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        return {'UploadId': 'upload-1'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, ContentMD5):
+        with self.lock:
+            self.parts[PartNumber] = Body
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        numbers = [p['PartNumber'] for p in MultipartUpload['Parts']]
+        self.objects[Key] = b''.join(self.parts[n] for n in numbers)
+        digests = b''.join(hashlib.md5(self.parts[n]).digest() for n in numbers)
+        etag = f'{hashlib.md5(digests).hexdigest()}-{len(numbers)}'
+        return {'ETag': f'"{"0" * 32 + "-1" if self.corrupt_etag else etag}"'}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(Key)
+
+
+def test_parts_are_uploaded_while_written():
+    client = FakeS3Client()
+    data = bytes(range(256)) * (MIN_PART_SIZE // 128 + 10)  # a bit more than two parts
+
+    with MultipartUploadStream(client, 'bucket', 'jade/sales.csv', part_size=MIN_PART_SIZE) as stream:
+        for i in range(0, len(data), MB):
+            stream.write(data[i:i + MB])
+
+    tc.assertEqual(dummy_object, client.objects['jade/sales.csv'], data)
+    tc.assertEqual(dummy_object, len(client.parts), 3)
+    tc.assertTrue(dummy_object, stream.etag.endswith('-3'))
+    tc.assertEqual(dummy_object, stream.md5, hashlib.md5(data).hexdigest())
+    tc.assertEqual(dummy_object, stream.size_bytes, len(data))
+
+
+def test_wrapper_closing_the_stream_does_not_complete():
+    client = FakeS3Client()
+
+    with pytest.raises(OSError):
+        with MultipartUploadStream(client, 'bucket', 'jade/sales.csv.gz') as stream:
+            with gzip.open(stream, 'wb') as f:
+                f.write(b'1,a\r\n')
+            stream.close()
+            raise OSError('connection reset')
+
+    tc.assertEqual(dummy_object, client.objects, {})
+    tc.assertEqual(dummy_object, client.aborted, ['jade/sales.csv.gz'])
+
+
+def test_empty_object_and_etag_mismatch():
+    client = FakeS3Client()
+    with MultipartUploadStream(client, 'bucket', 'empty.csv') as stream:
+        ''
+    tc.assertEqual(dummy_object, client.objects['empty.csv'], b'')
+
+    with pytest.raises(UploadVerificationError):
+        with MultipartUploadStream(FakeS3Client(corrupt_etag=True), 'bucket', 'sales.csv') as stream:
+            stream.write(b'1,a\r\n')
+
+
+def test_part_size_below_s3_minimum():
+    with pytest.raises(ValueError):
+        MultipartUploadStream(FakeS3Client(), 'bucket', 'sales.csv', part_size=MB)
@@ -0,0 +1,103 @@
+from unittest import TestCase as tc
+import hashlib
+import os
+import threading
+import time
+
+import pytest
+
+from src.config.definitions import MB, GB
+from src.utils.common_utils.checksum_utility import get_file_checksums
+from src.utils.aws_utils.upload_tuning import get_part_size, get_upload_part_size, AdaptiveConcurrency
+from src.utils.aws_utils.upload_tuning import MIN_PART_SIZE, MAX_PARTS, MAX_PART_SIZE
+
+
+dummy_object = tc()
+
+
+def test_part_size_by_file_size():
+    tc.assertEqual(dummy_object, get_part_size(30 * MB), MIN_PART_SIZE)
+    tc.assertEqual(dummy_object, get_part_size(1 * GB), 8 * MB)
+    tc.assertEqual(dummy_object, get_part_size(300 * GB), 308 * MB)
+
+    for file_size in (1, 6 * MB, 50 * MB + 3, 80 * GB + 1, 4000 * GB, 48000 * GB):
+        part_size = get_part_size(file_size)
+        tc.assertEqual(dummy_object, part_size % MB, 0)
+        tc.assertTrue(dummy_object, MIN_PART_SIZE <= part_size <= MAX_PART_SIZE)
+        tc.assertLessEqual(dummy_object, -(-file_size // part_size), MAX_PARTS)
+
+
+def test_upload_part_size_below_threshold_is_single_put(tmp_path):
+    # 5 - 25 MB: tuned part size of 5 MB, but sent with a single PUT below the 25 MB threshold
+    file_name = os.path.join(tmp_path, 'sales.csv')
+    with open(file_name, 'wb') as f:
+        f.write(os.urandom(20 * MB))
+
+    tc.assertEqual(dummy_object, get_part_size(20 * MB), MIN_PART_SIZE)
+    tc.assertIsNone(dummy_object, get_upload_part_size(20 * MB, 25 * MB, 25 * MB, auto_tune=True))
+    tc.assertIsNone(dummy_object, get_upload_part_size(20 * MB, 8 * MB, 25 * MB))
+
+    # as the checksum stage of extract_to_landing: plain MD5, as returned by the PUT
+    part_size = get_upload_part_size(os.path.getsize(file_name), 25 * MB, 25 * MB, auto_tune=True)
+    checksums = get_file_checksums(file_name, etag_chunk_sizes=(part_size,) if part_size else ())
+    with open(file_name, 'rb') as f:
+        tc.assertEqual(dummy_object, checksums.md5_hex, hashlib.md5(f.read()).hexdigest())
+    tc.assertNotIn(dummy_object, '-', checksums.md5_hex)
+
+
+def test_upload_part_size_above_threshold():
+    tc.assertEqual(dummy_object, get_upload_part_size(30 * MB, 25 * MB, 25 * MB), 25 * MB)
+    tc.assertEqual(dummy_object, get_upload_part_size(30 * MB, 25 * MB, 25 * MB, auto_tune=True), MIN_PART_SIZE)
+    tc.assertEqual(dummy_object, get_upload_part_size(1 * GB, 25 * MB, 25 * MB, auto_tune=True), 8 * MB)
+
+
+def test_fixed_concurrency_limits_in_flight():
+    concurrency = AdaptiveConcurrency(initial=2)
+    in_flight, peak, lock = [0], [0], threading.Lock()
+
+    def upload_part():
+        concurrency.acquire()
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        concurrency.release(MB)
+
+    threads = [threading.Thread(target=upload_part) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    tc.assertEqual(dummy_object, peak[0], 2)
+    tc.assertEqual(dummy_object, concurrency.limit, 2)
+    tc.assertEqual(dummy_object, concurrency.history, [])
+
+
+def test_adaptive_concurrency_follows_throughput(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(time, 'perf_counter', lambda: clock[0])
+    concurrency = AdaptiveConcurrency(initial=4, maximum=8)
+
+    def window(parts, seconds):
+        for _ in range(parts):
+            concurrency.acquire()
+        clock[0] += seconds
+        for _ in range(parts):
+            concurrency.release(MB)
+
+    window(4, 1.0)  # first window: grows
+    tc.assertEqual(dummy_object, concurrency.limit, 5)
+    window(5, 1.0)  # 25% better: grows
+    tc.assertEqual(dummy_object, concurrency.limit, 6)
+    window(6, 1.2)  # same throughput: kept
+    tc.assertEqual(dummy_object, concurrency.limit, 6)
+    window(6, 3.0)  # worse: shrinks
+    tc.assertEqual(dummy_object, concurrency.limit, 5)
+
+
+def test_initial_concurrency_must_be_positive():
+    with pytest.raises(ValueError):
+        AdaptiveConcurrency(initial=0)
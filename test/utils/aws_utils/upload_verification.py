@@ -0,0 +1,84 @@
+from unittest import TestCase as tc
+
+from src.utils.aws_utils import upload_verification
+from src.utils.aws_utils.upload_verification import get_key_prefixes, verify_uploaded_objects
+from src.utils.aws_utils.upload_verification import VERIFIED, ETAG_MISMATCH, MISSING
+
+
+dummy_object = tc()
+
+
+class FakePaginator:
+
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, Bucket, Prefix):
+        self.client.listings.append(Prefix)
+        keys = sorted(k for k in self.client.objects if k.startswith(Prefix))
+        # 2 objects per page
+        for i in range(0, len(keys), 2):
+            yield {'Contents': [{'Key': k, 'ETag': f'"{self.client.objects[k]}"', 'Size': 1} for k in keys[i:i + 2]]}
+
+
+class FakeS3Client:
+    '''
+    Lists its objects; :late_objects appear after the first listing.
+    '''
+
+    def __init__(self, objects, late_objects=None):
+        self.objects = dict(objects)
+        self.late_objects = late_objects or {}
+        self.listings = []
+
+    def get_paginator(self, operation_name):
+        if self.listings:
+            self.objects.update(self.late_objects)
+        return FakePaginator(self)
+
+
+def test_get_key_prefixes():
+    keys = ['landing/20210701/jade/sales.csv.gz', 'landing/20210701/jade/store.csv.gz'
+            , 'landing/20210701/schema_catalog.json', 'other/a.csv', 'top.csv']
+
+    # root level keys are listed on their own, never the whole bucket
+    tc.assertEqual(dummy_object, get_key_prefixes(keys), ['landing/20210701/', 'other/', 'top.csv'])
+    tc.assertEqual(dummy_object, get_key_prefixes(keys[:4]), ['landing/20210701/', 'other/'])
+    tc.assertEqual(dummy_object, get_key_prefixes(['top.csv', 'top.csv/a.csv']), ['top.csv'])
+
+
+def test_root_level_key_does_not_list_the_bucket():
+    objects = {'top.csv': f'{1:032x}', 'landing/20210701/jade/t.csv': f'{2:032x}', 'unrelated/big.csv': f'{3:032x}'}
+    client = FakeS3Client(objects)
+
+    results = verify_uploaded_objects(client, 'bucket', {'top.csv': f'{1:032x}'
+                                                         , 'landing/20210701/jade/t.csv': f'{2:032x}'}, max_polls=0)
+
+    tc.assertEqual(dummy_object, results, {'top.csv': VERIFIED, 'landing/20210701/jade/t.csv': VERIFIED})
+    tc.assertNotIn(dummy_object, '', client.listings)
+
+
+def test_batch_verified_with_one_listing_per_prefix():
+    objects = {f'landing/20210701/jade/t{i}.csv': f'{i:032x}' for i in range(5)}
+    client = FakeS3Client(objects)
+    expected = dict(objects)
+    expected['landing/20210701/jade/t3.csv'] = f'"{"f" * 32}-2"'
+
+    results = verify_uploaded_objects(client, 'bucket', expected, poll_delay=0, max_polls=0)
+
+    tc.assertEqual(dummy_object, client.listings, ['landing/20210701/jade/'])
+    tc.assertEqual(dummy_object, results['landing/20210701/jade/t0.csv'], VERIFIED)
+    tc.assertEqual(dummy_object, results['landing/20210701/jade/t3.csv'], ETAG_MISMATCH)
+    tc.assertEqual(dummy_object, len(results), 5)
+
+
+def test_missing_keys_are_polled(monkeypatch):
+    monkeypatch.setattr(upload_verification.time, 'sleep', lambda seconds: None)
+    client = FakeS3Client({'jade/a.csv': 'a' * 32}, late_objects={'jade/b.csv': 'b' * 32})
+
+    results = verify_uploaded_objects(client, 'bucket', {'jade/a.csv': 'a' * 32, 'jade/b.csv': 'b' * 32
+                                                         , 'jade/c.csv': 'c' * 32}, max_polls=2)
+
+    tc.assertEqual(dummy_object, results, {'jade/a.csv': VERIFIED, 'jade/b.csv': VERIFIED, 'jade/c.csv': MISSING})
+    # first listing, then two polls for the keys not found
+    tc.assertEqual(dummy_object, len(client.listings), 3)
@@ -0,0 +1,71 @@
+from unittest import TestCase as tc
+import base64
+import hashlib
+import os
+
+import pytest
+
+from src.utils.common_utils import checksum_utility
+
+
+dummy_object = tc()
+
+
+def _expected_etag(data, chunk_size):
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    if len(chunks) <= 1:
+        return hashlib.md5(data).hexdigest()
+    digests = b''.join(hashlib.md5(c).digest() for c in chunks)
+    return f'{hashlib.md5(digests).hexdigest()}-{len(chunks)}'
+
+
+def test_single_pass_checksums(tmp_path):
+    file_name = os.path.join(tmp_path, 'sales.csv')
+    data = os.urandom(1000003)
+    with open(file_name, 'wb') as f:
+        f.write(data)
+
+    # buffer smaller than, and not aligned with, the chunk sizes
+    checksums = checksum_utility.get_file_checksums(file_name, etag_chunk_sizes=(100000, 300007, 2000000)
+                                                    , sha256=True, buffer_size=65536)
+
+    tc.assertEqual(dummy_object, checksums.size_bytes, len(data))
+    tc.assertEqual(dummy_object, checksums.md5_hex, hashlib.md5(data).hexdigest())
+    tc.assertEqual(dummy_object, checksums.md5_base64, base64.b64encode(hashlib.md5(data).digest()).decode('utf-8'))
+    tc.assertEqual(dummy_object, checksums.sha256, hashlib.sha256(data).hexdigest())
+    for chunk_size in (100000, 300007, 2000000):
+        tc.assertEqual(dummy_object, checksums.get_etag(chunk_size), _expected_etag(data, chunk_size))
+
+    # same as the existing md5 helper
+    tc.assertEqual(dummy_object, checksums.md5_base64
+                   , checksum_utility.get_md5_checksum(file_name=file_name, is_file=True, base64_encode=True))
+
+
+def test_exact_multiple_of_chunk_size(tmp_path):
+    file_name = os.path.join(tmp_path, 'sales.csv')
+    data = b'x' * 200
+    with open(file_name, 'wb') as f:
+        f.write(data)
+
+    checksums = checksum_utility.get_file_checksums(file_name, etag_chunk_sizes=(100,), buffer_size=64)
+
+    tc.assertEqual(dummy_object, checksums.get_etag(100), _expected_etag(data, 100))
+    tc.assertTrue(dummy_object, checksums.get_etag(100).endswith('-2'))
+
+
+def test_empty_file(tmp_path):
+    file_name = os.path.join(tmp_path, 'empty.csv')
+    open(file_name, 'wb').close()
+
+    checksums = checksum_utility.get_file_checksums(file_name)
+
+    tc.assertEqual(dummy_object, checksums.get_etag(), hashlib.md5().hexdigest())
+    tc.assertIsNone(dummy_object, checksums.sha256)
+
+
+def test_crc32c_requires_package(tmp_path):
+    if checksum_utility.crc32c_module is not None:
+        pytest.skip('crc32c is installed')
+
+    with pytest.raises(ImportError):
+        checksum_utility.get_file_checksums(os.path.join(tmp_path, 'missing.csv'), crc32c=True)
@@ -0,0 +1,247 @@
+from unittest import TestCase as tc
+import gzip
+import os
+import subprocess
+import sys
+
+import pytest
+
+from src.utils import compression_utility as cu
+
+
+dummy_object = tc()
+
+
+def test_compressed_file_name():
+    tc.assertEqual(dummy_object, cu.get_compressed_file_name('sales.csv', 'gzip'), 'sales.csv.gz')
+    tc.assertEqual(dummy_object, cu.get_compressed_file_name('sales.csv', 'zstd'), 'sales.csv.zst')
+    tc.assertEqual(dummy_object, cu.get_compressed_file_name('sales.csv', None), 'sales.csv')
+
+    with pytest.raises(ValueError):
+        cu.get_compressed_file_name('sales.csv', 'rar')
+
+
+def test_open_compressed_text(tmp_path):
+    file_name = os.path.join(tmp_path, 'sales.csv.gz')
+
+    with cu.open_compressed(file_name, 'wt', 'gzip', 1) as f:
+        f.write('1,abc\r\n2,def\r\n')
+
+    with gzip.open(file_name, 'rb') as f:
+        tc.assertEqual(dummy_object, f.read(), b'1,abc\r\n2,def\r\n')
+
+
+def test_compressed_output_from_external_process(tmp_path):
+    file_name = os.path.join(tmp_path, 'sales.csv')
+    data = b'0123456789,abcdef\r\n' * 100000
+
+    with cu.compressed_output(file_name, 'gzip') as process_output:
+        subprocess.run([sys.executable, '-c'
+                        , f'open({process_output!r}, "wb").write(b"0123456789,abcdef\\r\\n" * 100000)'], check=True)
+
+    tc.assertFalse(dummy_object, os.path.exists(file_name))
+    tc.assertEqual(dummy_object, os.listdir(tmp_path), ['sales.csv.gz'])
+    with gzip.open(file_name + '.gz', 'rb') as f:
+        tc.assertEqual(dummy_object, f.read(), data)
+
+
+def test_compressed_output_process_never_writes(tmp_path):
+    '''
+    A process failing before opening its output must not leave the reader blocked.
+    '''
+    file_name = os.path.join(tmp_path, 'sales.csv')
+
+    with cu.compressed_output(file_name, 'gzip'):
+        ''
+
+    tc.assertEqual(dummy_object, os.listdir(tmp_path), ['sales.csv.gz'])
+
+
+def test_compressed_output_removed_when_process_fails(tmp_path):
+    '''
+    A failed process must not leave an empty or truncated compressed file behind.
+    '''
+    file_name = os.path.join(tmp_path, 'sales.csv')
+
+    # fails before opening its output, and after writing part of it
+    for script in ('import sys; sys.exit(1)'
+                   , 'import sys; open(sys.argv[1], "wb").write(b"1,a\\n" * 1000); sys.exit(1)'):
+        with pytest.raises(subprocess.CalledProcessError):
+            with cu.compressed_output(file_name, 'gzip') as process_output:
+                subprocess.run([sys.executable, '-c', script, process_output]).check_returncode()
+
+        tc.assertEqual(dummy_object, os.listdir(tmp_path), [])
+
+
+def test_no_compression_yields_file_name(tmp_path):
+    file_name = os.path.join(tmp_path, 'sales.csv')
+
+    with cu.compressed_output(file_name) as process_output:
+        tc.assertEqual(dummy_object, process_output, file_name)
+
+
+def test_compressed_output_into_stream(tmp_path):
+    import io
+    from contextlib import contextmanager
+
+    streams = {}
+
+    class KeptBytesIO(io.BytesIO):
+        def close(self):
+            ''
+
+    @contextmanager
+    def open_stream(file_name):
+        streams[file_name] = KeptBytesIO()
+        yield streams[file_name]
+
+    file_name = os.path.join(tmp_path, 'sales.csv')
+    with cu.compressed_output(file_name, 'gzip', output_stream_factory=open_stream) as process_output:
+        subprocess.run([sys.executable, '-c'
+                        , f'open({process_output!r}, "wb").write(b"1,a\\r\\n" * 1000)'], check=True)
+
+    tc.assertEqual(dummy_object, os.listdir(tmp_path), [])
+    tc.assertEqual(dummy_object, gzip.decompress(streams[file_name + '.gz'].getvalue()), b'1,a\r\n' * 1000)
+
+
+def test_compress_files_parallel_multi_member_gzip(tmp_path):
+    small_file = os.path.join(tmp_path, 'store.csv')
+    large_file = os.path.join(tmp_path, 'sales.csv')
+    empty_file = os.path.join(tmp_path, 'empty.csv')
+    small_data = b'1,abc\r\n' * 100
+    large_data = os.urandom(1000) * 300 + b'tail'
+    for file_name, data in ((small_file, small_data), (large_file, large_data), (empty_file, b'')):
+        with open(file_name, 'wb') as f:
+            f.write(data)
+
+    output_file_names = cu.compress_files_parallel([small_file, large_file, empty_file], 'gzip', 1
+                                                   , block_size=64 * 1024, max_workers=2, remove_input=True)
+
+    tc.assertEqual(dummy_object, output_file_names[large_file], large_file + '.gz')
+    with gzip.open(large_file + '.gz', 'rb') as f:
+        tc.assertEqual(dummy_object, f.read(), large_data)
+    with gzip.open(small_file + '.gz', 'rb') as f:
+        tc.assertEqual(dummy_object, f.read(), small_data)
+    with gzip.open(empty_file + '.gz', 'rb') as f:
+        tc.assertEqual(dummy_object, f.read(), b'')
+    tc.assertFalse(dummy_object, os.path.exists(large_file))
+
+    # one gzip member per block
+    with open(large_file + '.gz', 'rb') as f:
+        tc.assertEqual(dummy_object, f.read().count(b'\x1f\x8b\x08'), 5)
+
+
+def test_compress_files_parallel_failure_closes_and_removes_outputs(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    opened = []
+
+    def tracking_open(*args, **kwargs):
+        opened.append(open(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(cu, 'open', tracking_open, raising=False)
+    file_names = []
+    for i in range(4):
+        file_names.append(os.path.join(tmp_path, f'table_{i}.csv'))
+        with open(file_names[-1], 'wb') as f:
+            f.write(os.urandom(4096))
+
+    # one block per file; every block fails to compress: invalid level
+    with pytest.raises(Exception):
+        cu.compress_files_parallel(file_names, 'gzip', 42, block_size=8192, max_workers=1
+                                   , executor=ThreadPoolExecutor(max_workers=1))
+
+    tc.assertTrue(dummy_object, opened)
+    tc.assertTrue(dummy_object, all(f.closed for f in opened))
+    tc.assertEqual(dummy_object, sorted(os.listdir(tmp_path)), [os.path.basename(f) for f in file_names])
+
+
+@pytest.mark.parametrize('compression, module_name', [('zstd', 'zstandard'), ('lz4', 'lz4')])
+def test_compress_file_parallel_frames(tmp_path, compression, module_name):
+    pytest.importorskip(module_name)
+    file_name = os.path.join(tmp_path, 'sales.csv')
+    data = b'1,abc\r\n' * 50000
+    with open(file_name, 'wb') as f:
+        f.write(data)
+
+    output_file_name = cu.compress_file_parallel(file_name, compression, block_size=64 * 1024, max_workers=2)
+
+    if compression == 'zstd':
+        import zstandard
+        with open(output_file_name, 'rb') as f:
+            decompressed = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True).read()
+    else:
+        import lz4.frame
+        with lz4.frame.open(output_file_name, 'rb') as f:
+            decompressed = f.read()
+    tc.assertEqual(dummy_object, decompressed, data)
+
+
+def test_dump_zipped_file_deflated(tmp_path):
+    import zipfile
+
+    file_names = []
+    for i in range(3):
+        file_names.append(os.path.join(tmp_path, f'tbl_{i}.csv'))
+        with open(file_names[-1], 'wb') as f:
+            f.write(f'{i},abc\r\n'.encode() * 10000)
+
+    zip_file_name = os.path.join(tmp_path, 'jade.zip')
+    cu.dump_zipped_file(file_names, zip_file_name, is_directory=True, max_workers=2)
+
+    with zipfile.ZipFile(zip_file_name) as z:
+        tc.assertIsNone(dummy_object, z.testzip())
+        infos = z.infolist()
+        tc.assertEqual(dummy_object, [i.filename for i in infos], [zipfile.ZipInfo.from_file(f).filename for f in file_names])
+        for info, file_name in zip(infos, file_names):
+            tc.assertEqual(dummy_object, info.compress_type, zipfile.ZIP_DEFLATED)
+            tc.assertLess(dummy_object, info.compress_size, info.file_size)
+            with open(file_name, 'rb') as f:
+                tc.assertEqual(dummy_object, z.read(info), f.read())
+    tc.assertEqual(dummy_object, [f for f in os.listdir(tmp_path) if f.endswith('.tmp')], [])
+
+
+def test_write_zip64_end_records_read_back(tmp_path, monkeypatch):
+    import zipfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    file_names = []
+    for i in range(3):
+        file_names.append(os.path.join(tmp_path, f'tbl_{i}.csv'))
+        with open(file_names[-1], 'wb') as f:
+            f.write(f'{i},abc\r\n'.encode() * 100)
+    # as with 65535 entries or more
+    monkeypatch.setattr(cu, 'ZIP64_COUNT_LIMIT', 2)
+
+    zip_file_name = os.path.join(tmp_path, 'jade.zip')
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        cu.write_zip(file_names, zip_file_name, executor=executor)
+
+    with open(zip_file_name, 'rb') as f:
+        tc.assertIn(dummy_object, b'PK\x06\x06', f.read())
+    with zipfile.ZipFile(zip_file_name) as z:
+        tc.assertIsNone(dummy_object, z.testzip())
+        tc.assertEqual(dummy_object, len(z.infolist()), 3)
+        for info, file_name in zip(z.infolist(), file_names):
+            with open(file_name, 'rb') as f:
+                tc.assertEqual(dummy_object, z.read(info), f.read())
+
+
+def test_zip64_entry_header():
+    import struct
+    import zipfile
+
+    file_size, compressed_size, header_offset = 5 * 2 ** 30, 2 ** 32, 6 * 2 ** 30
+    header = cu._get_zip_entry_header(zipfile.ZipInfo('sales.csv'), 0, file_size, compressed_size, header_offset)
+
+    fields = struct.unpack('<IHHHHHHIIIHHHHHII', header[:46])
+    # compressed size, size and offset are in the zip64 extra field
+    tc.assertEqual(dummy_object, (fields[8], fields[9], fields[16]), (0xFFFFFFFF,) * 3)
+    tc.assertEqual(dummy_object, header[46:46 + fields[10]], b'sales.csv')
+    tc.assertEqual(dummy_object, struct.unpack('<HH3Q', header[46 + fields[10]:])
+                   , (1, 24, file_size, compressed_size, header_offset))
+
+    # local file header: sizes only
+    header = cu._get_zip_entry_header(zipfile.ZipInfo('sales.csv'), 0, file_size, compressed_size)
+    tc.assertEqual(dummy_object, struct.unpack('<HH2Q', header[-20:]), (1, 16, file_size, compressed_size))
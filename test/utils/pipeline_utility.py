@@ -0,0 +1,69 @@
+from unittest import TestCase as tc
+import threading
+import time
+
+import pytest
+
+from src.utils.pipeline_utility import PipelineStage, run_pipeline
+
+
+dummy_object = tc()
+
+
+def test_items_pass_all_stages_in_order():
+    calls = []
+    lock = threading.Lock()
+
+    def stage(name):
+        def func(item):
+            with lock:
+                calls.append((name, item))
+        return func
+
+    results = run_pipeline(range(5), [PipelineStage('a', stage('a'), max_workers=2)
+                                      , PipelineStage('b', stage('b'), max_workers=3)])
+
+    tc.assertEqual(dummy_object, [r.item for r in results], [0, 1, 2, 3, 4])
+    tc.assertTrue(dummy_object, all(r.failed_stage is None for r in results))
+    for i in range(5):
+        # every item leaves stage a before entering stage b
+        tc.assertLess(dummy_object, calls.index(('a', i)), calls.index(('b', i)))
+
+
+def test_failed_item_skips_remaining_stages():
+    uploaded = []
+
+    def extract(item):
+        if item == 'bad':
+            raise OSError('connection reset')
+
+    results = run_pipeline(['good', 'bad'], [PipelineStage('extract', extract)
+                                             , PipelineStage('upload', uploaded.append)])
+
+    tc.assertEqual(dummy_object, uploaded, ['good'])
+    tc.assertEqual(dummy_object, (results[1].failed_stage, results[1].error), ('extract', 'OSError: connection reset'))
+    tc.assertNotIn(dummy_object, 'upload', results[1].stage_seconds)
+
+
+def test_stages_overlap():
+    '''
+    The first item is uploaded while later items are still being extracted.
+    '''
+    events = []
+
+    def extract(item):
+        time.sleep(0.05)
+        events.append(('extract', item))
+
+    results = run_pipeline(range(3), [PipelineStage('extract', extract)
+                                      , PipelineStage('upload', lambda item: events.append(('upload', item)))])
+
+    tc.assertEqual(dummy_object, len(results), 3)
+    tc.assertLess(dummy_object, events.index(('upload', 0)), events.index(('extract', 2)))
+
+
+def test_invalid_stage():
+    with pytest.raises(ValueError):
+        run_pipeline([1], [PipelineStage('a', print, max_workers=0)])
+    with pytest.raises(ValueError):
+        run_pipeline([1], [])